@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
 from website import create_app, db
+from website.schema import add_missing_columns
 from dotenv import load_dotenv
 import os
 
@@ -45,6 +46,7 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        add_missing_columns()
         print("✅ Database tables created/verified")
         print("✅ Server starting on http://localhost:5000")
     app.run(debug=True, port=5000, host='0.0.0.0')
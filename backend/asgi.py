@@ -0,0 +1,6 @@
+from app import app as flask_app
+from website.asgi import create_asgi_app
+
+# ASGI entry point - async generate/train/health handlers, everything else served by Flask
+# Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+app = create_asgi_app(flask_app)
@@ -0,0 +1,269 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests and benchmarks.
+
+Answers POST /v1/chat/completions with a fixed plant-info JSON object (which
+also carries /api/ai-recognition's analysis fields) after a configurable
+delay, with configurable token usage, 500 and 429 rates, and streaming
+(stream=true, honoring stream_options.include_usage). Models listed in
+--weak-models answer with low confidence, to exercise tier escalation.
+
+    python bench/fake_openai.py --port 8765 --latency 0.8 --jitter 0.2 --rate-limit-rate 0.05
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and any
+OPENAI_API_KEY starting with sk- (requests without one get a 401). GET /stats
+returns request counters.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+PLANT_INFO = {
+    "plant_name": "Kangkong",
+    "scientific_name": "Ipomoea aquatica",
+    "common_names": ["Water Spinach", "Ong Choy"],
+    "plant_type": "vegetable",
+    "description": "A semi-aquatic tropical plant grown for its tender shoots and leaves. "
+                   "It has hollow stems and arrow-shaped leaves.",
+    "care_instructions": "Water daily and keep the soil moist. Full sun, rich loamy soil, "
+                         "fertilize every two weeks, harvest shoots regularly, 25-35°C.",
+    # /api/ai-recognition's health and care analysis
+    "health_status": "Healthy: leaves are uniformly green with no spots or wilting.",
+    "growth_stage": "vegetative",
+    "care_recommendations": {
+        "watering": "Keep the soil constantly moist", "sunlight": "Full sun", "soil": "Rich, loamy, wet soil",
+        "fertilizer": "Nitrogen-rich fertilizer every two weeks", "pruning": "Harvest shoots to encourage branching"
+    },
+    "pests_and_diseases": ["Aphids", "Leaf spot"],
+    "seasonal_notes": "Grows fastest in the rainy season."
+}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 refuses connections under load
+
+    def __init__(self, address, latency=0.5, jitter=0.0, prompt_tokens=850, completion_tokens=250,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, stream_chunk_delay=0.02, seed=None,
+                 confidence=0.9, weak_models=()):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunk_delay = stream_chunk_delay
+        self.confidence = confidence
+        self.weak_models = set(weak_models)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.models = {}
+        self.stats = {'requests': 0, 'completed': 0, 'streamed': 0, 'errors': 0, 'rate_limited': 0, 'unauthorized': 0, 'in_flight': 0, 'max_in_flight': 0,
+                      'bytes_received': 0, 'max_request_bytes': 0}
+
+    def handle_error(self, request, client_address):
+        # A client closing a stream early (a cancelled analysis) is expected, not a server error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+            if name == 'in_flight':
+                self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+            elif name == 'bytes_received':
+                self.stats['max_request_bytes'] = max(self.stats['max_request_bytes'], amount)
+
+    def answer(self, model):
+        """The plant-info JSON text a model answers with"""
+        with self.lock:
+            self.models[model] = self.models.get(model, 0) + 1
+        confidence = 0.3 if model in self.weak_models else self.confidence
+        return json.dumps(dict(PLANT_INFO, confidence=confidence))
+
+    def roll(self):
+        """Pick the outcome and delay for one request"""
+        with self.lock:
+            outcome = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if outcome < self.rate_limit_rate:
+            return 'rate_limited', 0.0
+        if outcome < self.rate_limit_rate + self.error_rate:
+            return 'error', delay
+        return 'ok', delay
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats, models=dict(self.server.models)))
+        elif self.path.rstrip('/').endswith('/models'):
+            self.send_json(200, {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        server = self.server
+        server.count('requests')
+        if not self.headers.get('Authorization', '').startswith('Bearer sk-'):
+            server.count('unauthorized')
+            self.send_json(401, {"error": {"message": "Incorrect API key provided", "type": "invalid_request_error",
+                                           "code": "invalid_api_key"}})
+            return
+        server.count('bytes_received', length)
+        server.count('in_flight')
+        try:
+            outcome, delay = server.roll()
+            if outcome == 'rate_limited':
+                server.count('rate_limited')
+                self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                               headers={'Retry-After': f"{server.retry_after:g}"})
+                return
+            if outcome == 'error':
+                time.sleep(delay)
+                server.count('errors')
+                self.send_json(500, {"error": {"message": "The server had an error processing your request", "type": "server_error"}})
+                return
+
+            if body.get('stream'):
+                self.stream_completion(body, delay)
+                server.count('streamed')
+            else:
+                time.sleep(delay)
+                self.send_json(200, {
+                    "id": f"chatcmpl-fake-{random.getrandbits(32):08x}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get('model', 'gpt-4o'),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": server.answer(body.get('model', 'gpt-4o'))}
+                    }],
+                    "usage": self.usage()
+                })
+            server.count('completed')
+        finally:
+            server.count('in_flight', -1)
+
+    def usage(self):
+        return {
+            "prompt_tokens": self.server.prompt_tokens,
+            "completion_tokens": self.server.completion_tokens,
+            "total_tokens": self.server.prompt_tokens + self.server.completion_tokens,
+        }
+
+    def stream_completion(self, body, delay):
+        """Server-sent chunks: first byte after `delay`, then one field per chunk"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": "chatcmpl-fake-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get('model', 'gpt-4o'),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        time.sleep(delay)
+        content = self.server.answer(body.get('model', 'gpt-4o'))
+        pieces = content.split(', "')
+        send_event(chunk({"role": "assistant", "content": ""}))
+        for i, piece in enumerate(pieces):
+            send_event(chunk({"content": piece if i == 0 else ', "' + piece}))
+            time.sleep(self.server.stream_chunk_delay)
+        send_event(chunk({}, finish_reason="stop"))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            send_event(json.dumps({
+                "id": "chatcmpl-fake-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get('model', 'gpt-4o'),
+                "choices": [],
+                "usage": self.usage()
+            }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Local OpenAI chat completions stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before the response (or first stream chunk)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- seconds of uniform random latency")
+    parser.add_argument('--prompt-tokens', type=int, default=850)
+    parser.add_argument('--completion-tokens', type=int, default=250)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--confidence', type=float, default=0.9, help="confidence reported in answers")
+    parser.add_argument('--weak-models', default='', help="comma-separated models that answer with confidence 0.3")
+    return parser
+
+
+def create_server(args):
+    return FakeOpenAIServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        prompt_tokens=args.prompt_tokens,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        stream_chunk_delay=args.stream_chunk_delay,
+        seed=args.seed,
+        confidence=args.confidence,
+        weak_models=[model for model in args.weak_models.split(',') if model],
+    )
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    server = create_server(args)
+    print(f"🌱 Fake OpenAI listening on http://{args.host}:{args.port}/v1 "
+          f"(latency={args.latency}s±{args.jitter}s, errors={args.error_rate:.0%}, 429s={args.rate_limit_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,171 @@
+"""
+Local stand-in for the Plant.id v2 identification API, for load tests and benchmarks.
+
+Answers POST /v2/identify with Plant.id-shaped suggestions after a configurable
+delay, with a configurable top-suggestion probability (below 0.3 exercises
+the low-confidence path of /api/ai-recognition), 500 rate and plant name
+(use a different one than fake_openai.py's Kangkong to exercise conflicts).
+
+    python bench/fake_plantid.py --port 8766 --latency 1.0 --probability 0.85
+
+Point the backend at it with PLANT_ID_API_URL=http://127.0.0.1:8766/v2/identify
+and any PLANT_ID_API_KEY. GET /stats returns request counters.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+
+PLANTS = {
+    'Ipomoea aquatica': ["Kangkong", "Water Spinach", "Ong Choy"],
+    'Ipomoea batatas': ["Sweet Potato", "Kamote"],
+    'Basella alba': ["Malabar Spinach", "Alugbati"],
+}
+
+
+class FakePlantIdServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.5, jitter=0.0, probability=0.85, plant='Ipomoea aquatica',
+                 error_rate=0.0, seed=None):
+        super().__init__(address, FakePlantIdHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.probability = probability
+        self.plant = plant
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'completed': 0, 'errors': 0, 'unauthorized': 0, 'in_flight': 0,
+                      'max_in_flight': 0, 'max_request_bytes': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+            if name == 'in_flight':
+                self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+
+    def roll(self):
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        return failed, delay
+
+    def suggestions(self):
+        """The configured plant first, then the others as less likely alternatives"""
+        others = [name for name in PLANTS if name != self.plant]
+        ranked = [(self.plant, self.probability)] + [(name, self.probability / (i + 2)) for i, name in enumerate(others)]
+        return [{
+            "id": i + 1,
+            "plant_name": name,
+            "probability": round(probability, 4),
+            "plant_details": {
+                "scientific_name": name,
+                "common_names": PLANTS.get(name, []),
+                "url": f"https://en.wikipedia.org/wiki/{name.replace(' ', '_')}",
+                "wiki_description": {"value": f"{name} is a plant used by the fake Plant.id server.",
+                                     "citation": "https://en.wikipedia.org", "license_name": "CC BY-SA 3.0"},
+                "taxonomy": {"genus": name.split()[0]},
+            },
+        } for i, (name, probability) in enumerate(ranked)]
+
+
+class FakePlantIdHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/identify'):
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        server = self.server
+        server.count('requests')
+        with server.lock:
+            server.stats['max_request_bytes'] = max(server.stats['max_request_bytes'], length)
+        if not self.headers.get('Api-Key'):
+            server.count('unauthorized')
+            self.send_json(401, {"error": "API key not provided"})
+            return
+        if not body.get('images'):
+            self.send_json(400, {"error": "No images"})
+            return
+
+        server.count('in_flight')
+        try:
+            failed, delay = server.roll()
+            time.sleep(delay)
+            if failed:
+                server.count('errors')
+                self.send_json(500, {"error": "Internal server error"})
+                return
+            self.send_json(200, {
+                "id": random.getrandbits(32),
+                "suggestions": server.suggestions(),
+                "is_plant": True,
+                "is_plant_probability": 0.99,
+                "meta_data": {"date": time.strftime('%Y-%m-%d')},
+            })
+            server.count('completed')
+        finally:
+            server.count('in_flight', -1)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Local Plant.id identification stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before the response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- seconds of uniform random latency")
+    parser.add_argument('--probability', type=float, default=0.85, help="probability of the top suggestion")
+    parser.add_argument('--plant', default='Ipomoea aquatica', choices=sorted(PLANTS),
+                        help="scientific name of the top suggestion")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def create_server(args):
+    return FakePlantIdServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        probability=args.probability,
+        plant=args.plant,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    server = create_server(args)
+    print(f"🌱 Fake Plant.id listening on http://{args.host}:{args.port}/v2/identify "
+          f"(latency={args.latency}s±{args.jitter}s, top={args.plant} at {args.probability:.0%}, "
+          f"errors={args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
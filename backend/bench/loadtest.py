@@ -0,0 +1,375 @@
+"""
+Load test for the backend against the local OpenAI stand-in (bench/fake_openai.py).
+
+Starts the fake OpenAI server and the app (gunicorn by default) on a scratch
+database, drives /api/train-plant/generate, /api/train-plant and /api/health at
+each concurrency level, and reports p50/p95/p99 latency, requests/sec and peak
+RSS per worker. Results are written as JSON so runs can be compared.
+
+    cd backend
+    python bench/loadtest.py --concurrency 1,8,32 --requests 200 --latency 0.8
+    python bench/loadtest.py --server-cmd "uvicorn asgi:app --port {port} --workers 2"
+    python bench/loadtest.py --url http://127.0.0.1:5000 --no-fake   # already running server
+"""
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_openai import build_arg_parser as build_fake_arg_parser, create_server  # noqa: E402
+
+SCENARIOS = ('generate', 'train', 'health')
+
+# gunicorn never runs app.py's __main__ block, so the scratch database is set up first
+INIT_DB = """
+from app import app
+from website import db
+from website.schema import add_missing_columns
+with app.app_context():
+    db.create_all()
+    add_missing_columns()
+"""
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ImageFactory:
+    """
+    Photo-sized JPEGs for upload. Every request gets distinct bytes (a JPEG comment
+    carries the request number) so the response cache doesn't hide the OpenAI path.
+    """
+
+    def __init__(self, size=1024, pool=8, unique=True, seed=0):
+        rng = random.Random(seed)
+        self.unique = unique
+        self.images = []
+        for _ in range(pool):
+            noise = Image.effect_noise((size, size * 3 // 4), 40).convert('RGB')
+            tint = Image.new('RGB', noise.size, (rng.randrange(40, 120), rng.randrange(100, 200), rng.randrange(30, 90)))
+            buffer = io.BytesIO()
+            Image.blend(noise, tint, 0.6).save(buffer, 'JPEG', quality=90)
+            self.images.append(buffer.getvalue())
+
+    def get(self, number):
+        data = self.images[number % len(self.images)]
+        if not self.unique:
+            return data
+        comment = f"bench-{number}".encode('ascii')
+        # SOI, then a COM segment, then the rest of the original file
+        return data[:2] + b'\xff\xfe' + (len(comment) + 2).to_bytes(2, 'big') + comment + data[2:]
+
+
+class RssSampler:
+    """Samples VmRSS of a process tree (the server and its workers) from /proc"""
+
+    def __init__(self, root_pid, interval=0.1):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def read_status(pid, field):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+    def process_tree(self):
+        pids = [self.root_pid]
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/task/{pid}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    def sample(self):
+        for pid in self.process_tree():
+            rss = self.read_status(pid, 'VmRSS')
+            if rss is not None and rss > self.peaks.get(pid, 0):
+                self.peaks[pid] = rss
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.peaks = {}
+        self._stop.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        return {str(pid): round(rss / (1024 * 1024), 1) for pid, rss in sorted(self.peaks.items())}
+
+
+def build_request(scenario, number, images):
+    """(method, path, request kwargs) for one request of a scenario"""
+    if scenario == 'generate':
+        return 'POST', '/api/train-plant/generate', {
+            'files': {'image': ('plant.jpg', images.get(number), 'image/jpeg')},
+        }
+    if scenario == 'train':
+        # Only plant_name is given, so every submission is enhanced with OpenAI (sync mode)
+        return 'POST', '/api/train-plant', {
+            'data': {'plant_name': f'Bench plant {number}'},
+            'files': {'image': ('plant.jpg', images.get(number), 'image/jpeg')},
+        }
+    if scenario == 'health':
+        return 'GET', '/api/health', {}
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+async def run_level(base_url, scenario, concurrency, total, images, timeout, offset):
+    """Send `total` requests with `concurrency` in flight; returns latencies and status counts"""
+    latencies = []
+    statuses = {}
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for number in counter:
+                method, path, kwargs = build_request(scenario, offset + number, images)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    await response.aread()
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = f"error:{type(e).__name__}"
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, statuses, elapsed
+
+
+def summarize(scenario, concurrency, latencies, statuses, elapsed, rss):
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    to_ms = lambda value: round(value * 1000, 1) if value is not None else None
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'ok': ok,
+        'errors': len(latencies) - ok,
+        'status_counts': statuses,
+        'duration_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': to_ms(percentile(ordered, 50)),
+            'p95': to_ms(percentile(ordered, 95)),
+            'p99': to_ms(percentile(ordered, 99)),
+            'mean': to_ms(sum(ordered) / len(ordered)) if ordered else None,
+            'max': to_ms(ordered[-1]) if ordered else None,
+        },
+        'peak_rss_mb': rss,
+        'peak_rss_mb_max': max(rss.values()) if rss else None,
+    }
+
+
+def wait_for_health(base_url, process=None, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming healthy")
+        try:
+            if httpx.get(base_url + '/api/health', timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout}s")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_app(args, scratch_dir, openai_base_url):
+    """Launch the server command on a scratch database, returns (process, log file)"""
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'sk-bench')
+    if openai_base_url:
+        env['OPENAI_BASE_URL'] = openai_base_url
+    env['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(scratch_dir, 'bench.sqlite')}"
+    env['BLOB_STORE_PATH'] = os.path.join(scratch_dir, 'blobs')
+    env['SINGLEFLIGHT_LOCK_DIR'] = os.path.join(scratch_dir, 'singleflight')
+    env.setdefault('FREE_ANALYSES_BASIC', '1000000000')  # every request comes from one session user
+    for assignment in args.env:
+        name, _, value = assignment.partition('=')
+        env[name] = value
+
+    subprocess.run([sys.executable, '-c', INIT_DB], cwd=BACKEND_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    log = open(os.path.join(scratch_dir, 'server.log'), 'w')
+    command = shlex.split(args.server_cmd.format(port=args.port))
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, log
+
+
+def print_table(results):
+    print(f"\n{'scenario':<10} {'conc':>5} {'reqs':>6} {'errors':>6} {'rps':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    for row in results:
+        latency = row['latency_ms']
+        print(f"{row['scenario']:<10} {row['concurrency']:>5} {row['requests']:>6} {row['errors']:>6} "
+              f"{row['rps'] or 0:>8.1f} {latency['p50'] or 0:>9.1f} {latency['p95'] or 0:>9.1f} "
+              f"{latency['p99'] or 0:>9.1f} {row['peak_rss_mb_max'] or 0:>12.1f}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Backend load test against a local OpenAI stand-in",
+                                     parents=[build_fake_arg_parser()], conflict_handler='resolve')
+    parser.add_argument('--port', type=int, default=5055, help="port for the app under test")
+    parser.add_argument('--fake-port', type=int, default=8765, help="port for the fake OpenAI server")
+    parser.add_argument('--server-cmd', default='gunicorn --workers 2 --threads 8 --bind 127.0.0.1:{port} app:app',
+                        help="command that starts the app ({port} is substituted); run from backend/")
+    parser.add_argument('--url', default=None, help="benchmark an already running server instead of starting one")
+    parser.add_argument('--pid', type=int, default=None, help="server pid for RSS sampling with --url")
+    parser.add_argument('--no-fake', action='store_true', help="don't start the fake OpenAI server")
+    parser.add_argument('--database-url', default=None, help="database for the app (default: scratch SQLite)")
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE', help="extra env for the app")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario and level")
+    parser.add_argument('--warmup', type=int, default=5, help="unmeasured requests before each scenario")
+    parser.add_argument('--timeout', type=float, default=120.0, help="client timeout per request (seconds)")
+    parser.add_argument('--image-size', type=int, default=1024, help="width of uploaded test images (pixels)")
+    parser.add_argument('--repeat-images', action='store_true', help="reuse identical image bytes (cache hits)")
+    parser.add_argument('--output', default=None, help="results file (default: bench/results/loadtest-<time>.json)")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{scenario}', expected: {', '.join(SCENARIOS)}")
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    scratch_dir = tempfile.mkdtemp(prefix='egrowtify-bench-')
+    fake_server = None
+    process = log = None
+    openai_base_url = None
+    try:
+        if not args.no_fake:
+            fake_args = argparse.Namespace(**vars(args))
+            fake_args.port = args.fake_port
+            fake_server = create_server(fake_args)
+            threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+            openai_base_url = f"http://{args.host}:{args.fake_port}/v1"
+            print(f"🌱 Fake OpenAI on {openai_base_url} (latency {args.latency}s±{args.jitter}s)")
+
+        if args.url:
+            base_url = args.url.rstrip('/')
+            server_pid = args.pid
+        else:
+            process, log = start_app(args, scratch_dir, openai_base_url)
+            base_url = f"http://127.0.0.1:{args.port}"
+            server_pid = process.pid
+            print(f"🚀 Started: {args.server_cmd.format(port=args.port)} (logs: {log.name})")
+        wait_for_health(base_url, process)
+
+        images = ImageFactory(size=args.image_size, unique=not args.repeat_images)
+        sampler = RssSampler(server_pid) if server_pid and os.path.exists(f'/proc/{server_pid}') else None
+        results = []
+        offset = 0
+        for scenario in scenarios:
+            if args.warmup:
+                asyncio.run(run_level(base_url, scenario, 1, args.warmup, images, args.timeout, offset))
+                offset += args.warmup
+            for concurrency in levels:
+                print(f"⏱️ {scenario}: {args.requests} requests at concurrency {concurrency}...")
+                if sampler:
+                    sampler.start()
+                latencies, statuses, elapsed = asyncio.run(
+                    run_level(base_url, scenario, concurrency, args.requests, images, args.timeout, offset))
+                offset += args.requests
+                rss = sampler.stop() if sampler else {}
+                results.append(summarize(scenario, concurrency, latencies, statuses, elapsed, rss))
+
+        print_table(results)
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'server_cmd': None if args.url else args.server_cmd.format(port=args.port),
+                'url': base_url,
+                'args': vars(args),
+            },
+            'fake_openai': dict(fake_server.stats) if fake_server else None,
+            'results': results,
+        }
+        output = args.output or os.path.join(
+            BENCH_DIR, 'results', f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Results written to {output}")
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log is not None:
+            log.close()
+        if fake_server is not None:
+            fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
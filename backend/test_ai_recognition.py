@@ -0,0 +1,167 @@
+"""
+/api/ai-recognition against local stand-ins for both upstreams.
+
+Runs bench/fake_plantid.py and bench/fake_openai.py in-process on free
+ports, so each test can set their latency and Plant.id's confidence. Checks
+that the two calls overlap (about max(A, B), not A + B), that a low-confidence
+Plant.id answer cancels the GPT-4o analysis, and that a timeout in either
+upstream still answers with the other one's result.
+
+    cd backend && python -m pytest -q test_ai_recognition.py
+"""
+from starlette.testclient import TestClient
+import importlib.util
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Latencies of the stand-ins in the overlap test: sequential calls would take their sum
+PLANT_ID_LATENCY = 1.0
+OPENAI_LATENCY = 1.2
+# Preparing the image, the request itself and thread hand-offs, well below the shorter latency
+OVERHEAD = 0.5
+
+
+def load_bench(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BACKEND_DIR, 'bench', f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture(scope='module')
+def fake_plantid():
+    server = serve(load_bench('fake_plantid').FakePlantIdServer(('127.0.0.1', 0), latency=0))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def fake_openai():
+    # Streamed fields arrive back to back, so the answer takes just the configured latency
+    server = serve(load_bench('fake_openai').FakeOpenAIServer(('127.0.0.1', 0), latency=0, stream_chunk_delay=0))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def app(fake_plantid, fake_openai, tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('recognition')
+    # The routes read OPENAI_API_KEY per request, so the environment stays patched for the module
+    with pytest.MonkeyPatch.context() as env:
+        for name, value in {
+            'OPENAI_API_KEY': 'sk-test',
+            'OPENAI_BASE_URL': f"http://127.0.0.1:{fake_openai.server_address[1]}/v1",
+            'PLANT_ID_API_KEY': 'test',
+            'PLANT_ID_API_URL': f"http://127.0.0.1:{fake_plantid.server_address[1]}/v2/identify",
+            'FREE_ANALYSES_BASIC': '1000',
+            'DATABASE_URL': f"sqlite:///{tmp / 'test.sqlite'}",
+            'BLOB_STORE_PATH': str(tmp / 'blobs'),
+            'SINGLEFLIGHT_LOCK_DIR': str(tmp / 'singleflight'),
+            'OPENAI_RATE_LIMIT_DIR': str(tmp / 'ratelimit'),
+        }.items():
+            env.setenv(name, value)
+        from website import create_app
+
+        app = create_app()
+        recognize_flask(app)  # the upstream clients and connection pools are set up on first use
+        yield app
+
+
+@pytest.fixture(autouse=True)
+def upstreams(app, fake_plantid, fake_openai):
+    """Fast, confident stand-ins and the default deadlines again after each test"""
+    config = {name: app.config[name] for name in ('PLANT_ID_TIMEOUT', 'AI_RECOGNITION_OPENAI_TIMEOUT')}
+    yield
+    app.config.update(config)
+    fake_plantid.latency = fake_openai.latency = 0
+    fake_plantid.probability = 0.85
+
+
+def plant_photo():
+    """A noise JPEG, different every call, so GPT-4o is never answered from the response cache"""
+    pixels = np.random.default_rng().integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def recognize_flask(app):
+    return app.test_client().post('/api/ai-recognition', data={'image': (io.BytesIO(plant_photo()), 'plant.jpg')})
+
+
+def recognize_asgi(app):
+    from website.asgi import create_asgi_app
+
+    with TestClient(create_asgi_app(app)) as client:
+        return client.post('/api/ai-recognition', files={'image': ('plant.jpg', plant_photo(), 'image/jpeg')})
+
+
+def timed(recognize, app):
+    started = time.perf_counter()
+    response = recognize(app)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.text if hasattr(response, 'text') else response.get_data(as_text=True)
+    return response.json() if callable(getattr(response, 'json', None)) else response.get_json(), elapsed
+
+
+@pytest.mark.parametrize('recognize', [recognize_flask, recognize_asgi], ids=['flask', 'asgi'])
+def test_upstreams_run_in_parallel(app, fake_plantid, fake_openai, recognize):
+    fake_plantid.latency, fake_openai.latency = PLANT_ID_LATENCY, OPENAI_LATENCY
+    result, elapsed = timed(recognize, app)
+
+    assert result['plant_id_status'] == 'ok'
+    assert result['ai_analysis_status'] == 'ok'
+    assert result['reconciliation'] == 'agreed'
+    assert max(PLANT_ID_LATENCY, OPENAI_LATENCY) <= elapsed < max(PLANT_ID_LATENCY, OPENAI_LATENCY) + OVERHEAD
+    assert elapsed < PLANT_ID_LATENCY + OPENAI_LATENCY - OVERHEAD
+
+
+def test_low_confidence_cancels_analysis(app, fake_plantid, fake_openai):
+    fake_plantid.latency, fake_plantid.probability = 0.1, 0.1
+    fake_openai.latency = 3.0
+    result, elapsed = timed(recognize_flask, app)
+
+    assert result['plant_id_status'] == 'ok'
+    assert result['ai_analysis_status'] == 'skipped_low_confidence'
+    assert result['ai_analysis'] is None
+    assert result['scientific_name'] == 'Ipomoea aquatica'
+    assert elapsed < 1.0  # didn't wait for GPT-4o
+
+
+def test_plant_id_timeout_answers_with_analysis(app, fake_plantid, fake_openai):
+    app.config['PLANT_ID_TIMEOUT'] = 0.5
+    fake_plantid.latency = 3.0
+    result, elapsed = timed(recognize_flask, app)
+
+    assert result['plant_id_status'] == 'timeout'
+    assert result['ai_analysis_status'] == 'ok'
+    assert result['source'] == 'openai'
+    assert result['scientific_name'] == 'Ipomoea aquatica'
+    assert elapsed < 0.5 + OVERHEAD
+
+
+def test_openai_timeout_answers_with_identification(app, fake_plantid, fake_openai):
+    app.config['AI_RECOGNITION_OPENAI_TIMEOUT'] = 0.5
+    fake_openai.latency = 3.0
+    result, elapsed = timed(recognize_flask, app)
+
+    assert result['plant_id_status'] == 'ok'
+    assert result['ai_analysis_status'] == 'timeout'
+    assert result['ai_analysis'] is None
+    assert result['source'] == 'plant_id'
+    assert result['scientific_name'] == 'Ipomoea aquatica'
+    assert elapsed < 0.5 + OVERHEAD
@@ -0,0 +1,257 @@
+"""
+Peak memory of a max-size upload to /api/train-plant/generate.
+
+Runs the app against bench/fake_openai.py (in a subprocess, so its own
+buffering isn't counted). The upload is validated and hashed in chunks, and
+an image that has to be sent as-is is base64-encoded straight into the
+request body, so the peak stays far below the size of the upload itself.
+
+tracemalloc only sees Python allocations, not Pillow's C-level image
+buffers, so it measures the undecodable (sent as-is) upload. A decodable
+max-size photo goes through decode/resize/re-encode and is measured by the
+process's peak RSS instead (Linux only: it resets VmHWM via
+/proc/self/clear_refs, and is skipped where that isn't allowed).
+
+    cd backend && python -m pytest -q test_upload_memory.py
+"""
+from werkzeug.test import EnvironBuilder
+import ctypes
+import gc
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+import numpy as np
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Reading the whole upload, base64-encoding it and JSON-encoding the request cost ~6x its size
+PEAK_LIMIT = 2 * 1024 * 1024
+# Decoding the max-size photo at full resolution alone takes ~53MB; JPEG draft mode decodes it at 1/4 scale
+RSS_PEAK_LIMIT = 20 * 1024 * 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def fake_openai():
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, 'bench', 'fake_openai.py'), '--port', str(port), '--latency', '0'],
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/models', timeout=1).read()
+            break
+        except OSError:
+            time.sleep(0.05)
+    yield url
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture(scope='module')
+def app(fake_openai, tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('uploads')
+    # The routes read OPENAI_API_KEY per request, so the environment stays patched for the module
+    with pytest.MonkeyPatch.context() as env:
+        for name, value in {
+            'OPENAI_API_KEY': 'sk-test',
+            'OPENAI_BASE_URL': fake_openai,
+            'DATABASE_URL': f"sqlite:///{tmp / 'test.sqlite'}",
+            'BLOB_STORE_PATH': str(tmp / 'blobs'),
+            'SINGLEFLIGHT_LOCK_DIR': str(tmp / 'singleflight'),
+            'OPENAI_RATE_LIMIT_DIR': str(tmp / 'ratelimit'),
+        }.items():
+            env.setenv(name, value)
+        from website import create_app
+
+        yield create_app()
+
+
+def fake_openai_stats(url):
+    return json.loads(urllib.request.urlopen(url + '/stats', timeout=5).read())
+
+
+def upload_environ(app, image, filename='plant.jpg'):
+    """WSGI environ for a multipart upload, encoded before measuring starts"""
+    builder = EnvironBuilder(path='/api/train-plant/generate', method='POST',
+                             data={'image': (io.BytesIO(image), filename)})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def max_size_image(app):
+    """JPEG magic bytes followed by noise: undecodable, so it must be sent to OpenAI as-is"""
+    size = app.config['MAX_CONTENT_LENGTH'] - 4096  # room for the multipart framing
+    return b'\xff\xd8\xff\xe0' + os.urandom(size - 4)
+
+
+def decodable_max_size_image(app):
+    """A noisy photo-sized JPEG just under the upload limit (noise keeps JPEG from compressing it)"""
+    limit = app.config['MAX_CONTENT_LENGTH'] - 4096
+    pixels = np.random.default_rng(0).integers(0, 256, (3150, 4200, 3), dtype=np.uint8)
+    for quality in range(95, 50, -5):
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+        if buffer.tell() <= limit:
+            return buffer.getvalue()
+    raise AssertionError("could not encode a JPEG under the upload limit")
+
+
+def small_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 1200), (40, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def warm_up(app):
+    """Requests first, so one-off imports, decoder setup and SDK model setup aren't measured"""
+    for image in (b'\xff\xd8\xff\xe0' + os.urandom(2 * 1024 * 1024), small_jpeg()):
+        response = app.test_client().open(upload_environ(app, image))
+        assert response.status_code == 200
+
+
+def measure_peak(app, environ):
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        response = client.open(environ)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return response, peak
+
+
+def release_free_memory():
+    """Hand freed heap pages back to the OS, so the request can't reuse them unseen by RSS"""
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (AttributeError, OSError):
+        pass  # not glibc
+
+
+def reset_peak_rss():
+    """Reset the process's peak RSS (VmHWM); False where the kernel doesn't support it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def rss_bytes(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise AssertionError(f"{field} missing from /proc/self/status")
+
+
+def measure_peak_rss(app, environ):
+    client = app.test_client()
+    gc.collect()
+    release_free_memory()
+    reset_peak_rss()
+    before = rss_bytes('VmRSS')
+    response = client.open(environ)
+    return response, rss_bytes('VmHWM') - before
+
+
+def test_max_size_upload_peak_allocation(app, fake_openai):
+    warm_up(app)
+    image = max_size_image(app)
+    environ = upload_environ(app, image)
+    before = fake_openai_stats(fake_openai)
+    pooled_before = app.extensions['openai_clients'].stats()['requests']
+
+    response, peak = measure_peak(app, environ)
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json()['plant_name'] == 'Kangkong'
+    assert int(response.headers['X-Image-Bytes-Sent']) == len(image)
+    after = fake_openai_stats(fake_openai)
+    assert after['requests'] == before['requests'] + 1
+    assert after['max_request_bytes'] > len(image) * 4 // 3  # the whole image went out, base64-encoded
+    # Streamed bodies bypass the SDK: they must still carry its auth and use the registry's pool
+    assert after['unauthorized'] == before['unauthorized']
+    assert app.extensions['openai_clients'].stats()['requests'] == pooled_before + 1
+    assert peak < PEAK_LIMIT, f"peak allocation {peak:,} bytes for a {len(image):,} byte upload"
+
+
+def test_decodable_max_size_upload_peak_rss(app, fake_openai):
+    if not reset_peak_rss():
+        pytest.skip("peak RSS can't be reset here (needs Linux /proc/self/clear_refs)")
+    warm_up(app)
+    image = decodable_max_size_image(app)
+    environ = upload_environ(app, image)
+    before = fake_openai_stats(fake_openai)
+
+    response, peak = measure_peak_rss(app, environ)
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json()['plant_name'] == 'Kangkong'
+    sent = int(response.headers['X-Image-Bytes-Sent'])
+    assert sent < len(image) // 4  # decoded, downscaled and re-encoded, not sent as-is
+    after = fake_openai_stats(fake_openai)
+    assert after['requests'] == before['requests'] + 1
+    assert peak < RSS_PEAK_LIMIT, f"peak RSS grew {peak:,} bytes for a {len(image):,} byte photo"
+
+
+def test_non_image_upload_rejected_before_reading(app):
+    environ = upload_environ(app, b'%PDF-1.7\n' + b'0' * (1024 * 1024), 'plant.pdf')
+    response = app.test_client().open(environ)
+    assert response.status_code == 415
+
+
+def test_heic_upload_rejected(app):
+    # Pillow can't decode HEIC without pillow-heif, and the vision API doesn't take it as-is
+    environ = upload_environ(app, b'\x00\x00\x00\x18ftypheic' + b'0' * 1024, 'plant.heic')
+    response = app.test_client().open(environ)
+    assert response.status_code == 415
+
+
+def test_oversized_upload_rejected(app):
+    app.config['UPLOAD_MAX_BYTES'] = 1024 * 1024
+    try:
+        environ = upload_environ(app, b'\xff\xd8\xff\xe0' + os.urandom(2 * 1024 * 1024))
+        response = app.test_client().open(environ)
+    finally:
+        app.config['UPLOAD_MAX_BYTES'] = app.config['MAX_CONTENT_LENGTH']
+    assert response.status_code == 413
+
+
+def test_batch_rejected_upload_does_not_fail_the_batch(app):
+    builder = EnvironBuilder(path='/api/train-plant/generate/batch', method='POST', data={'images': [
+        (io.BytesIO(b'\xff\xd8\xff\xe0' + os.urandom(64 * 1024)), 'plant.jpg'),
+        (io.BytesIO(b'%PDF-1.7\n' + b'0' * 1024), 'notes.pdf'),
+    ]})
+    try:
+        response = app.test_client().open(builder.get_environ())
+    finally:
+        builder.close()
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    items = {line['filename']: line for line in lines if 'filename' in line}
+    assert items['plant.jpg']['status'] == 'ok'
+    assert items['plant.jpg']['result']['plant_name'] == 'Kangkong'
+    assert items['notes.pdf']['status'] == 'error'
+    assert items['notes.pdf']['index'] == 1
+    assert lines[-1] == dict(lines[-1], done=True, total=2, succeeded=1, failed=1)
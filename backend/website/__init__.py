@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+import atexit
 import os
 
 # Load environment variables - search in backend and root
@@ -19,7 +20,12 @@ for path in env_paths:
 
 db = SQLAlchemy()
 
+def env_flag(name, default='false'):
+    """Read a boolean environment variable ("1", "true" or "yes" are truthy)"""
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes')
+
 def create_app():
+    from website.database import engine_options, install_sqlite_pragmas, normalize_database_url
     app = Flask(__name__)
     
     # Configuration
@@ -29,16 +35,196 @@ def create_app():
     # Database configuration - use SQLite as default fallback (more reliable for verify)
     db_path = os.path.join(backend_dir, 'database', 'database.db')
     default_db_uri = f'sqlite:///{db_path}'
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', default_db_uri)
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.getenv('DATABASE_URL', default_db_uri))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Database engine tuning (website/database.py); DB_TUNING=false keeps the driver defaults
+    app.config['DB_TUNING'] = env_flag('DB_TUNING', 'true')
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # ms a writer waits for the lock
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+    app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', str(64 * 1024)))  # KiB per connection
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))  # Postgres/MySQL connections per worker
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # seconds waiting for a connection
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # seconds
+    app.config['DB_POOL_PRE_PING'] = env_flag('DB_POOL_PRE_PING', 'true')
+    app.config['DB_STATEMENT_TIMEOUT'] = int(os.getenv('DB_STATEMENT_TIMEOUT', '30000'))  # ms; 0 = none
+    app.config['DB_AUTO_MIGRATE'] = env_flag('DB_AUTO_MIGRATE', 'true')  # add missing tables/columns at startup
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     
+    # Uploaded images are validated and hashed a chunk at a time instead of read into memory
+    app.config['UPLOAD_MAX_BYTES'] = int(os.getenv('UPLOAD_MAX_BYTES', str(app.config['MAX_CONTENT_LENGTH'])))
+    app.config['UPLOAD_SPOOL_MEMORY'] = int(os.getenv('UPLOAD_SPOOL_MEMORY', str(512 * 1024)))  # then a temp file
+    
+    # OpenAI HTTP connection pool
+    app.config['OPENAI_POOL_MAX_CONNECTIONS'] = int(os.getenv('OPENAI_POOL_MAX_CONNECTIONS', '20'))
+    app.config['OPENAI_POOL_MAX_KEEPALIVE'] = int(os.getenv('OPENAI_POOL_MAX_KEEPALIVE', '10'))
+    app.config['OPENAI_POOL_KEEPALIVE_EXPIRY'] = float(os.getenv('OPENAI_POOL_KEEPALIVE_EXPIRY', '30'))
+    app.config['OPENAI_CONNECT_TIMEOUT'] = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+    app.config['OPENAI_READ_TIMEOUT'] = float(os.getenv('OPENAI_READ_TIMEOUT', '60'))
+    app.config['OPENAI_HTTP2'] = env_flag('OPENAI_HTTP2')
+    app.config['OPENAI_MAX_RETRIES'] = int(os.getenv('OPENAI_MAX_RETRIES', '2'))  # 429/5xx/timeouts, with backoff
+    app.config['OPENAI_ASYNC_MAX_CONNECTIONS'] = int(os.getenv('OPENAI_ASYNC_MAX_CONNECTIONS', '200'))  # ASGI mode
+    
+    # OpenAI response cache
+    app.config['OPENAI_CACHE_MAX_ENTRIES'] = int(os.getenv('OPENAI_CACHE_MAX_ENTRIES', '256'))
+    app.config['OPENAI_CACHE_TTL'] = int(os.getenv('OPENAI_CACHE_TTL', '86400'))  # seconds
+    app.config['OPENAI_CACHE_PERSISTENT'] = env_flag('OPENAI_CACHE_PERSISTENT')
+    
+    # Image preprocessing before upload to the vision API
+    app.config['VISION_MAX_EDGE'] = int(os.getenv('VISION_MAX_EDGE', '1024'))  # pixels
+    app.config['VISION_IMAGE_FORMAT'] = os.getenv('VISION_IMAGE_FORMAT', 'jpeg').lower()  # jpeg or webp
+    app.config['VISION_IMAGE_QUALITY'] = int(os.getenv('VISION_IMAGE_QUALITY', '85'))
+    app.config['VISION_DETAIL'] = os.getenv('VISION_DETAIL', 'auto').lower()  # auto, low or high
+    app.config['VISION_LOW_DETAIL_MAX_EDGE'] = int(os.getenv('VISION_LOW_DETAIL_MAX_EDGE', '512'))
+    
+    # Vision model tiers, cheapest first: a weak answer is re-asked on the next model
+    app.config['VISION_MODEL_TIERS'] = [
+        model.strip() for model in os.getenv('VISION_MODEL_TIERS', 'gpt-4o-mini,gpt-4o').split(',') if model.strip()
+    ]
+    app.config['VISION_ESCALATE_BELOW'] = float(os.getenv('VISION_ESCALATE_BELOW', '0.7'))  # answer score, 0-1
+    app.config['VISION_MISSING_CONFIDENCE_SCORE'] = float(os.getenv('VISION_MISSING_CONFIDENCE_SCORE', '1.0'))  # complete answer without a confidence
+    
+    # Blob storage for uploaded training images
+    app.config['BLOB_STORE'] = os.getenv('BLOB_STORE', 'local')
+    app.config['BLOB_STORE_PATH'] = os.getenv('BLOB_STORE_PATH', os.path.join(backend_dir, 'database', 'blobs'))
+    
+    # Async AI enhancement jobs for /api/train-plant
+    app.config['TRAIN_PLANT_ASYNC'] = env_flag('TRAIN_PLANT_ASYNC')  # default mode when the request doesn't choose
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '2'))
+    app.config['JOB_QUEUE_SIZE'] = int(os.getenv('JOB_QUEUE_SIZE', '100'))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    app.config['JOB_SWEEP_INTERVAL'] = float(os.getenv('JOB_SWEEP_INTERVAL', '30'))  # seconds
+    app.config['JOB_STALE_AFTER'] = float(os.getenv('JOB_STALE_AFTER', '600'))  # seconds in 'running' before retry
+    
+    # Coalescing of identical in-flight OpenAI requests
+    app.config['SINGLEFLIGHT_LOCK_DIR'] = os.getenv('SINGLEFLIGHT_LOCK_DIR')  # defaults to system temp dir
+    app.config['SINGLEFLIGHT_TIMEOUT'] = float(os.getenv('SINGLEFLIGHT_TIMEOUT', '120'))
+    app.config['SINGLEFLIGHT_RESULT_TTL'] = float(os.getenv('SINGLEFLIGHT_RESULT_TTL', '10'))
+    app.config['SINGLEFLIGHT_CROSS_PROCESS'] = env_flag('SINGLEFLIGHT_CROSS_PROCESS', 'true')
+    
+    # Upstream budget shared by all workers on the host (0 = no limit)
+    app.config['OPENAI_RATE_LIMIT_RPM'] = int(os.getenv('OPENAI_RATE_LIMIT_RPM', '0'))
+    app.config['OPENAI_RATE_LIMIT_TPM'] = int(os.getenv('OPENAI_RATE_LIMIT_TPM', '0'))
+    app.config['OPENAI_RATE_LIMIT_DIR'] = os.getenv('OPENAI_RATE_LIMIT_DIR')  # defaults to system temp dir
+    app.config['OPENAI_RATE_LIMIT_MAX_WAIT'] = float(os.getenv('OPENAI_RATE_LIMIT_MAX_WAIT', '10'))  # then 503
+    app.config['OPENAI_RATE_LIMIT_MAX_WAITERS'] = int(os.getenv('OPENAI_RATE_LIMIT_MAX_WAITERS', '32'))  # per worker
+    app.config['OPENAI_BACKOFF_BASE'] = float(os.getenv('OPENAI_BACKOFF_BASE', '0.5'))  # seconds
+    app.config['OPENAI_BACKOFF_MAX'] = float(os.getenv('OPENAI_BACKOFF_MAX', '20'))
+    
+    # Batch plant info generation (/api/train-plant/generate/batch)
+    app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', '50'))
+    app.config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', '4'))  # images sent to OpenAI at once
+    app.config['BATCH_ITEM_TIMEOUT'] = float(os.getenv('BATCH_ITEM_TIMEOUT', '60'))  # seconds per image
+    
+    # Review queue API (/api/review/...)
+    app.config['REVIEW_API_TOKEN'] = os.getenv('REVIEW_API_TOKEN')  # Bearer token; unset = listing open, approve/reject and reports refused
+    app.config['REVIEW_BULK_MAX'] = int(os.getenv('REVIEW_BULK_MAX', '500'))  # submissions per approve/reject call
+    
+    # Analysis credits, charged per plant/soil analysis before the upstream call
+    app.config['FREE_ANALYSES_BASIC'] = int(os.getenv('FREE_ANALYSES_BASIC', '5'))
+    app.config['FREE_ANALYSES_PREMIUM'] = int(os.getenv('FREE_ANALYSES_PREMIUM', '10'))
+    app.config['PRICE_PER_ANALYSIS'] = float(os.getenv('PRICE_PER_ANALYSIS', '20.00'))  # recorded as the cost of a purchased analysis
+    
+    # AI usage rows (AIUsageTracking) are queued and bulk-inserted by a background writer
+    app.config['USAGE_FLUSH_INTERVAL'] = float(os.getenv('USAGE_FLUSH_INTERVAL', '1'))  # seconds; 0 writes each row inline
+    app.config['USAGE_FLUSH_BATCH'] = int(os.getenv('USAGE_FLUSH_BATCH', '500'))  # rows per INSERT
+    app.config['USAGE_QUEUE_MAX'] = int(os.getenv('USAGE_QUEUE_MAX', '10000'))  # then rows are written inline
+    
+    # Hourly/daily usage rollups behind /api/reports/usage
+    app.config['ROLLUP_REFRESH_INTERVAL'] = float(os.getenv('ROLLUP_REFRESH_INTERVAL', '60'))  # seconds between refreshes per worker
+    app.config['ROLLUP_SETTLE_SECONDS'] = float(os.getenv('ROLLUP_SETTLE_SECONDS', '30'))  # newer usage rows wait for the next refresh
+    app.config['ROLLUP_BATCH'] = int(os.getenv('ROLLUP_BATCH', '5000'))  # usage rows rolled up per transaction
+    
+    # Near-duplicate training images reuse an earlier submission's AI enhancement
+    app.config['NEAR_DUPLICATE_MAX_DISTANCE'] = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '10'))  # bits of 64; -1 disables
+    app.config['NEAR_DUPLICATE_RECOUNT_INTERVAL'] = float(os.getenv('NEAR_DUPLICATE_RECOUNT_INTERVAL', '60'))  # seconds; picks up backfilled hashes
+    
+    # Plant.id + GPT-4o recognition (/api/ai-recognition); both upstreams are called at once
+    app.config['PLANT_ID_API_KEY'] = os.getenv('PLANT_ID_API_KEY')
+    app.config['PLANT_ID_API_URL'] = os.getenv('PLANT_ID_API_URL', 'https://api.plant.id/v2/identify')
+    app.config['PLANT_ID_TIMEOUT'] = float(os.getenv('PLANT_ID_TIMEOUT', '10'))  # seconds, then GPT-4o answers alone
+    app.config['AI_RECOGNITION_OPENAI_TIMEOUT'] = float(os.getenv('AI_RECOGNITION_OPENAI_TIMEOUT', '30'))  # seconds, then Plant.id answers alone
+    app.config['AI_RECOGNITION_MIN_CONFIDENCE'] = float(os.getenv('AI_RECOGNITION_MIN_CONFIDENCE', '0.3'))  # below it GPT-4o is cancelled
+    
     # Initialize extensions
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config)
+        from website.schema import migrate_database, missing_columns
+        if app.config['DB_AUTO_MIGRATE']:
+            migrate_database()
+        else:
+            missing = missing_columns()
+            if missing:
+                raise RuntimeError(f"Database schema is out of date, missing: {', '.join(missing)}. "
+                                   f"Run `flask --app app migrate-db` or set DB_AUTO_MIGRATE=true")
+    
+    from website.metrics import MetricsRegistry
+    app.extensions['metrics'] = MetricsRegistry()
+    
+    from website.clients import OpenAIClientRegistry
+    openai_clients = OpenAIClientRegistry.from_config(app.config)
+    app.extensions['openai_clients'] = openai_clients
+    atexit.register(openai_clients.close)
+    
+    from website.plantid import PlantIdClient
+    plant_id = PlantIdClient.from_config(app.config)
+    app.extensions['plant_id'] = plant_id
+    atexit.register(plant_id.close)
+    
+    from website.cache import ResponseCache
+    app.extensions['openai_cache'] = ResponseCache.from_config(app.config)
+    
+    from website.singleflight import AsyncSingleFlight, SingleFlight
+    app.extensions['openai_singleflight'] = SingleFlight.from_config(app.config)
+    app.extensions['openai_async_singleflight'] = AsyncSingleFlight(app.config['SINGLEFLIGHT_TIMEOUT'])
+    
+    from website.ratelimit import UpstreamRateLimiter
+    app.extensions['openai_rate_limiter'] = UpstreamRateLimiter.from_config(app.config)
+    
+    from website.blobstore import create_blob_store
+    app.extensions['blob_store'] = create_blob_store(app.config)
+    
+    from website.credits import CreditService
+    app.extensions['credits'] = CreditService.from_config(app.config)
+    
+    from website.usage import UsageWriter
+    usage_writer = UsageWriter.from_config(app)
+    app.extensions['usage_writer'] = usage_writer
+    atexit.register(usage_writer.shutdown)  # registered before the job runner, so it runs after it
+    
+    from website.rollups import UsageRollups
+    app.extensions['usage_rollups'] = UsageRollups.from_config(app.config)
+    
+    from website.dedupe import NearDuplicateIndex
+    app.extensions['near_duplicates'] = NearDuplicateIndex.from_config(app.config)
+    
+    from website.jobs import EnhancementJobRunner
+    job_runner = EnhancementJobRunner.from_config(app)
+    app.extensions['enhancement_jobs'] = job_runner
+    atexit.register(job_runner.shutdown)
     
     # Register blueprints
     from website import views
     app.register_blueprint(views.views, url_prefix='/')
     
+    from website import review
+    app.register_blueprint(review.review, url_prefix='/')
+    if not app.config['REVIEW_API_TOKEN']:
+        print("⚠️ REVIEW_API_TOKEN is not set - anyone can list submissions; approve/reject and usage reports are disabled")
+    
+    from website import search
+    app.register_blueprint(search.search, url_prefix='/')
+    
+    from website import reports
+    app.register_blueprint(reports.reports, url_prefix='/')
+    
+    from website.commands import register_commands
+    register_commands(app)
+    
     return app
 
@@ -0,0 +1,445 @@
+"""
+ASGI serving mode.
+
+The generate, train, AI recognition and health endpoints run as native async
+handlers on AsyncOpenAI and an async SQLAlchemy engine, so a single worker can
+hold hundreds of in-flight vision calls instead of one per thread. Every other
+route is served by the regular Flask app mounted underneath, which keeps
+working unchanged under gunicorn.
+
+    uvicorn asgi:app --workers 2
+"""
+from a2wsgi import WSGIMiddleware
+from contextlib import asynccontextmanager
+from itsdangerous import BadSignature
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from flask import g
+from website import db
+from website.clients import get_async_openai_client, get_openai_key
+from website.credits import CreditsExhausted, get_credit_service
+from website.database import engine_options, install_sqlite_pragmas
+from website.dedupe import check_near_duplicate, reuse_enhancement
+from website.jobs import get_job_runner
+from website.metrics import get_metrics, record_error, timed_stage
+from website.plantid import get_plant_id_client
+from website.ratelimit import UpstreamBusy
+from website.recognition import RecognitionFailed, arecognize
+from website.uploads import UploadRejected, spool_base64, spool_upload
+from website.views import build_health_status, build_submission
+from website.vision import (
+    PLANT_INFO_REQUIRED_FIELDS, PLANT_INFO_SYSTEM_PROMPT, build_plant_info_prompt, aroute_vision_json,
+    normalize_plant_info, needs_enhancement, aenhance_plant_data
+)
+import asyncio
+import functools
+import importlib.util
+import json
+import math
+import time
+import traceback
+
+# Async drivers used in place of the sync ones from SQLALCHEMY_DATABASE_URI
+ASYNC_DRIVERS = {
+    'sqlite': ('sqlite+aiosqlite', 'aiosqlite'),
+    'postgresql': ('postgresql+asyncpg', 'asyncpg'),
+    'mysql': ('mysql+aiomysql', 'aiomysql'),
+}
+
+
+def async_database_url(database_uri):
+    """Async SQLAlchemy URL for the app database, None if no async driver is installed"""
+    url = make_url(database_uri)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or importlib.util.find_spec(driver[1]) is None:
+        return None
+    return url.set(drivername=driver[0])
+
+
+class AsyncDatabase:
+    """
+    Async writes for the ASGI handlers. Uses an async engine when the matching
+    driver is installed, otherwise runs the regular Flask-SQLAlchemy session in
+    a worker thread.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        url = async_database_url(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(url, **engine_options(url, flask_app.config)) if url is not None else None
+        if self.engine is not None:
+            install_sqlite_pragmas(self.engine.sync_engine, flask_app.config)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False) if self.engine else None
+        if self.engine is None:
+            print("⚠️ No async database driver installed - ASGI handlers will use a thread pool for the database")
+
+    async def save_submission(self, submission, with_job=False):
+        """Insert a submission (and optionally its enhancement job), returns (submission_id, job)"""
+        if self.sessionmaker is None:
+            return await asyncio.to_thread(self._save_submission_sync, submission, with_job)
+
+        async with self.sessionmaker() as session:
+            session.add(submission)
+            await session.flush()
+            job = None
+            if with_job:
+                job = get_job_runner().new_job(submission.submission_id)
+                session.add(job)
+            await session.commit()
+            return submission.submission_id, job
+
+    def _save_submission_sync(self, submission, with_job):
+        try:
+            db.session.add(submission)
+            db.session.flush()
+            job = get_job_runner().enqueue(submission.submission_id) if with_job else None
+            db.session.commit()
+            if job is not None:
+                db.session.refresh(job)
+                db.session.expunge(job)
+            return submission.submission_id, job
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+def is_truthy(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+def create_asgi_app(flask_app):
+    """Wrap a Flask app created by create_app() with async handlers for the hot endpoints"""
+    database = AsyncDatabase(flask_app)
+    max_upload = flask_app.config['MAX_CONTENT_LENGTH']
+    session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    session_cookie = flask_app.config['SESSION_COOKIE_NAME']
+
+    def too_large(request):
+        length = request.headers.get('content-length')
+        return length is not None and length.isdigit() and int(length) > max_upload
+
+    async def read_form(request):
+        return await request.form(max_part_size=max_upload)
+
+    def get_user_id(request):
+        """Same session-based user ID as the Flask app (reads/writes Flask's session cookie)"""
+        session = {}
+        cookie = request.cookies.get(session_cookie)
+        if cookie:
+            try:
+                session = session_serializer.loads(cookie)
+            except BadSignature:
+                session = {}
+        if 'user_id' in session:
+            return session['user_id'], None
+        session['user_id'] = int(time.time() * 1000) % 1000000  # Simple session ID
+        return session['user_id'], session_serializer.dumps(session)
+
+    def with_vision_headers(response):
+        image_stats = g.get('image_stats')
+        if image_stats:
+            response.headers['X-Image-Bytes-Original'] = str(image_stats['original_bytes'])
+            response.headers['X-Image-Bytes-Sent'] = str(image_stats['sent_bytes'])
+            response.headers['X-Image-Detail'] = image_stats['detail']
+        model_tier = g.get('model_tier')
+        if model_tier:
+            response.headers['X-Model-Tier'] = model_tier['model']
+            response.headers['X-Model-Escalated'] = str(model_tier['escalated']).lower()
+        return response
+
+    def upstream_busy_response(error):
+        return JSONResponse({"error": str(error), "retry_after": error.retry_after}, status_code=503,
+                            headers={'Retry-After': str(max(1, math.ceil(error.retry_after)))})
+
+    async def credits_exhausted_response(error, user_id):
+        balance = await asyncio.to_thread(get_credit_service().balance, error.kind, user_id)
+        return JSONResponse({"error": str(error), "credits": balance,
+                             "price_per_analysis": get_credit_service().price_per_analysis}, status_code=402)
+
+    def handler(endpoint):
+        """Run an async handler in a Flask app context, with the metrics the Flask hooks record"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(request):
+                with flask_app.app_context():
+                    g.metrics_endpoint = endpoint
+                    started = time.perf_counter()
+                    response = await fn(request)
+                    get_metrics().request_seconds.observe(
+                        time.perf_counter() - started,
+                        endpoint=endpoint,
+                        method=request.method,
+                        status=response.status_code
+                    )
+                    return with_vision_headers(response)
+            return wrapper
+        return decorator
+
+    @handler('asgi.generate_plant_info')
+    async def generate_plant_info(request):
+        """Async version of /api/train-plant/generate"""
+        try:
+            clean_key = get_openai_key()
+            if not clean_key:
+                return JSONResponse({"error": "OpenAI API key not configured"}, status_code=500)
+            if too_large(request):
+                return JSONResponse({"error": "Upload too large"}, status_code=413)
+
+            form = await read_form(request)
+            file = form.get('image')
+            if not isinstance(file, UploadFile):
+                return JSONResponse({"error": "No image file provided"}, status_code=400)
+            if not file.filename:
+                return JSONResponse({"error": "No image file selected"}, status_code=400)
+
+            with timed_stage('upload_read'):
+                image = await asyncio.to_thread(spool_upload, file.file)
+            plant_name_hint = form.get('plant_name', '')
+
+            print(f"🤖 Generating plant info with OpenAI (async)...")
+            result = await aroute_vision_json(
+                get_async_openai_client(clean_key),
+                image,
+                PLANT_INFO_SYSTEM_PROMPT,
+                build_plant_info_prompt(plant_name_hint),
+                PLANT_INFO_REQUIRED_FIELDS,
+                temperature=0.3,
+                max_tokens=1500
+            )
+            print(f"✅ Plant info generated successfully")
+            return JSONResponse(normalize_plant_info(result))
+        except UploadRejected as e:
+            record_error(e)
+            return JSONResponse({"error": str(e)}, status_code=e.status)
+        except UpstreamBusy as e:
+            record_error(e)
+            print(f"⏳ OpenAI busy, shedding generate_plant_info (async): {str(e)}")
+            return upstream_busy_response(e)
+        except Exception as e:
+            record_error(e)
+            print(f"Error in generate_plant_info (async): {str(e)}")
+            traceback.print_exc()
+            return JSONResponse({"error": f"Failed to generate plant information: {str(e)}"}, status_code=500)
+
+    @handler('asgi.ai_recognition')
+    async def ai_recognition(request):
+        """Async version of /api/ai-recognition"""
+        user_id, new_session_cookie = get_user_id(request)
+        response = await recognition_response(request, user_id)
+        if new_session_cookie:  # credits are tracked per session user, so keep the client on this one
+            response.set_cookie(session_cookie, new_session_cookie, httponly=True, path='/')
+        return response
+
+    async def recognition_response(request, user_id):
+        g.usage_user_id = user_id
+        reservation = None
+        try:
+            plant_id = get_plant_id_client()
+            clean_key = get_openai_key()
+            if not plant_id.configured and not clean_key:
+                return JSONResponse({"error": "Neither the Plant.id nor the OpenAI API key is configured"},
+                                    status_code=500)
+            if too_large(request):
+                return JSONResponse({"error": "Upload too large"}, status_code=413)
+
+            form = await read_form(request)
+            flag = request.query_params.get('analyze', form.get('analyze'))
+            analyze = flag is None or str(flag).strip().lower() not in ('0', 'false', 'no')
+            if not plant_id.configured and not analyze:
+                return JSONResponse({"error": "Plant.id API key not configured, so the GPT-4o analysis can't be skipped"},
+                                    status_code=400)
+            file = form.get('image')
+            if not isinstance(file, UploadFile):
+                return JSONResponse({"error": "No image file provided"}, status_code=400)
+            if not file.filename:
+                return JSONResponse({"error": "No image file selected"}, status_code=400)
+
+            with timed_stage('upload_read'):
+                image = await asyncio.to_thread(spool_upload, file.file)
+            client = None
+            if clean_key and analyze:
+                client = get_async_openai_client(clean_key).with_options(
+                    timeout=flask_app.config['AI_RECOGNITION_OPENAI_TIMEOUT'])
+
+            # One plant analysis is charged before the calls and refunded if neither answers
+            reservation = await asyncio.to_thread(get_credit_service().reserve, 'plant', user_id)
+            print(f"🔎 Recognizing plant with Plant.id and GPT-4o (async)...")
+            recognition = await arecognize(image, plant_id, client)
+            print(f"✅ Plant recognized ({recognition.reconciliation}, "
+                  f"Plant.id {recognition.plant_id_status}, GPT-4o {recognition.ai_analysis_status})")
+            if recognition.billable:
+                await asyncio.to_thread(reservation.keep)
+                reservation = None
+            return JSONResponse(recognition.to_dict())
+        except UploadRejected as e:
+            record_error(e)
+            return JSONResponse({"error": str(e)}, status_code=e.status)
+        except CreditsExhausted as e:
+            record_error(e)
+            return await credits_exhausted_response(e, user_id)
+        except RecognitionFailed as e:
+            record_error(e)
+            print(f"Error in ai_recognition (async): {str(e)}")
+            return JSONResponse({"error": str(e)}, status_code=502)
+        except Exception as e:
+            record_error(e)
+            print(f"Error in ai_recognition (async): {str(e)}")
+            traceback.print_exc()
+            return JSONResponse({"error": f"Failed to recognize plant: {str(e)}"}, status_code=500)
+        finally:
+            if reservation is not None:
+                await asyncio.to_thread(reservation.refund)
+
+    @handler('asgi.train_new_plant')
+    async def train_new_plant(request):
+        """Async version of /api/train-plant"""
+        image = None
+        try:
+            user_id, new_session_cookie = get_user_id(request)
+            g.usage_user_id = user_id
+            if too_large(request):
+                return JSONResponse({"error": "Upload too large"}, status_code=413)
+
+            # Handle both JSON and form data
+            file = None
+            if request.headers.get('content-type', '').startswith('application/json'):
+                data = await request.json()
+            else:
+                form = await read_form(request)
+                file = form.get('image')
+                data = {key: value for key, value in form.items() if not isinstance(value, UploadFile)}
+                # Parse JSON strings if present
+                if 'common_names' in data and isinstance(data['common_names'], str):
+                    try:
+                        data['common_names'] = json.loads(data['common_names'])
+                    except ValueError:
+                        pass
+
+            # Validate required fields
+            if 'plant_name' not in data or not data.get('plant_name'):
+                return JSONResponse({"error": "Missing required field: plant_name"}, status_code=400)
+
+            # Get image if provided
+            image_data = None
+            if isinstance(file, UploadFile):
+                if file.filename:
+                    with timed_stage('upload_read'):
+                        image = await asyncio.to_thread(spool_upload, file.file)
+            elif data.get('image_data'):
+                # Remove data URL prefix if present
+                image_data = data['image_data'].split(',')[-1]
+                try:
+                    image = await asyncio.to_thread(spool_base64, image_data)
+                    image_data = None
+                except ValueError:
+                    print(f"⚠️ Could not decode image_data, skipping AI enhancement")
+
+            image_phash = duplicate = None
+            if image:
+                image_phash, duplicate = await asyncio.to_thread(check_near_duplicate, image, data.get('plant_name'))
+            duplicate_of = duplicate.submission_id if duplicate is not None else None
+            reused = bool(image and needs_enhancement(data) and reuse_enhancement(data, duplicate))
+
+            clean_key = get_openai_key()
+            wants_enhancement = bool(image and clean_key and needs_enhancement(data))
+            async_flag = request.query_params.get('async', data.get('async'))
+            run_async = flask_app.config['TRAIN_PLANT_ASYNC'] if async_flag is None else is_truthy(async_flag)
+
+            run_async = wants_enhancement and run_async
+            message = "Plant training data submitted successfully. AI enhancement is running in the background."
+
+            if wants_enhancement and not run_async:
+                try:
+                    print(f"🤖 Enhancing training data with OpenAI (async)...")
+                    await aenhance_plant_data(get_async_openai_client(clean_key), data, image)
+                    print(f"✅ Training data enhanced with AI")
+                except UpstreamBusy as e:
+                    record_error(e)
+                    print(f"⏳ OpenAI busy, deferring enhancement to a background job: {str(e)}")
+                    run_async = True
+                    message = "Plant training data submitted successfully. OpenAI is busy, so AI enhancement will run in the background."
+                except Exception as e:
+                    record_error(e)
+                    print(f"⚠️ OpenAI enhancement failed (continuing with user data): {str(e)}")
+
+            if run_async:
+                # Async mode: store the submission now and enhance it in the background
+                submission = await asyncio.to_thread(build_submission, user_id, data, image, image_data,
+                                                     image_phash, duplicate)
+                submission_id, job = await database.save_submission(submission, with_job=True)
+                runner = get_job_runner()
+                if not runner.submit(job.job_id):
+                    print(f"⚠️ Enhancement queue full, job {job.job_id} will be picked up by the sweeper")
+                response = JSONResponse({
+                    "success": True,
+                    "message": message,
+                    "submission_id": submission_id,
+                    "duplicate_of": duplicate_of,
+                    "job_id": job.job_id,
+                    "status": job.status,
+                    "status_url": f"/api/train-plant/jobs/{job.job_id}"
+                }, status_code=202)
+            else:
+                submission = await asyncio.to_thread(build_submission, user_id, data, image, image_data,
+                                                     image_phash, duplicate)
+                submission_id, _ = await database.save_submission(submission)
+                response = JSONResponse({
+                    "success": True,
+                    "message": "Plant training data submitted successfully. Thank you for contributing! Our team will review and add it to the system.",
+                    "submission_id": submission_id,
+                    "duplicate_of": duplicate_of,
+                    "reused_enhancement": reused
+                })
+
+            if new_session_cookie:
+                response.set_cookie(session_cookie, new_session_cookie, httponly=True, path='/')
+            return response
+        except UploadRejected as e:
+            record_error(e)
+            return JSONResponse({"error": str(e)}, status_code=e.status)
+        except Exception as e:
+            record_error(e)
+            print(f"Error in train_new_plant (async): {str(e)}")
+            traceback.print_exc()
+            return JSONResponse({"error": f"Internal server error: {str(e)}"}, status_code=500)
+        finally:
+            if image is not None:
+                image.close()  # removes the spooled temp file
+
+    @handler('asgi.health_check')
+    async def health_check(request):
+        return JSONResponse(build_health_status())
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await flask_app.extensions['openai_clients'].aclose()
+        await flask_app.extensions['plant_id'].aclose()
+        await database.dispose()
+
+    return Starlette(
+        routes=[
+            Route('/api/train-plant/generate', generate_plant_info, methods=['POST']),
+            Route('/api/train-plant', train_new_plant, methods=['POST']),
+            Route('/api/ai-recognition', ai_recognition, methods=['POST']),
+            Route('/api/health', health_check, methods=['GET']),
+            Mount('/', app=WSGIMiddleware(flask_app)),
+        ],
+        middleware=[
+            # CORS configuration - allow all origins for development (same as app.py)
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        ],
+        lifespan=lifespan,
+    )
@@ -0,0 +1,53 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+
+
+class BatchItemTimeout(Exception):
+    pass
+
+
+def run_batch(app, items, fn, concurrency=4, item_timeout=60.0):
+    """
+    Run fn(item) for every item on a bounded thread pool, each call inside an app context.
+    Yields (index, result, error) in completion order; an item that raises or runs longer
+    than item_timeout seconds yields its error instead of failing the whole batch.
+    """
+    if not items:
+        return
+
+    started = {}
+    lock = threading.Lock()
+
+    def run(index, item):
+        with lock:
+            started[index] = time.monotonic()
+        with app.app_context():
+            return fn(item)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items))),
+                                  thread_name_prefix='batch-item')
+    try:
+        pending = {executor.submit(run, index, item): index for index, item in enumerate(items)}
+        while pending:
+            done, _ = wait(pending, timeout=min(1.0, item_timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+
+            # Running items past their deadline are reported now; the worker thread
+            # finishes on its own (the OpenAI client timeout bounds how long)
+            now = time.monotonic()
+            with lock:
+                expired = [future for future, index in pending.items()
+                           if index in started and now - started[index] > item_timeout]
+            for future in expired:
+                index = pending.pop(future)
+                future.cancel()
+                yield index, None, BatchItemTimeout(f"Timed out after {item_timeout:g}s")
+    finally:
+        # Also runs when the client disconnects mid-stream: drop items not yet started
+        executor.shutdown(wait=False, cancel_futures=True)
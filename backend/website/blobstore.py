@@ -0,0 +1,139 @@
+from flask import current_app
+from website.imaging import ImageSource
+import base64
+import hashlib
+import os
+import re
+import tempfile
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+CHUNK_SIZE = 1024 * 1024
+
+
+class LocalBlobStore:
+    """
+    Content-addressed blob store on the local filesystem.
+    Blobs are named by their SHA-256 digest and fanned out as ab/cd/<digest>,
+    so identical uploads are stored once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, digest):
+        if not DIGEST_RE.match(digest or ''):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put(self, data):
+        """Store bytes, returns (digest, size)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            self._write_atomic(path, lambda f: f.write(data))
+        return digest, len(data)
+
+    def put_file(self, fileobj):
+        """Store a file-like object without loading it into memory, returns (digest, size)"""
+        hasher = hashlib.sha256()
+        size = 0
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            path = self.path_for(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_atomic(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                write(tmp)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, digest):
+        return open(self.path_for(digest), 'rb')
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def local_path(self, digest):
+        """Filesystem path for zero-copy serving (sendfile); None for remote backends"""
+        return self.path_for(digest)
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path_for(digest))
+        except FileNotFoundError:
+            pass
+
+
+# Additional backends (e.g. S3) register here under the BLOB_STORE name
+BLOB_STORES = {
+    'local': LocalBlobStore,
+}
+
+
+def create_blob_store(config):
+    backend = config['BLOB_STORE']
+    if backend not in BLOB_STORES:
+        raise ValueError(f"Unknown BLOB_STORE '{backend}', expected one of: {', '.join(BLOB_STORES)}")
+    return BLOB_STORES[backend](config['BLOB_STORE_PATH'])
+
+
+def get_blob_store():
+    return current_app.extensions['blob_store']
+
+
+def iter_blob(store, digest):
+    """Stream a blob in chunks (for backends without a local path)"""
+    with store.open(digest) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def load_submission_image(submission):
+    """
+    A submission's image as an ImageSource, from the blob store or the legacy
+    base64 column. Local blobs are read from disk in chunks, not loaded up front.
+    """
+    if submission.image_digest:
+        store = get_blob_store()
+        path = store.local_path(submission.image_digest)
+        if not path:
+            return ImageSource(store.read(submission.image_digest))
+        mime_type = submission.image_mime if (submission.image_mime or '').startswith('image/') else None
+        return ImageSource(path=path, size=os.path.getsize(path), digest=submission.image_digest, mime_type=mime_type)
+    if submission.image_data:
+        return ImageSource(base64.b64decode(submission.image_data))
+    return None
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.orm import Session
+from website import db
+from website.models import OpenAIResponseCache
+import hashlib
+import json
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for OpenAI vision responses.
+    Tier 1 is a per-process LRU bounded by entry count and TTL.
+    Tier 2 (optional) is the app database, shared by every worker.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, persistent=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent = persistent
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, json text)
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'persistent_errors': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a cache from Flask app config"""
+        return cls(
+            max_entries=config['OPENAI_CACHE_MAX_ENTRIES'],
+            ttl=config['OPENAI_CACHE_TTL'],
+            persistent=config['OPENAI_CACHE_PERSISTENT'],
+        )
+
+    @staticmethod
+    def make_key(image_bytes, prompt, model, params=None, image_digest=None):
+        """
+        SHA-256 over the image bytes plus everything that shapes the answer.
+        Pass image_digest (hex SHA-256) instead of the bytes when it's already known.
+        """
+        digest = hashlib.sha256()
+        if image_digest is not None:
+            digest.update(bytes.fromhex(image_digest))
+        else:
+            digest.update(hashlib.sha256(image_bytes or b'').digest())
+        digest.update(json.dumps({
+            'prompt': prompt,
+            'model': model,
+            'params': params or {},
+        }, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return json.loads(text)
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        if self.persistent:
+            text = self._persistent_get(key)
+            if text is not None:
+                self._remember(key, text)
+                self._count('hits')
+                self._count('persistent_hits')
+                return json.loads(text)
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, model=None):
+        """Store a JSON-serialisable value in every enabled tier"""
+        text = json.dumps(value)
+        self._remember(key, text)
+        self._count('sets')
+        if self.persistent:
+            self._persistent_set(key, text, model)
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _persistent_get(self, key):
+        try:
+            with Session(db.engine) as session:
+                row = session.get(OpenAIResponseCache, key)
+                if row is None:
+                    return None
+                if row.expires_at and row.expires_at <= datetime.utcnow():
+                    session.delete(row)
+                    session.commit()
+                    self._count('expirations')
+                    return None
+                return row.response
+        except Exception as e:
+            print(f"⚠️ Response cache read failed: {str(e)}")
+            self._count('persistent_errors')
+            return None
+
+    def _persistent_set(self, key, text, model):
+        try:
+            with Session(db.engine) as session:
+                now = datetime.utcnow()
+                session.merge(OpenAIResponseCache(
+                    cache_key=key,
+                    model=model,
+                    response=text,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                ))
+                session.commit()
+        except Exception as e:
+            print(f"⚠️ Response cache write failed: {str(e)}")
+            self._count('persistent_errors')
+
+    def purge_expired(self):
+        """Drop expired entries from both tiers, returns number removed"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self._stats['expirations'] += len(expired)
+        removed = len(expired)
+
+        if self.persistent:
+            try:
+                with Session(db.engine) as session:
+                    removed += session.query(OpenAIResponseCache).filter(
+                        OpenAIResponseCache.expires_at <= datetime.utcnow()
+                    ).delete(synchronize_session=False)
+                    session.commit()
+            except Exception as e:
+                print(f"⚠️ Response cache purge failed: {str(e)}")
+                self._count('persistent_errors')
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['persistent'] = self.persistent
+        return stats
+
+
+def get_response_cache():
+    return current_app.extensions['openai_cache']
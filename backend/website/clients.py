@@ -0,0 +1,333 @@
+from flask import current_app
+from openai import AsyncOpenAI, OpenAI
+from openai.types.chat import ChatCompletion
+import asyncio
+import httpx
+import json
+import openai
+import os
+import threading
+
+# Same mapping the SDK uses, so retries and error handling don't care which path sent a request
+STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    401: openai.AuthenticationError,
+    403: openai.PermissionDeniedError,
+    404: openai.NotFoundError,
+    409: openai.ConflictError,
+    422: openai.UnprocessableEntityError,
+    429: openai.RateLimitError,
+}
+
+
+class OpenAIClientRegistry:
+    """
+    Process-wide registry of OpenAI clients that share one pooled httpx client.
+    Keeps TCP/TLS connections alive between requests instead of opening a new
+    connection (and leaking a pool) for every API call.
+    """
+
+    def __init__(self, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=30.0, connect_timeout=5.0, read_timeout=60.0,
+                 http2=False, max_retries=2, async_max_connections=200):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self.max_retries = max_retries
+        self.async_max_connections = async_max_connections
+
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._clients = {}
+        self._pid = None
+        self._async_http_client = None
+        self._async_clients = {}
+        self._async_loop = None
+        self._stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'tls_handshakes': 0,
+            'clients_created': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a registry from Flask app config"""
+        return cls(
+            max_connections=config['OPENAI_POOL_MAX_CONNECTIONS'],
+            max_keepalive_connections=config['OPENAI_POOL_MAX_KEEPALIVE'],
+            keepalive_expiry=config['OPENAI_POOL_KEEPALIVE_EXPIRY'],
+            connect_timeout=config['OPENAI_CONNECT_TIMEOUT'],
+            read_timeout=config['OPENAI_READ_TIMEOUT'],
+            http2=config['OPENAI_HTTP2'],
+            max_retries=0,  # retries go through UpstreamRateLimiter (shared budget, Retry-After aware)
+            async_max_connections=config['OPENAI_ASYNC_MAX_CONNECTIONS'],
+        )
+
+    @property
+    def timeout(self):
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def _trace(self, event_name, info):
+        """httpcore trace hook - counts connections actually opened"""
+        if event_name == 'connection.connect_tcp.complete':
+            with self._lock:
+                self._stats['new_connections'] += 1
+        elif event_name == 'connection.start_tls.complete':
+            with self._lock:
+                self._stats['tls_handshakes'] += 1
+
+    async def _async_trace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def _on_request(self, request):
+        request.extensions['trace'] = self._trace
+        with self._lock:
+            self._stats['requests'] += 1
+
+    async def _on_async_request(self, request):
+        request.extensions['trace'] = self._async_trace
+        with self._lock:
+            self._stats['requests'] += 1
+
+    def _use_http2(self):
+        if not self.http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("⚠️ OPENAI_HTTP2 is enabled but the 'h2' package is not installed - using HTTP/1.1")
+            return False
+        return True
+
+    def _build_http_client(self):
+        return httpx.Client(
+            http2=self._use_http2(),
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={'request': [self._on_request]},
+        )
+
+    def _build_async_http_client(self):
+        # One event loop multiplexes many in-flight calls, so the async pool is larger
+        return httpx.AsyncClient(
+            http2=self._use_http2(),
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.async_max_connections,
+                max_keepalive_connections=self.async_max_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={'request': [self._on_async_request]},
+        )
+
+    @property
+    def http_client(self):
+        """Shared httpx client, rebuilt after a fork so workers never share sockets"""
+        with self._lock:
+            if self._http_client is None or self._pid != os.getpid():
+                self._http_client = self._build_http_client()
+                self._clients = {}
+                self._pid = os.getpid()
+            return self._http_client
+
+    def get_client(self, api_key):
+        """Return the OpenAI client for an API key, creating it on first use"""
+        http_client = self.http_client
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    http_client=http_client,
+                    timeout=self.timeout,
+                    max_retries=self.max_retries,
+                )
+                self._clients[api_key] = client
+                self._stats['clients_created'] += 1
+            return client
+
+    def _ensure_async_http_client(self):
+        # Called with self._lock held
+        loop = asyncio.get_running_loop()
+        if self._async_http_client is None or self._async_loop is not loop:
+            self._async_http_client = self._build_async_http_client()
+            self._async_clients = {}
+            self._async_loop = loop
+        return self._async_http_client
+
+    def async_http_client(self):
+        """Shared httpx.AsyncClient of the running event loop"""
+        with self._lock:
+            return self._ensure_async_http_client()
+
+    def get_async_client(self, api_key):
+        """Return the AsyncOpenAI client for an API key on the running event loop"""
+        with self._lock:
+            self._ensure_async_http_client()
+            client = self._async_clients.get(api_key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=self._async_http_client,
+                    timeout=self.timeout,
+                    max_retries=self.max_retries,
+                )
+                self._async_clients[api_key] = client
+                self._stats['clients_created'] += 1
+            return client
+
+    async def aclose(self):
+        """Close the async pool (call from the event loop that owns it)"""
+        with self._lock:
+            http_client = self._async_http_client
+            self._async_http_client = None
+            self._async_clients = {}
+            self._async_loop = None
+        if http_client is not None:
+            await http_client.aclose()
+
+    def close(self):
+        """Close pooled connections (safe to call more than once)"""
+        with self._lock:
+            if self._http_client is not None and self._pid == os.getpid():
+                self._http_client.close()
+            self._http_client = None
+            self._clients = {}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pool_hits'] = max(stats['requests'] - stats['new_connections'], 0)
+        stats['http2'] = self.http2
+        stats['max_connections'] = self.max_connections
+        stats['max_keepalive_connections'] = self.max_keepalive_connections
+        return stats
+
+
+def get_openai_key():
+    """Return the cleaned OPENAI_API_KEY, or None if it is missing or malformed"""
+    openai_key = os.getenv('OPENAI_API_KEY')
+    if not openai_key:
+        return None
+    clean_key = openai_key.strip().strip('"').strip("'")
+    return clean_key if clean_key.startswith('sk-') else None
+
+
+def get_openai_registry():
+    return current_app.extensions['openai_clients']
+
+
+def get_openai_client(api_key):
+    """Get a pooled OpenAI client from the current app's registry"""
+    return get_openai_registry().get_client(api_key)
+
+
+def get_async_openai_client(api_key):
+    """Get a pooled AsyncOpenAI client from the current app's registry"""
+    return get_openai_registry().get_async_client(api_key)
+
+
+class StreamedJSONBody:
+    """
+    JSON request body whose one large string (an image data URL) is streamed
+    from chunks instead of being built in memory. `chunks` is called again for
+    every attempt, so retries re-read the image rather than buffering it.
+    """
+
+    def __init__(self, payload, placeholder, chunks, length):
+        prefix, suffix = json.dumps(payload).split(json.dumps(placeholder), 1)
+        self.prefix = (prefix + '"').encode('utf-8')
+        self.suffix = ('"' + suffix).encode('utf-8')
+        self.chunks = chunks
+        self.content_length = len(self.prefix) + length + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        yield from self.chunks()
+        yield self.suffix
+
+    async def aiter(self):
+        for chunk in self:
+            yield chunk
+
+
+def streamed_request_options(client, body):
+    """
+    URL, headers and timeout for sending a StreamedJSONBody with an SDK
+    client's settings, built from its public api_key / organization / project
+    / base_url / timeout. No SDK retries are lost: they are off (max_retries=0)
+    and UpstreamRateLimiter retries every path.
+    """
+    headers = {
+        'Authorization': f'Bearer {client.api_key}',
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Content-Length': str(body.content_length),  # known up front, so no chunked encoding
+    }
+    if client.organization:
+        headers['OpenAI-Organization'] = client.organization
+    if getattr(client, 'project', None):
+        headers['OpenAI-Project'] = client.project
+    return {
+        'url': str(client.base_url).rstrip('/') + '/chat/completions',
+        'headers': headers,
+        'timeout': client.timeout,
+    }
+
+
+def status_error(response):
+    """The openai exception the SDK would have raised for an error response"""
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    data = body.get('error', body) if isinstance(body, dict) else body
+    message = f"Error code: {response.status_code} - {body}"
+    error_class = STATUS_ERRORS.get(response.status_code)
+    if error_class is None:
+        error_class = openai.InternalServerError if response.status_code >= 500 else openai.APIStatusError
+    return error_class(message, response=response, body=data)
+
+
+def parse_chat_completion(response):
+    if response.is_error:
+        raise status_error(response)
+    return ChatCompletion.model_validate(response.json())
+
+
+def create_chat_completion_streamed(client, body):
+    """
+    POST a StreamedJSONBody to /chat/completions on the registry's pooled
+    httpx client and return a ChatCompletion (the SDK only accepts in-memory bodies).
+    """
+    options = streamed_request_options(client, body)
+    try:
+        response = get_openai_registry().http_client.post(options['url'], content=iter(body),
+                                                          headers=options['headers'], timeout=options['timeout'])
+    except httpx.TimeoutException as e:
+        raise openai.APITimeoutError(request=e.request) from e
+    except httpx.TransportError as e:
+        raise openai.APIConnectionError(request=e.request) from e
+    return parse_chat_completion(response)
+
+
+async def acreate_chat_completion_streamed(client, body):
+    """asyncio version of create_chat_completion_streamed (client is an AsyncOpenAI)"""
+    options = streamed_request_options(client, body)
+    try:
+        response = await get_openai_registry().async_http_client().post(
+            options['url'], content=body.aiter(), headers=options['headers'], timeout=options['timeout']
+        )
+    except httpx.TimeoutException as e:
+        raise openai.APITimeoutError(request=e.request) from e
+    except httpx.TransportError as e:
+        raise openai.APIConnectionError(request=e.request) from e
+    return parse_chat_completion(response)
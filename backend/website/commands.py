@@ -0,0 +1,126 @@
+from website import db
+from website.blobstore import get_blob_store, load_submission_image
+from website.imaging import detect_mime, perceptual_hash
+from website.models import PlantTrainingSubmission
+from website.rollups import get_usage_rollups
+from website.schema import add_missing_columns, migrate_database
+from datetime import datetime
+import base64
+import click
+
+
+@click.command('migrate-db')
+def migrate_db_command():
+    """Create missing tables, columns and indexes (create_app() does this too unless DB_AUTO_MIGRATE=false)"""
+    added = migrate_database()
+    print(f"✅ Database schema up to date ({len(added)} columns/indexes added)")
+
+
+@click.command('migrate-image-blobs')
+@click.option('--batch-size', default=100, show_default=True, help='Rows committed per batch')
+@click.option('--keep-inline', is_flag=True, help='Keep the base64 image_data after copying it')
+def migrate_image_blobs_command(batch_size, keep_inline):
+    """Move base64 image_data of training submissions into the blob store"""
+    db.create_all()
+    add_missing_columns()
+    store = get_blob_store()
+    
+    migrated = failed = 0
+    bytes_before = bytes_after = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(PlantTrainingSubmission).filter(
+            PlantTrainingSubmission.submission_id > last_id,
+            PlantTrainingSubmission.image_data.isnot(None),
+            PlantTrainingSubmission.image_digest.is_(None)
+        ).order_by(PlantTrainingSubmission.submission_id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        for submission in rows:
+            last_id = submission.submission_id
+            try:
+                image_bytes = base64.b64decode(submission.image_data.split(',')[-1])
+            except ValueError as e:
+                print(f"⚠️ Submission {submission.submission_id}: invalid base64 ({str(e)})")
+                failed += 1
+                continue
+            
+            digest, size = store.put(image_bytes)
+            bytes_before += len(submission.image_data)
+            bytes_after += size
+            submission.image_digest = digest
+            submission.image_size = size
+            submission.image_mime = detect_mime(image_bytes) or 'application/octet-stream'
+            if not keep_inline:
+                submission.image_data = None
+            migrated += 1
+        
+        db.session.commit()
+        print(f"   ... migrated {migrated} images (up to submission {last_id})")
+    
+    print(f"✅ Migrated {migrated} images to the blob store, {failed} failed "
+          f"({bytes_before:,} base64 bytes → {bytes_after:,} raw bytes)")
+
+
+@click.command('backfill-phash')
+@click.option('--batch-size', default=100, show_default=True, help='Rows committed per batch')
+def backfill_phash_command(batch_size):
+    """Compute perceptual hashes for training submissions stored before near-duplicate detection"""
+    db.create_all()
+    add_missing_columns()
+    
+    hashed = failed = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(PlantTrainingSubmission).filter(
+            PlantTrainingSubmission.submission_id > last_id,
+            PlantTrainingSubmission.image_phash.is_(None),
+            (PlantTrainingSubmission.image_digest.isnot(None)) | (PlantTrainingSubmission.image_data.isnot(None))
+        ).order_by(PlantTrainingSubmission.submission_id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        for submission in rows:
+            last_id = submission.submission_id
+            try:
+                image = load_submission_image(submission)
+                submission.image_phash = perceptual_hash(image) if image is not None else None
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Submission {submission.submission_id}: could not load image ({str(e)})")
+            if submission.image_phash:
+                hashed += 1
+            else:
+                failed += 1
+        
+        db.session.commit()
+        print(f"   ... hashed {hashed} images (up to submission {last_id})")
+    
+    print(f"✅ Hashed {hashed} images, {failed} could not be decoded")
+
+
+@click.command('refresh-usage-rollups')
+def refresh_usage_rollups_command():
+    """Roll up AI usage recorded since the last refresh into the hourly/daily report tables"""
+    db.create_all()
+    counted = get_usage_rollups().refresh()
+    state = get_usage_rollups().state()
+    print(f"✅ Rolled up {counted} usage rows (up to usage row {state['last_usage_id']})")
+
+
+@click.command('rebuild-usage-rollups')
+@click.option('--from', 'start', required=True, type=click.DateTime(), help='First day to rebuild')
+@click.option('--to', 'end', type=click.DateTime(), help='Rebuild up to (not including) this time [default: now]')
+def rebuild_usage_rollups_command(start, end):
+    """Recompute the usage rollups for a date range from AIUsageTracking (safe to re-run)"""
+    db.create_all()
+    result = get_usage_rollups().rebuild(start, end or datetime.utcnow())
+    print(f"✅ Rebuilt usage rollups for {result['days']} day(s) from {result['usage_rows']} usage rows")
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(migrate_image_blobs_command)
+    app.cli.add_command(backfill_phash_command)
+    app.cli.add_command(refresh_usage_rollups_command)
+    app.cli.add_command(rebuild_usage_rollups_command)
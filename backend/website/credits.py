@@ -0,0 +1,154 @@
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from website import db
+from website.models import AIAnalysisUsage, SoilAnalysisUsage
+from website.usage import record_analysis_charge
+from contextlib import contextmanager
+from datetime import datetime
+
+CREDIT_MODELS = {
+    'plant': AIAnalysisUsage,
+    'soil': SoilAnalysisUsage,
+}
+
+
+class CreditsExhausted(Exception):
+    """The user has no free analyses or purchased credits left (HTTP 402)"""
+
+    def __init__(self, kind, free_limit):
+        super().__init__(f"No {kind} analyses left: all {free_limit} free analyses are used "
+                         f"and there are no purchased credits")
+        self.kind = kind
+        self.free_limit = free_limit
+
+
+class Reservation:
+    """
+    One analysis charged ahead of the upstream call: keep() records the charge
+    once the analysis went ahead, refund() gives it back if the call fails
+    """
+
+    def __init__(self, service, kind, user_id, source):
+        self.service = service
+        self.kind = kind
+        self.user_id = user_id
+        self.source = source  # 'free' or 'purchased'
+        self.refunded = False
+        self.kept = False
+
+    @property
+    def cost(self):
+        return self.service.price_per_analysis if self.source == 'purchased' else 0.0
+
+    def keep(self):
+        if not self.kept and not self.refunded:
+            self.kept = True
+            record_analysis_charge(self)
+
+    def refund(self):
+        if not self.refunded and not self.kept:
+            self.refunded = True
+            self.service.refund(self)
+
+
+class CreditService:
+    """
+    Per-user analysis credits on AIAnalysisUsage (plant) and SoilAnalysisUsage
+    (soil). Every check-and-decrement is a single conditional UPDATE in its own
+    short transaction, so concurrent requests can't overspend and never hold a
+    lock across the upstream call: free analyses are used first, then purchased
+    credits.
+    """
+
+    def __init__(self, free_basic=5, free_premium=10, price_per_analysis=20.0):
+        self.free_basic = free_basic
+        self.free_premium = free_premium
+        self.price_per_analysis = price_per_analysis
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        return cls(free_basic=config['FREE_ANALYSES_BASIC'], free_premium=config['FREE_ANALYSES_PREMIUM'],
+                   price_per_analysis=config['PRICE_PER_ANALYSIS'])
+
+    def free_limit(self, premium=False):
+        return self.free_premium if premium else self.free_basic
+
+    def reserve(self, kind, user_id, premium=False):
+        """Charge one analysis before calling upstream, returns a Reservation; raises CreditsExhausted"""
+        model = CREDIT_MODELS[kind]
+        free_limit = self.free_limit(premium)
+        with Session(db.engine) as usage_session:
+            for _ in range(2):
+                used_free = usage_session.execute(
+                    update(model).where(model.user_id == user_id, model.free_analyses_used < free_limit)
+                    .values(free_analyses_used=model.free_analyses_used + 1, updated_at=datetime.utcnow())
+                ).rowcount
+                if used_free:
+                    usage_session.commit()
+                    return Reservation(self, kind, user_id, 'free')
+                used_purchased = usage_session.execute(
+                    update(model).where(model.user_id == user_id, model.purchased_credits > 0)
+                    .values(purchased_credits=model.purchased_credits - 1, updated_at=datetime.utcnow())
+                ).rowcount
+                if used_purchased:
+                    usage_session.commit()
+                    return Reservation(self, kind, user_id, 'purchased')
+
+                # First analysis for this user: create their row (a concurrent request may beat us to it)
+                usage_session.rollback()
+                if usage_session.execute(select(model.user_id).where(model.user_id == user_id)).first():
+                    break
+                try:
+                    usage_session.add(model(user_id=user_id, free_analyses_used=0, purchased_credits=0))
+                    usage_session.commit()
+                except IntegrityError:
+                    usage_session.rollback()
+        raise CreditsExhausted(kind, free_limit)
+
+    @contextmanager
+    def charge(self, kind, user_id, premium=False):
+        """with credits.charge('plant', user_id): call upstream - refunded if the block raises"""
+        reservation = self.reserve(kind, user_id, premium)
+        try:
+            yield reservation
+        except BaseException:
+            reservation.refund()
+            raise
+
+    def refund(self, reservation):
+        """Give back a reserved analysis after the upstream call failed"""
+        model = CREDIT_MODELS[reservation.kind]
+        if reservation.source == 'free':
+            statement = update(model).where(model.user_id == reservation.user_id, model.free_analyses_used > 0) \
+                .values(free_analyses_used=model.free_analyses_used - 1, updated_at=datetime.utcnow())
+        else:
+            statement = update(model).where(model.user_id == reservation.user_id) \
+                .values(purchased_credits=model.purchased_credits + 1, updated_at=datetime.utcnow())
+        try:
+            with Session(db.engine) as usage_session:
+                usage_session.execute(statement)
+                usage_session.commit()
+        except Exception as e:
+            print(f"⚠️ Could not refund {reservation.kind} analysis for user {reservation.user_id}: {str(e)}")
+
+    def balance(self, kind, user_id, premium=False):
+        model = CREDIT_MODELS[kind]
+        free_limit = self.free_limit(premium)
+        with Session(db.engine) as usage_session:
+            row = usage_session.execute(
+                select(model.free_analyses_used, model.purchased_credits).where(model.user_id == user_id)
+            ).first()
+        free_used, purchased = (row[0] or 0, row[1] or 0) if row else (0, 0)
+        return {
+            'free_limit': free_limit,
+            'free_used': free_used,
+            'free_remaining': max(0, free_limit - free_used),
+            'purchased_credits': purchased,
+        }
+
+
+def get_credit_service():
+    return current_app.extensions['credits']
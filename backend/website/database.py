@@ -0,0 +1,84 @@
+"""
+Database engine tuning, applied by create_app() (and the ASGI async engine).
+
+SQLite runs in WAL mode with synchronous=NORMAL, so readers don't block the
+writer and a commit appends to the WAL instead of fsyncing the database file.
+A busy timeout makes concurrent writers queue for the lock rather than fail
+with "database is locked". The pragmas are set on every new connection.
+
+Server databases (Postgres, MySQL) get a bounded, pre-pinged connection pool
+and a per-statement timeout, so one slow query can't hold a worker forever.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Hosting providers (Render, Heroku) hand out postgres:// URLs, which SQLAlchemy no longer accepts
+LEGACY_URL_PREFIXES = {
+    'postgres://': 'postgresql://',
+}
+
+
+def normalize_database_url(database_url):
+    for prefix, replacement in LEGACY_URL_PREFIXES.items():
+        if database_url.startswith(prefix):
+            return replacement + database_url[len(prefix):]
+    return database_url
+
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(database_url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS (or create_async_engine kwargs) for this database"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if not config['DB_TUNING'] or backend == 'sqlite':
+        return {}  # SQLite is tuned with pragmas, see install_sqlite_pragmas
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    statement_timeout = config['DB_STATEMENT_TIMEOUT']
+    if statement_timeout > 0:
+        if backend == 'postgresql' and url.get_driver_name() == 'asyncpg':
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+        elif backend == 'postgresql':
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+        elif backend in ('mysql', 'mariadb'):
+            options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={statement_timeout}'}
+    return options
+
+
+def sqlite_pragmas(config):
+    """(pragma, value) pairs run on each new SQLite connection"""
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('cache_size', -config['SQLITE_CACHE_SIZE']),  # negative = KiB rather than pages
+    ]
+
+
+def install_sqlite_pragmas(engine, config):
+    """Set the SQLite pragmas whenever the engine opens a connection (no-op for other databases)"""
+    if not config['DB_TUNING'] or engine.dialect.name != 'sqlite' or is_memory_sqlite(engine.url):
+        return False
+    pragmas = sqlite_pragmas(config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+    return True
+
@@ -0,0 +1,223 @@
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.orm import load_only
+from website import db
+from website.imaging import perceptual_hash
+from website.metrics import current_endpoint, get_metrics, timed_stage
+from website.models import PlantTrainingSubmission
+from website.vision import apply_enhancement, needs_enhancement
+import json
+import threading
+import time
+
+# Closest matches checked for an already-enhanced submission to reuse
+MAX_CANDIDATES = 20
+ENHANCED_FIELDS = ('scientific_name', 'common_names', 'plant_type', 'description', 'care_instructions')
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit perceptual hashes: every hash is filed under
+    each of its four 16-bit chunks. Two hashes within max_distance bits differ
+    by at most max_distance // 4 bits in at least one chunk (pigeonhole), so a
+    search only probes the buckets that close to the query's chunks.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.tables = [{} for _ in range(self.CHUNKS)]
+        self.hashes = {}  # item -> hash
+        chunk_distance = max(max_distance, 0) // self.CHUNKS
+        self.probes = [mask for mask in range(1 << self.CHUNK_BITS) if mask.bit_count() <= chunk_distance]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def chunks(self, value):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (self.CHUNK_BITS * i)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value, item):
+        self.hashes[item] = value
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            table.setdefault(chunk, []).append(item)
+
+    def search(self, value):
+        """[(distance, item)] within max_distance bits, closest first"""
+        seen = set()
+        results = []
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            for probe in self.probes:
+                for item in table.get(chunk ^ probe, ()):
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                    distance = (self.hashes[item] ^ value).bit_count()
+                    if distance <= self.max_distance:
+                        results.append((distance, item))
+        results.sort()
+        return results
+
+
+class NearDuplicateIndex:
+    """
+    In-memory multi-index hash of submission perceptual hashes. Built from the database
+    on first use, then topped up before every lookup with the submissions added
+    since (by any worker), found with a primary-key range scan. Hashes written
+    onto older rows (flask backfill-phash) aren't past that scan, so every
+    recount_interval seconds the hashed rows are counted and the index is
+    reloaded if it holds fewer.
+    """
+
+    def __init__(self, max_distance=10, recount_interval=60.0):
+        self.max_distance = max_distance
+        self.recount_interval = recount_interval
+        self.hashes = MultiIndexHash(max_distance)
+        self.last_id = 0
+        self.reloads = 0
+        self._last_recount = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        return cls(max_distance=config['NEAR_DUPLICATE_MAX_DISTANCE'],
+                   recount_interval=config['NEAR_DUPLICATE_RECOUNT_INTERVAL'])
+
+    @property
+    def enabled(self):
+        return self.max_distance >= 0
+
+    def hashed_rows(self, after_id=0):
+        return db.session.query(PlantTrainingSubmission.submission_id, PlantTrainingSubmission.image_phash).filter(
+            PlantTrainingSubmission.submission_id > after_id,
+            PlantTrainingSubmission.image_phash.isnot(None)
+        ).order_by(PlantTrainingSubmission.submission_id).all()
+
+    def refresh(self):
+        hashed = None
+        now = time.monotonic()
+        if self._last_recount is None or now - self._last_recount >= self.recount_interval:
+            self._last_recount = now
+            # Counted before the range scan, so rows inserted in between can't make the index look complete
+            hashed = db.session.query(func.count(PlantTrainingSubmission.image_phash)).scalar()
+
+        rows = self.hashed_rows(self.last_id)
+        with self._lock:
+            for submission_id, image_phash in rows:
+                if submission_id > self.last_id:
+                    self.hashes.add(int(image_phash, 16), submission_id)
+                    self.last_id = submission_id
+            stale = hashed is not None and hashed > len(self.hashes)
+        if stale:
+            self.reload()
+
+    def reload(self):
+        """Rebuild the index from every hashed submission"""
+        hashes = MultiIndexHash(self.max_distance)
+        last_id = 0
+        for submission_id, image_phash in self.hashed_rows():
+            hashes.add(int(image_phash, 16), submission_id)
+            last_id = submission_id
+        with self._lock:
+            self.hashes = hashes
+            self.last_id = last_id
+            self.reloads += 1
+        print(f"♻️ Reloaded the near-duplicate index: {len(hashes)} hashes (some were written onto older submissions)")
+
+    def search(self, image_phash):
+        """[(distance, submission_id)] within max_distance bits of the hash, closest first"""
+        self.refresh()
+        with self._lock:
+            return self.hashes.search(int(image_phash, 16))
+
+    def stats(self):
+        return {'hashes': len(self.hashes), 'last_submission_id': self.last_id, 'max_distance': self.max_distance,
+                'reloads': self.reloads}
+
+
+def get_duplicate_index():
+    return current_app.extensions['near_duplicates']
+
+
+def is_enhanced(submission):
+    return not needs_enhancement({field: getattr(submission, field) for field in ENHANCED_FIELDS})
+
+
+def find_near_duplicate(image_phash, exclude_id=None, plant_name=None):
+    """
+    The closest non-rejected submission whose image is a near-duplicate,
+    preferring one that's already enhanced and named plant_name. None if there isn't one.
+    """
+    index = get_duplicate_index()
+    if not image_phash or not index.enabled:
+        return None
+    with timed_stage('duplicate_lookup'):
+        matches = [submission_id for _, submission_id in index.search(image_phash)
+                   if submission_id != exclude_id][:MAX_CANDIDATES]
+        if not matches:
+            return None
+        candidates = {
+            submission.submission_id: submission
+            for submission in db.session.query(PlantTrainingSubmission).options(
+                load_only(*(getattr(PlantTrainingSubmission, field) for field in ('submission_id', 'status', 'plant_name') + ENHANCED_FIELDS))
+            ).filter(
+                PlantTrainingSubmission.submission_id.in_(matches),
+                or_(PlantTrainingSubmission.status.is_(None), PlantTrainingSubmission.status != 'rejected')
+            )
+        }
+    ordered = [candidates[submission_id] for submission_id in matches if submission_id in candidates]
+    enhanced = [submission for submission in ordered if is_enhanced(submission)]
+    for submission in enhanced:
+        if same_plant({'plant_name': plant_name}, submission):
+            return submission
+    return (enhanced or ordered or [None])[0]
+
+
+def normalize_plant_name(name):
+    """Case- and whitespace-insensitive plant name: "  Water  spinach" -> "water spinach" """
+    return ' '.join(str(name or '').casefold().split())
+
+
+def same_plant(data, duplicate):
+    """Whether a near-duplicate is of the plant the submitter named (an unnamed submission takes any)"""
+    name = normalize_plant_name(data.get('plant_name'))
+    return not name or name == normalize_plant_name(duplicate.plant_name)
+
+
+def check_near_duplicate(image, plant_name=None):
+    """Perceptual-hash an upload and look up its closest near-duplicate, returns (image_phash, duplicate)"""
+    with timed_stage('perceptual_hash'):
+        image_phash = perceptual_hash(image)
+    return image_phash, find_near_duplicate(image_phash, plant_name=plant_name)
+
+
+def reuse_enhancement(data, duplicate):
+    """
+    Fill a submission's missing fields from an already-enhanced near-duplicate
+    of the same named plant instead of asking OpenAI again (updates data in
+    place). Returns True if reused. Low-texture images hash alike, so a
+    near-duplicate named differently is only recorded, never copied from.
+    """
+    reused = duplicate is not None and is_enhanced(duplicate) and same_plant(data, duplicate)
+    if duplicate is not None:
+        get_metrics().near_duplicates.inc(endpoint=current_endpoint(), reused=str(reused).lower())
+    if not reused:
+        return False
+    common_names = duplicate.common_names
+    try:
+        common_names = json.loads(common_names) if common_names else []
+    except ValueError:
+        common_names = [name.strip() for name in common_names.split(',') if name.strip()]
+    apply_enhancement(data, {
+        'scientific_name': duplicate.scientific_name,
+        'common_names': common_names,
+        'plant_type': duplicate.plant_type,
+        'description': duplicate.description,
+        'care_instructions': duplicate.care_instructions,
+    })
+    print(f"♻️ Reused AI enhancement of near-duplicate submission {duplicate.submission_id}")
+    return True
@@ -0,0 +1,293 @@
+from contextlib import contextmanager
+from PIL import Image, ImageOps
+import base64
+import hashlib
+import io
+import math
+import numpy as np
+
+# Formats OpenAI vision accepts as-is
+PASSTHROUGH_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+}
+
+EXIF_ORIENTATION = 0x0112
+
+# Leading bytes of the image formats we accept
+MAGIC_NUMBERS = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+# Perceptual hash: low-frequency 8x8 DCT block of a 32x32 greyscale thumbnail
+PHASH_SIZE = 32
+PHASH_BLOCK = 8
+
+CHUNK_SIZE = 64 * 1024
+# base64 turns every 3 bytes into 4 characters, so chunks on a 3-byte boundary encode independently
+BASE64_CHUNK_SIZE = 3 * CHUNK_SIZE
+
+
+class ImageSource:
+    """
+    Image bytes held in memory or in a file (a spooled upload or a blob on disk).
+    File-backed sources are read in chunks, so a large upload is never copied
+    into memory just to be hashed, decoded or base64-encoded.
+    """
+
+    def __init__(self, data=None, fileobj=None, path=None, size=None, digest=None, mime_type=None, owns_file=False):
+        self._data = data
+        self._fileobj = fileobj
+        self.path = path
+        self.size = len(data) if data is not None else size
+        self._digest = digest
+        self.mime_type = mime_type
+        self.owns_file = owns_file
+        self.prepared = {}  # PreparedImage by preprocessing options
+
+    @classmethod
+    def coerce(cls, image):
+        """Accept an ImageSource or raw bytes"""
+        return image if isinstance(image, cls) else cls(image or b'')
+
+    @property
+    def in_memory(self):
+        return self._data is not None
+
+    @property
+    def digest(self):
+        """Hex SHA-256 of the image (computed on first use for in-memory bytes)"""
+        if self._digest is None:
+            hasher = hashlib.sha256()
+            for chunk in self.chunks():
+                hasher.update(chunk)
+            self._digest = hasher.hexdigest()
+        return self._digest
+
+    @contextmanager
+    def open(self):
+        """Binary file positioned at the start of the image"""
+        if self._data is not None:
+            yield io.BytesIO(self._data)
+        elif self._fileobj is not None:
+            self._fileobj.seek(0)
+            yield self._fileobj
+        else:
+            with open(self.path, 'rb') as f:
+                yield f
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        if self._data is not None:
+            yield self._data
+            return
+        with self.open() as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read(self):
+        if self._data is not None:
+            return self._data
+        with self.open() as f:
+            return f.read()
+
+    def base64_chunks(self):
+        """The image base64-encoded, a chunk at a time"""
+        for chunk in self.chunks(BASE64_CHUNK_SIZE):
+            yield base64.b64encode(chunk)
+
+    def base64_length(self):
+        return 4 * math.ceil(self.size / 3)
+
+    def close(self):
+        if self.owns_file and self._fileobj is not None:
+            self._fileobj.close()
+            self._fileobj = None
+
+
+class PreparedImage:
+    """An image ready to be sent to the vision API, plus before/after sizes"""
+
+    def __init__(self, source, mime_type, detail, original_bytes, width=None, height=None, reencoded=False):
+        self.source = ImageSource.coerce(source)
+        self.mime_type = mime_type
+        self.detail = detail
+        self.original_bytes = original_bytes
+        self.width = width
+        self.height = height
+        self.reencoded = reencoded
+
+    @property
+    def data(self):
+        return self.source.read()
+
+    @property
+    def sent_bytes(self):
+        return self.source.size
+
+    def input_tokens(self):
+        """Approximate vision input tokens: 85 base + 170 per 512px tile at high detail"""
+        if self.detail == 'low':
+            return 85
+        width, height = self.width or 2048, self.height or 2048
+        scale = min(1.0, 2048.0 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768.0 / min(width, height))
+        width, height = width * scale, height * scale
+        return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+    def data_url_prefix(self):
+        return f"data:{self.mime_type};base64,".encode('utf-8')
+
+    def data_url_chunks(self):
+        """The data URL a chunk at a time, for request bodies streamed from a file"""
+        yield self.data_url_prefix()
+        yield from self.source.base64_chunks()
+
+    def data_url_length(self):
+        return len(self.data_url_prefix()) + self.source.base64_length()
+
+    def to_dict(self):
+        return {
+            'original_bytes': self.original_bytes,
+            'sent_bytes': self.sent_bytes,
+            'mime_type': self.mime_type,
+            'detail': self.detail,
+            'width': self.width,
+            'height': self.height,
+            'reencoded': self.reencoded
+        }
+
+
+def detect_mime(data):
+    """Sniff an image MIME type from its first bytes, None if unrecognised"""
+    head = bytes(data[:16])
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+def choose_detail(width, height, detail='auto', low_detail_max_edge=512):
+    """Pick the vision detail level - small images gain nothing from 'high'"""
+    if detail in ('low', 'high'):
+        return detail
+    return 'low' if max(width, height) <= low_detail_max_edge else 'high'
+
+
+def prepare_image(image, max_edge=1024, output_format='jpeg', quality=85,
+                  detail='auto', low_detail_max_edge=512):
+    """
+    Decode, EXIF-rotate, downscale and re-encode an upload for the vision API.
+    `image` is raw bytes or an ImageSource; file-backed sources are decoded
+    straight from the file. Falls back to the original image if it can't be
+    decoded or re-encoding would not make it any smaller.
+    """
+    source = ImageSource.coerce(image)
+    original_size = source.size
+    pil_format, mime_type = OUTPUT_FORMATS.get(output_format, OUTPUT_FORMATS['jpeg'])
+
+    with source.open() as fp:
+        try:
+            img = Image.open(fp)
+            source_format = img.format
+            # Let the JPEG decoder skip straight to a smaller scale when it can; asking for
+            # the target's own aspect ratio (not max_edge square) lets it pick the smallest one
+            scale = min(1.0, max_edge / max(img.size))
+            img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            needs_rotation = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+            if needs_rotation:
+                img = ImageOps.exif_transpose(img)  # copies the image even when there's nothing to rotate
+            needs_resize = max(img.size) > max_edge
+        except Exception as e:
+            print(f"⚠️ Could not decode image, sending original bytes: {str(e)}")
+            return PreparedImage(source, source.mime_type or 'image/jpeg', 'high' if detail == 'auto' else detail, original_size)
+
+        if needs_resize:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        img.load()  # finish decoding while the file is open
+
+    if img.mode not in ('RGB', 'L') and not (pil_format == 'WEBP' and img.mode == 'RGBA'):
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        else:
+            img = img.convert('RGB')
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format, quality=quality, optimize=True)
+    data = buffer.getvalue()
+    width, height = img.size
+    chosen_detail = choose_detail(width, height, detail, low_detail_max_edge)
+
+    # Already small and correctly oriented - re-encoding would only cost quality
+    if (len(data) >= original_size and not needs_resize and not needs_rotation
+            and source_format in PASSTHROUGH_FORMATS):
+        return PreparedImage(source, PASSTHROUGH_FORMATS[source_format], chosen_detail,
+                             original_size, width, height)
+
+    return PreparedImage(data, mime_type, chosen_detail, original_size, width, height, reencoded=True)
+
+
+def dct_matrix(size):
+    """Orthonormal DCT-II basis, so dct(pixels) = M @ pixels @ M.T"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * math.sqrt(2.0 / size)
+    matrix[0] /= math.sqrt(2.0)
+    return matrix
+
+
+DCT_MATRIX = dct_matrix(PHASH_SIZE)
+
+
+def perceptual_hash(image):
+    """
+    64-bit DCT perceptual hash (pHash) as 16 hex characters, None if the image
+    can't be decoded. Recompressed, resized or slightly cropped copies of a photo
+    hash within a few bits of each other; compare with hamming_distance.
+    """
+    source = ImageSource.coerce(image)
+    with source.open() as fp:
+        try:
+            img = Image.open(fp)
+            img.draft('L', (PHASH_SIZE * 2, PHASH_SIZE * 2))
+            img = ImageOps.exif_transpose(img).convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.BOX)
+        except Exception as e:
+            print(f"⚠️ Could not decode image for perceptual hash: {str(e)}")
+            return None
+
+    pixels = np.asarray(img, dtype=np.float64)
+    block = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:PHASH_BLOCK, :PHASH_BLOCK].flatten()
+    # The DC term is overall brightness, so it's left out of the median
+    bits = block > np.median(block[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hamming_distance(left, right):
+    """Differing bits between two perceptual hashes (hex strings or ints)"""
+    if isinstance(left, str):
+        left = int(left, 16)
+    if isinstance(right, str):
+        right = int(right, 16)
+    return (left ^ right).bit_count()
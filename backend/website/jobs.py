@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, g
+from website import db
+from website.blobstore import load_submission_image
+from website.clients import get_openai_client, get_openai_key
+from website.dedupe import find_near_duplicate, reuse_enhancement
+from website.metrics import record_error
+from website.models import EnhancementJob, PlantTrainingSubmission
+from website.ratelimit import UpstreamBusy, UpstreamRateLimited
+from website.vision import enhance_plant_data, serialize_common_names
+import json
+import os
+import threading
+import traceback
+import uuid
+
+
+class EnhancementJobRunner:
+    """
+    Runs AI enhancement of training submissions on a bounded background pool.
+    Jobs live in the enhancement_jobs table, so queued work survives restarts:
+    a sweeper thread re-submits queued jobs and resets ones stuck in 'running'.
+    """
+
+    def __init__(self, app, max_workers=2, max_queue=100, max_attempts=3,
+                 sweep_interval=30.0, stale_after=600.0):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.stale_after = stale_after
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pending = set()
+        self._pid = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, app):
+        """Build from Flask app config"""
+        config = app.config
+        return cls(
+            app,
+            max_workers=config['JOB_WORKERS'],
+            max_queue=config['JOB_QUEUE_SIZE'],
+            max_attempts=config['JOB_MAX_ATTEMPTS'],
+            sweep_interval=config['JOB_SWEEP_INTERVAL'],
+            stale_after=config['JOB_STALE_AFTER'],
+        )
+
+    def start(self):
+        """Start the worker pool and sweeper for this process (no-op if already running)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='enhancement-job')
+            self._slots = threading.BoundedSemaphore(self.max_queue)
+            self._pending = set()
+            self._stop.clear()
+        threading.Thread(target=self._sweep_loop, name='enhancement-job-sweeper', daemon=True).start()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+    @staticmethod
+    def new_job(submission_id):
+        return EnhancementJob(job_id=str(uuid.uuid4()), submission_id=submission_id, status='queued', attempts=0)
+
+    def enqueue(self, submission_id):
+        """Create a queued job row in the current session (caller commits)"""
+        job = self.new_job(submission_id)
+        db.session.add(job)
+        return job
+
+    def submit(self, job_id):
+        """
+        Hand a committed job to the pool. Returns False when the in-process queue is full;
+        the job stays 'queued' in the database and the sweeper picks it up later.
+        """
+        self.start()
+        with self._lock:
+            if job_id in self._pending:
+                return True
+            if not self._slots.acquire(blocking=False):
+                return False
+            self._pending.add(job_id)
+            executor = self._executor
+        executor.submit(self._run, job_id)
+        return True
+
+    def _release(self, job_id):
+        with self._lock:
+            if job_id in self._pending:
+                self._pending.discard(job_id)
+                self._slots.release()
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running so only one worker runs it"""
+        claimed = db.session.query(EnhancementJob).filter(
+            EnhancementJob.job_id == job_id,
+            EnhancementJob.status == 'queued'
+        ).update({
+            EnhancementJob.status: 'running',
+            EnhancementJob.started_at: datetime.utcnow(),
+            EnhancementJob.attempts: EnhancementJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                g.metrics_endpoint = 'enhancement_job'
+                if not self._claim(job_id):
+                    return
+                job = db.session.get(EnhancementJob, job_id)
+                try:
+                    self._enhance(job)
+                    job.status = 'completed'
+                    job.error = None
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+                    print(f"✅ Enhancement job {job_id} completed")
+                except Exception as e:
+                    record_error(e)
+                    db.session.rollback()
+                    job = db.session.get(EnhancementJob, job_id)
+                    job.error = str(e)
+                    if isinstance(e, UpstreamBusy) and not isinstance(e, UpstreamRateLimited):
+                        # Shed by our own budget, not a failure: retry on a later sweep without using an attempt
+                        job.attempts -= 1
+                        job.status = 'queued'
+                        db.session.commit()
+                        print(f"⏳ Enhancement job {job_id} deferred, OpenAI is busy")
+                        return
+                    if job.attempts >= self.max_attempts:
+                        job.status = 'failed'
+                        job.finished_at = datetime.utcnow()
+                    else:
+                        job.status = 'queued'  # retried by the sweeper
+                    db.session.commit()
+                    print(f"⚠️ Enhancement job {job_id} failed (attempt {job.attempts}): {str(e)}")
+                finally:
+                    db.session.remove()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._release(job_id)
+
+    def _enhance(self, job):
+        submission = db.session.get(PlantTrainingSubmission, job.submission_id)
+        if submission is None:
+            raise ValueError(f"Submission {job.submission_id} not found")
+
+        image = load_submission_image(submission)
+        if image is None or not image.size:
+            raise ValueError("Submission has no image to enhance from")
+
+        g.usage_user_id = submission.user_id
+
+        data = {
+            'plant_name': submission.plant_name,
+            'scientific_name': submission.scientific_name,
+            'common_names': json.loads(submission.common_names) if submission.common_names else '',
+            'plant_type': submission.plant_type,
+            'description': submission.description,
+            'care_instructions': submission.care_instructions,
+        }
+        # A near-duplicate may have been enhanced while this job was queued
+        duplicate = find_near_duplicate(submission.image_phash, exclude_id=submission.submission_id,
+                                        plant_name=submission.plant_name)
+        if reuse_enhancement(data, duplicate):
+            submission.duplicate_of = duplicate.submission_id
+        else:
+            clean_key = get_openai_key()
+            if not clean_key:
+                raise RuntimeError("OpenAI API key not configured")
+            print(f"🤖 Enhancing submission {submission.submission_id} in background...")
+            enhance_plant_data(get_openai_client(clean_key), data, image)
+
+        submission.scientific_name = data.get('scientific_name', '')
+        submission.plant_type = data.get('plant_type', '')
+        submission.description = data.get('description', '')
+        submission.care_instructions = data.get('care_instructions', '')
+        submission.common_names = serialize_common_names(data.get('common_names'))
+
+    def _sweep_loop(self):
+        pid = os.getpid()
+        # First sweep shortly after start so jobs left over from a restart resume quickly
+        delay = min(self.sweep_interval, 2.0)
+        while not self._stop.wait(delay):
+            delay = self.sweep_interval
+            if pid != os.getpid():
+                return
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Enhancement job sweep failed: {str(e)}")
+
+    def sweep(self):
+        """Re-queue jobs stuck in 'running' and submit queued jobs not already pending"""
+        with self.app.app_context():
+            try:
+                stale_before = datetime.utcnow() - timedelta(seconds=self.stale_after)
+                db.session.query(EnhancementJob).filter(
+                    EnhancementJob.status == 'running',
+                    EnhancementJob.started_at < stale_before
+                ).update({EnhancementJob.status: 'queued'}, synchronize_session=False)
+                db.session.commit()
+
+                with self._lock:
+                    free_slots = self.max_queue - len(self._pending)
+                if free_slots <= 0:
+                    return
+                job_ids = [row.job_id for row in db.session.query(EnhancementJob.job_id).filter(
+                    EnhancementJob.status == 'queued'
+                ).order_by(EnhancementJob.created_at).limit(free_slots)]
+            finally:
+                db.session.remove()
+
+        for job_id in job_ids:
+            if not self.submit(job_id):
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queue_size': self.max_queue,
+                'pending': len(self._pending),
+            }
+
+
+def get_job_runner():
+    return current_app.extensions['enhancement_jobs']
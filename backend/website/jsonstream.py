@@ -0,0 +1,67 @@
+import json
+
+
+class IncrementalObjectParser:
+    """
+    Incremental parser for a JSON object that arrives in chunks (e.g. a streamed
+    completion). feed() returns the top-level (key, value) pairs whose values
+    became complete with the new text; each character is scanned only once.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = None
+        self.done = False
+
+    def feed(self, text):
+        self.buffer += text
+        members = []
+        buffer = self.buffer
+
+        for i in range(self.pos, len(buffer)):
+            char = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 1 and char == '{' and self.member_start is None and not self.done:
+                    self.member_start = i + 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0 and self.member_start is not None:
+                    members.append(buffer[self.member_start:i])
+                    self.member_start = None
+                    self.done = True
+            elif char == ',' and self.depth == 1 and self.member_start is not None:
+                members.append(buffer[self.member_start:i])
+                self.member_start = i + 1
+
+        self.pos = len(buffer)
+        return [pair for pair in map(self._parse_member, members) if pair is not None]
+
+    @staticmethod
+    def _parse_member(member):
+        if not member.strip():
+            return None
+        try:
+            parsed = json.loads('{' + member + '}')
+        except ValueError:
+            return None
+        return next(iter(parsed.items()), None)
+
+    def result(self):
+        """Parse the complete document once the stream has finished"""
+        return json.loads(self.buffer)
@@ -0,0 +1,205 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request
+import threading
+import time
+
+# Seconds; covers fast cache hits through slow vision calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus semantics)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[-1] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                yield (self.name + '_bucket',
+                       format_labels(self.labelnames, key, ('le', format_value(float(bound)))),
+                       cumulative)
+            yield self.name + '_sum', format_labels(self.labelnames, key), state[-2]
+            yield self.name + '_count', format_labels(self.labelnames, key), state[-1]
+
+
+class MetricsRegistry:
+    """
+    In-process metrics for the hot paths, exported in Prometheus text format.
+    Each worker process keeps its own values (scrape workers individually, or
+    aggregate with sum() across instances).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self.request_seconds = self.histogram(
+            'egrowtify_request_duration_seconds', 'HTTP request latency by endpoint',
+            ('endpoint', 'method', 'status'))
+        self.stage_seconds = self.histogram(
+            'egrowtify_stage_duration_seconds', 'Latency of individual hot-path stages by endpoint',
+            ('endpoint', 'stage'))
+        self.openai_requests = self.counter(
+            'egrowtify_openai_requests_total', 'Completed OpenAI API calls',
+            ('model', 'usage_type'))
+        self.openai_tokens = self.counter(
+            'egrowtify_openai_tokens_total', 'OpenAI tokens used (from completion.usage)',
+            ('model', 'kind'))
+        self.vision_answers = self.counter(
+            'egrowtify_vision_answers_total', 'Vision answers by the model tier that produced them',
+            ('endpoint', 'model', 'escalated'))
+        self.near_duplicates = self.counter(
+            'egrowtify_near_duplicates_total', 'Near-duplicate uploads needing enhancement, by whether an earlier one was reused',
+            ('endpoint', 'reused'))
+        self.recognitions = self.counter(
+            'egrowtify_ai_recognitions_total', 'AI recognitions by Plant.id / GPT-4o outcome and how they were combined',
+            ('plant_id', 'ai_analysis', 'reconciliation'))
+        self.errors = self.counter(
+            'egrowtify_errors_total', 'Errors by endpoint and exception type',
+            ('endpoint', 'type'))
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+        return self.seconds
+
+    @property
+    def milliseconds(self):
+        return int(self.seconds * 1000)
+
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+
+def current_endpoint():
+    """Endpoint label: the Flask endpoint, or what a background/ASGI caller set on g"""
+    if has_app_context() and g.get('metrics_endpoint'):
+        return g.metrics_endpoint
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return 'background'
+
+
+def observe_stage(stage, seconds):
+    get_metrics().stage_seconds.observe(seconds, endpoint=current_endpoint(), stage=stage)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block into the per-stage histogram: with timed_stage('openai_request') as timer: ..."""
+    timer = StageTimer()
+    try:
+        yield timer
+    finally:
+        timer.stop()
+        observe_stage(stage, timer.seconds)
+
+
+def record_error(error, endpoint=None):
+    get_metrics().errors.inc(endpoint=endpoint or current_endpoint(), type=type(error).__name__)
@@ -1,4 +1,5 @@
 from website import db
+from sqlalchemy.orm import deferred
 from datetime import datetime
 
 class AIUsageTracking(db.Model):
@@ -7,11 +8,17 @@ class AIUsageTracking(db.Model):
     
     usage_tracking_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False, index=True)
-    usage_type = db.Column(db.String(20), nullable=False, index=True)  # 'plant_analysis' or 'soil_analysis'
+    usage_type = db.Column(db.String(20), nullable=False, index=True)  # 'plant_analysis', 'soil_analysis', 'plant_info' or 'enhancement'
     image_path = db.Column(db.String(500), nullable=True)
     analysis_result = db.Column(db.Text, nullable=True)
     cost = db.Column(db.Numeric(10, 2), default=0.00)
     is_free_usage = db.Column(db.Boolean, default=True)
+    billable = db.Column(db.Boolean, nullable=True, default=False)  # the one row per charged analysis; OpenAI call rows only carry tokens
+    model = db.Column(db.String(50), nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    total_tokens = db.Column(db.Integer, nullable=True)
+    latency_ms = db.Column(db.Integer, nullable=True)  # OpenAI round trip
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def to_dict(self):
@@ -23,6 +30,12 @@ class AIUsageTracking(db.Model):
             'analysis_result': self.analysis_result,
             'cost': float(self.cost) if self.cost else 0.00,
             'is_free_usage': self.is_free_usage,
+            'billable': bool(self.billable),
+            'model': self.model,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'latency_ms': self.latency_ms,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -71,6 +84,10 @@ class SoilAnalysisUsage(db.Model):
 class PlantTrainingSubmission(db.Model):
     """Stores user submissions for training new plants"""
     __tablename__ = 'plant_training_submissions'
+    __table_args__ = (
+        # Review queue: filter by status, keyset-paginate on (created_at, submission_id)
+        db.Index('ix_plant_training_submissions_review', 'status', 'created_at', 'submission_id'),
+    )
     
     submission_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False, index=True)
@@ -80,12 +97,19 @@ class PlantTrainingSubmission(db.Model):
     plant_type = db.Column(db.String(50), nullable=True)  # vegetable, fruit, herb, etc.
     description = db.Column(db.Text, nullable=True)
     care_instructions = db.Column(db.Text, nullable=True)
-    image_data = db.Column(db.Text, nullable=True)  # Base64 encoded image
+    image_data = deferred(db.Column(db.Text, nullable=True))  # Legacy base64 image (loaded on access), new uploads go to the blob store
+    image_digest = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the blob
+    image_size = db.Column(db.Integer, nullable=True)
+    image_mime = db.Column(db.String(50), nullable=True)
+    image_phash = db.Column(db.String(16), nullable=True)  # 64-bit perceptual hash (hex), see website.dedupe
+    duplicate_of = db.Column(db.Integer, nullable=True, index=True)  # near-duplicate submission found at ingest
     status = db.Column(db.String(20), default='pending')  # pending, reviewed, approved, rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     reviewed_at = db.Column(db.DateTime, nullable=True)
     
-    def to_dict(self):
+    def to_dict(self, has_image=None):
+        """Full submission; has_image covers legacy inline images without loading the deferred image_data"""
+        has_image = bool(self.image_digest) if has_image is None else has_image
         return {
             'submission_id': self.submission_id,
             'user_id': self.user_id,
@@ -95,8 +119,141 @@ class PlantTrainingSubmission(db.Model):
             'plant_type': self.plant_type,
             'description': self.description,
             'care_instructions': self.care_instructions,
+            'image_digest': self.image_digest,
+            'image_size': self.image_size,
+            'image_mime': self.image_mime,
+            'image_url': f'/api/train-plant/{self.submission_id}/image' if has_image else None,
+            'duplicate_of': self.duplicate_of,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'reviewed_at': self.reviewed_at.isoformat() if self.reviewed_at else None
+        }
+    
+    # Columns a review queue row needs; the long text fields and image stay unloaded
+    SUMMARY_COLUMNS = ('submission_id', 'user_id', 'plant_name', 'scientific_name', 'plant_type',
+                       'image_digest', 'image_size', 'image_mime', 'duplicate_of', 'status', 'created_at', 'reviewed_at')
+    
+    def to_summary_dict(self, has_image=None):
+        """to_dict for the review queue, using only SUMMARY_COLUMNS"""
+        has_image = bool(self.image_digest) if has_image is None else has_image
+        return {
+            'submission_id': self.submission_id,
+            'user_id': self.user_id,
+            'plant_name': self.plant_name,
+            'scientific_name': self.scientific_name,
+            'plant_type': self.plant_type,
+            'image_size': self.image_size,
+            'image_mime': self.image_mime,
+            'image_url': f'/api/train-plant/{self.submission_id}/image' if has_image else None,
+            'duplicate_of': self.duplicate_of,
             'status': self.status,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'reviewed_at': self.reviewed_at.isoformat() if self.reviewed_at else None
         }
 
+
+class OpenAIResponseCache(db.Model):
+    """Persistent tier of the OpenAI response cache, shared across workers"""
+    __tablename__ = 'openai_response_cache'
+    
+    cache_key = db.Column(db.String(64), primary_key=True)  # SHA-256 of image + prompt + model + params
+    model = db.Column(db.String(50), nullable=True)
+    response = db.Column(db.Text, nullable=False)  # JSON response as string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def to_dict(self):
+        return {
+            'cache_key': self.cache_key,
+            'model': self.model,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+class EnhancementJob(db.Model):
+    """Background AI enhancement of a training submission (async mode of /api/train-plant)"""
+    __tablename__ = 'enhancement_jobs'
+    
+    job_id = db.Column(db.String(36), primary_key=True)  # UUID
+    submission_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'submission_id': self.submission_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class UsageRollupMixin:
+    """
+    AIUsageTracking totals per (bucket_start, user_id, usage_type), kept up to
+    date by website.rollups so usage reports never aggregate the raw table
+    """
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # start of the hour/day (UTC)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    usage_type = db.Column(db.String(20), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    free_requests = db.Column(db.Integer, nullable=False, default=0)
+    paid_requests = db.Column(db.Integer, nullable=False, default=0)
+    cost = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    prompt_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    completion_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    total_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    # Additive columns, summed when usage is rolled up and when reports group buckets
+    TOTAL_COLUMNS = ('requests', 'free_requests', 'paid_requests', 'cost',
+                     'prompt_tokens', 'completion_tokens', 'total_tokens')
+    
+    def to_dict(self):
+        return {
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'user_id': self.user_id,
+            'usage_type': self.usage_type,
+            'requests': self.requests,
+            'free_requests': self.free_requests,
+            'paid_requests': self.paid_requests,
+            'cost': float(self.cost) if self.cost else 0.00,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens
+        }
+
+class UsageRollupHourly(UsageRollupMixin, db.Model):
+    """Hourly AIUsageTracking rollup"""
+    __tablename__ = 'ai_usage_rollup_hourly'
+    __table_args__ = (
+        db.Index('ix_ai_usage_rollup_hourly_user', 'user_id', 'bucket_start'),
+    )
+
+class UsageRollupDaily(UsageRollupMixin, db.Model):
+    """Daily AIUsageTracking rollup"""
+    __tablename__ = 'ai_usage_rollup_daily'
+    __table_args__ = (
+        db.Index('ix_ai_usage_rollup_daily_user', 'user_id', 'bucket_start'),
+    )
+
+class UsageRollupState(db.Model):
+    """High-water mark of the usage rollups: every AIUsageTracking row up to last_usage_id is counted"""
+    __tablename__ = 'ai_usage_rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_usage_id = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_usage_id': self.last_usage_id,
+            'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
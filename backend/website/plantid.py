@@ -0,0 +1,202 @@
+from flask import current_app
+import asyncio
+import httpx
+import os
+import threading
+
+PLANT_ID_API_URL = 'https://api.plant.id/v2/identify'
+PLANT_DETAILS = ['common_names', 'url', 'wiki_description', 'taxonomy']
+ALTERNATIVES = 3
+
+
+class PlantIdError(Exception):
+    """Plant.id could not be reached or answered with an error"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PlantIdTimeout(PlantIdError):
+    pass
+
+
+def parse_identification(payload):
+    """
+    The top Plant.id suggestion (highest probability) as plant_name,
+    scientific_name, common_names, confidence (0-1), description, wiki_url,
+    plus the next few suggestions as alternatives. No suggestions = "Unknown".
+    """
+    suggestions = sorted(payload.get('suggestions') or [], key=lambda s: s.get('probability') or 0, reverse=True)
+    if not suggestions:
+        return {
+            'plant_name': 'Unknown',
+            'scientific_name': '',
+            'common_names': [],
+            'confidence': 0.0,
+            'description': '',
+            'wiki_url': None,
+            'alternatives': [],
+        }
+
+    def names(suggestion):
+        details = suggestion.get('plant_details') or {}
+        scientific_name = details.get('scientific_name') or suggestion.get('plant_name') or ''
+        common_names = details.get('common_names') or []
+        return scientific_name, common_names
+
+    top = suggestions[0]
+    details = top.get('plant_details') or {}
+    scientific_name, common_names = names(top)
+    wiki = details.get('wiki_description') or {}
+    alternatives = []
+    for suggestion in suggestions[1:1 + ALTERNATIVES]:
+        alt_scientific_name, alt_common_names = names(suggestion)
+        alternatives.append({
+            'plant_name': alt_common_names[0] if alt_common_names else alt_scientific_name,
+            'scientific_name': alt_scientific_name,
+            'confidence': round(float(suggestion.get('probability') or 0), 4),
+        })
+    return {
+        'plant_name': common_names[0] if common_names else scientific_name,
+        'scientific_name': scientific_name,
+        'common_names': common_names,
+        'confidence': round(float(top.get('probability') or 0), 4),
+        'description': wiki.get('value', '') if isinstance(wiki, dict) else str(wiki),
+        'wiki_url': details.get('url'),
+        'alternatives': alternatives,
+    }
+
+
+class PlantIdClient:
+    """
+    Plant.id identification over pooled keep-alive connections: one httpx
+    client per worker process (rebuilt after a fork) and one per event loop
+    for the ASGI handlers, like OpenAIClientRegistry.
+    """
+
+    def __init__(self, api_key=None, api_url=PLANT_ID_API_URL, timeout=10.0, connect_timeout=5.0,
+                 max_connections=20, keepalive_expiry=30.0):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.timeout = httpx.Timeout(timeout, connect=min(connect_timeout, timeout))
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._pid = None
+        self._async_http_client = None
+        self._async_loop = None
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'timeouts': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        api_key = (config['PLANT_ID_API_KEY'] or '').strip().strip('"').strip("'")
+        return cls(
+            api_key=api_key or None,
+            api_url=config['PLANT_ID_API_URL'],
+            timeout=config['PLANT_ID_TIMEOUT'],
+            connect_timeout=config['OPENAI_CONNECT_TIMEOUT'],
+        )
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    @property
+    def http_client(self):
+        with self._lock:
+            if self._http_client is None or self._pid != os.getpid():
+                self._http_client = httpx.Client(timeout=self.timeout, limits=self._limits())
+                self._pid = os.getpid()
+            return self._http_client
+
+    def async_http_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_http_client is None or self._async_loop is not loop:
+                self._async_http_client = httpx.AsyncClient(timeout=self.timeout, limits=self._limits())
+                self._async_loop = loop
+            return self._async_http_client
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _request(self, image_b64):
+        self._count('requests')
+        return {
+            'url': self.api_url,
+            'headers': {'Api-Key': self.api_key, 'Content-Type': 'application/json'},
+            'json': {'images': [image_b64], 'plant_details': PLANT_DETAILS},
+        }
+
+    def _parse(self, response):
+        if response.is_error:
+            self._count('errors')
+            raise PlantIdError(f"Plant.id answered {response.status_code}: {response.text[:200]}",
+                               status=response.status_code)
+        try:
+            return parse_identification(response.json())
+        except ValueError as e:
+            self._count('errors')
+            raise PlantIdError(f"Plant.id returned invalid JSON: {str(e)}")
+
+    def _transport_error(self, error):
+        if isinstance(error, httpx.TimeoutException):
+            self._count('timeouts')
+            return PlantIdTimeout(f"Plant.id timed out: {type(error).__name__}")
+        self._count('errors')
+        return PlantIdError(f"Could not reach Plant.id: {str(error)}")
+
+    def identify(self, image_b64):
+        """Identify a base64-encoded image, returns parse_identification()'s dict"""
+        try:
+            response = self.http_client.post(**self._request(image_b64))
+        except httpx.TransportError as e:
+            raise self._transport_error(e) from e
+        return self._parse(response)
+
+    async def aidentify(self, image_b64):
+        """asyncio version of identify"""
+        try:
+            response = await self.async_http_client().post(**self._request(image_b64))
+        except httpx.TransportError as e:
+            raise self._transport_error(e) from e
+        return self._parse(response)
+
+    async def aclose(self):
+        with self._lock:
+            http_client = self._async_http_client
+            self._async_http_client = None
+            self._async_loop = None
+        if http_client is not None:
+            await http_client.aclose()
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None and self._pid == os.getpid():
+                self._http_client.close()
+            self._http_client = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['configured'] = self.configured
+        stats['api_url'] = self.api_url
+        return stats
+
+
+def get_plant_id_client():
+    return current_app.extensions['plant_id']
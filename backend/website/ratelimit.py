@@ -0,0 +1,313 @@
+from flask import current_app
+import asyncio
+import json
+import openai
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows - budget is only enforced within a process
+    fcntl = None
+
+
+class UpstreamBusy(Exception):
+    """OpenAI capacity is exhausted; the request was shed instead of queued"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamRateLimited(UpstreamBusy):
+    """OpenAI kept answering 429 after all retries"""
+
+
+# Errors worth retrying: 429s, 5xx, timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+
+def retry_after_seconds(error):
+    """Retry-After from an OpenAI error response (seconds or retry-after-ms), None if absent"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None  # HTTP-date form, fall back to our own backoff
+    return None
+
+
+class UpstreamRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget for OpenAI calls, shared by
+    every worker on the host through a small state file guarded by flock.
+    A 429 from OpenAI pauses all workers until its Retry-After has passed.
+    Callers that would wait longer than max_wait are shed with UpstreamBusy.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, state_dir=None,
+                 max_wait=10.0, max_waiters=32, max_retries=2, backoff_base=0.5, backoff_max=20.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), 'egrowtify-ratelimit')
+        self.max_wait = max_wait
+        self.max_waiters = max_waiters
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.shared = fcntl is not None
+
+        self._lock = threading.Lock()
+        self._state = None  # in-process state when flock isn't available
+        self._waiters = 0
+        self._stats = {
+            'acquired': 0,
+            'waited': 0,
+            'wait_seconds': 0.0,
+            'shed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+        }
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.state_path = os.path.join(self.state_dir, 'openai-bucket.json')
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        return cls(
+            requests_per_minute=config['OPENAI_RATE_LIMIT_RPM'],
+            tokens_per_minute=config['OPENAI_RATE_LIMIT_TPM'],
+            state_dir=config['OPENAI_RATE_LIMIT_DIR'],
+            max_wait=config['OPENAI_RATE_LIMIT_MAX_WAIT'],
+            max_waiters=config['OPENAI_RATE_LIMIT_MAX_WAITERS'],
+            max_retries=config['OPENAI_MAX_RETRIES'],
+            backoff_base=config['OPENAI_BACKOFF_BASE'],
+            backoff_max=config['OPENAI_BACKOFF_MAX'],
+        )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    # Shared bucket state
+
+    def _fresh_state(self, now):
+        return {
+            'requests': float(self.requests_per_minute),
+            'tokens': float(self.tokens_per_minute),
+            'updated': now,
+            'blocked_until': 0.0,
+        }
+
+    def _update(self, change):
+        """Run change(state, now) -> value under the host-wide lock and persist the new state"""
+        if not self.shared:
+            with self._lock:
+                now = time.time()
+                if self._state is None:
+                    self._state = self._fresh_state(now)
+                self._refill(self._state, now)
+                return change(self._state, now)
+
+        fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            try:
+                state = json.loads(os.pread(fd, 4096, 0) or b'null') or self._fresh_state(now)
+            except ValueError:
+                state = self._fresh_state(now)
+            self._refill(state, now)
+            value = change(state, now)
+            data = json.dumps(state).encode('utf-8')
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, data, 0)
+            return value
+        finally:
+            os.close(fd)  # releases the flock
+
+    async def _off_loop(self, fn, *args):
+        """Run fn from async code; the flock and state file I/O go to a worker thread so the event loop never blocks"""
+        if not self.shared:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state['updated'])
+        state['requests'] = min(float(self.requests_per_minute),
+                                state['requests'] + elapsed * self.requests_per_minute / 60.0)
+        state['tokens'] = min(float(self.tokens_per_minute),
+                              state['tokens'] + elapsed * self.tokens_per_minute / 60.0)
+        state['updated'] = now
+
+    def _try_take(self, tokens):
+        """Take one request and `tokens` from the bucket; returns 0, or seconds to wait first"""
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+
+        def take(state, now):
+            waits = [state['blocked_until'] - now]
+            if self.requests_per_minute and state['requests'] < 1:
+                waits.append((1 - state['requests']) * 60.0 / self.requests_per_minute)
+            if self.tokens_per_minute and state['tokens'] < tokens:
+                waits.append((tokens - state['tokens']) * 60.0 / self.tokens_per_minute)
+            wait = max(waits)
+            if wait > 0:
+                return wait
+            if self.requests_per_minute:
+                state['requests'] -= 1
+            if self.tokens_per_minute:
+                state['tokens'] -= tokens
+            return 0.0
+
+        return self._update(take)
+
+    # Budget
+
+    def acquire(self, tokens=0):
+        """Block until the budget allows one call of ~`tokens`, or raise UpstreamBusy"""
+        self._enter_queue()
+        try:
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                wait = self._try_take(tokens)
+                if wait <= 0:
+                    self._count('acquired')
+                    return
+                self._check_wait(wait, deadline)
+                self._count('waited')
+                self._count('wait_seconds', wait)
+                time.sleep(wait + random.uniform(0, 0.05))
+        finally:
+            self._leave_queue()
+
+    async def aacquire(self, tokens=0):
+        """asyncio version of acquire"""
+        self._enter_queue()
+        try:
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                wait = await self._off_loop(self._try_take, tokens)
+                if wait <= 0:
+                    self._count('acquired')
+                    return
+                self._check_wait(wait, deadline)
+                self._count('waited')
+                self._count('wait_seconds', wait)
+                await asyncio.sleep(wait + random.uniform(0, 0.05))
+        finally:
+            self._leave_queue()
+
+    def _enter_queue(self):
+        with self._lock:
+            if self._waiters >= self.max_waiters:
+                self._stats['shed'] += 1
+                raise UpstreamBusy("Too many requests waiting for OpenAI capacity", retry_after=1.0)
+            self._waiters += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self._waiters -= 1
+
+    def _check_wait(self, wait, deadline):
+        remaining = deadline - time.monotonic()
+        if wait > remaining:
+            self._count('shed')
+            raise UpstreamBusy("OpenAI capacity exhausted, try again shortly", retry_after=round(wait, 1))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once completion.usage says what a call really cost"""
+        if not self.tokens_per_minute or actual_tokens is None:
+            return
+        difference = actual_tokens - min(estimated_tokens, self.tokens_per_minute)
+
+        def correct(state, now):
+            state['tokens'] = min(float(self.tokens_per_minute), state['tokens'] - difference)
+
+        self._update(correct)
+
+    async def asettle(self, estimated_tokens, actual_tokens):
+        """asyncio version of settle"""
+        await self._off_loop(self.settle, estimated_tokens, actual_tokens)
+
+    def block_for(self, seconds):
+        """Pause every worker's OpenAI calls (after a 429)"""
+        def block(state, now):
+            state['blocked_until'] = max(state['blocked_until'], now + seconds)
+
+        self._update(block)
+
+    # Retries
+
+    def backoff(self, attempt, error):
+        """Seconds before retry `attempt` (1-based): Retry-After if given, else jittered exponential"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.05))
+        cap = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(cap / 2, cap)  # equal jitter: spreads workers out, never retries instantly
+
+    def _on_retryable_error(self, attempt, error):
+        """Decide whether to retry; returns seconds to sleep before the next attempt, or raises"""
+        rate_limited = isinstance(error, openai.RateLimitError)
+        delay = self.backoff(attempt, error)
+        if rate_limited:
+            self._count('rate_limited')
+            self.block_for(delay)  # every worker waits this out in acquire()
+        if attempt > self.max_retries:
+            if rate_limited:
+                raise UpstreamRateLimited("OpenAI rate limit reached, try again shortly",
+                                          retry_after=round(delay, 1)) from error
+            raise error
+        self._count('retries')
+        print(f"⏳ OpenAI {type(error).__name__}, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+        return 0.0 if rate_limited else delay
+
+    def call(self, fn, tokens=0):
+        """Run fn() within the budget, retrying retryable errors with backoff"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.acquire(tokens)
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._on_retryable_error(attempt, e))
+
+    async def acall(self, fn, tokens=0):
+        """asyncio version of call (fn returns an awaitable)"""
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.aacquire(tokens)
+            try:
+                return await fn()
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(await self._off_loop(self._on_retryable_error, attempt, e))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['waiting'] = self._waiters
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['requests_per_minute'] = self.requests_per_minute
+        stats['tokens_per_minute'] = self.tokens_per_minute
+        stats['shared'] = self.shared
+        return stats
+
+
+def get_rate_limiter():
+    return current_app.extensions['openai_rate_limiter']
@@ -0,0 +1,343 @@
+from flask import current_app, g
+from website.metrics import StageTimer, current_endpoint, get_metrics, observe_stage, record_error, timed_stage
+from website.plantid import PlantIdTimeout
+from website.usage import current_usage_user_id
+from website.vision import (
+    answer_confidence, aroute_vision_json, get_image_options, prepare_once, record_image_stats,
+    route_stream_vision_json
+)
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+import asyncio
+import base64
+import httpx
+import openai
+import threading
+import time
+
+AI_RECOGNITION_SYSTEM_PROMPT = """You are an expert horticulturist and plant pathologist.
+Examine the plant in the provided image: identify it, diagnose its health and advise on its care.
+
+Return your analysis as strict JSON with these exact keys:
+- plant_name (common name of the plant, e.g., "Kangkong")
+- scientific_name (binomial nomenclature, e.g., "Ipomoea aquatica")
+- common_names (array of alternative common names)
+- description (1-2 sentences describing the plant)
+- confidence (number from 0 to 1: how sure you are of the identification)
+- health_status (visual diagnosis: healthy, or signs of disease, wilting or nutrient deficiency)
+- growth_stage (one of: "seedling", "vegetative", "flowering", "fruiting")
+- care_recommendations (object with keys: watering, sunlight, soil, fertilizer, pruning)
+- pests_and_diseases (array of potential threats based on visual signs)
+- seasonal_notes (relevant tips for the current season)
+
+For Philippine/tropical plants, provide region-specific advice."""
+
+AI_RECOGNITION_REQUIRED_FIELDS = ('plant_name', 'health_status', 'care_recommendations')
+ANALYSIS_FIELDS = ('health_status', 'growth_stage', 'care_recommendations', 'pests_and_diseases', 'seasonal_notes')
+TIMEOUT_ERRORS = (FutureTimeout, asyncio.TimeoutError, PlantIdTimeout, openai.APITimeoutError, httpx.TimeoutException)
+
+
+class RecognitionFailed(Exception):
+    """Neither Plant.id nor the GPT-4o analysis produced an answer"""
+
+
+class RecognitionCancelled(Exception):
+    pass
+
+
+def build_recognition_prompt(identification=None):
+    """User prompt for the GPT-4o analysis, naming the plant when Plant.id's answer is already known"""
+    season = f"Current month: {datetime.utcnow():%B}."
+    if identification is None:
+        return f"""Identify this plant, then assess its health, growth stage and care needs.
+{season}"""
+    return f"""Plant.id identified this plant as {identification['plant_name']} ({identification['scientific_name']}) with {identification['confidence']:.0%} confidence.
+Analyze it as that plant unless the image clearly shows otherwise, and assess its health, growth stage and care needs.
+{season}"""
+
+
+def species_key(name):
+    """Genus and species, lowercased: "Ipomoea aquatica Forssk." -> "ipomoea aquatica" """
+    return ' '.join(str(name or '').lower().split()[:2])
+
+
+def names_agree(identification, analysis):
+    """Whether Plant.id and GPT-4o named the same plant (scientific name, else a shared common name)"""
+    scientific_name = species_key(identification.get('scientific_name'))
+    if scientific_name and scientific_name == species_key(analysis.get('scientific_name')):
+        return True
+    names = [identification.get('plant_name')] + list(identification.get('common_names') or [])
+    return str(analysis.get('plant_name') or '').strip().lower() in {str(n).strip().lower() for n in names if n}
+
+
+def identification_from_analysis(analysis):
+    """GPT-4o's own identification in Plant.id's result shape"""
+    common_names = analysis.get('common_names')
+    return {
+        'plant_name': analysis.get('plant_name') or 'Unknown',
+        'scientific_name': analysis.get('scientific_name') or '',
+        'common_names': common_names if isinstance(common_names, list) else [],
+        'confidence': round(answer_confidence(analysis) or 0.0, 4),
+        'description': analysis.get('description') or '',
+        'wiki_url': None,
+        'alternatives': [],
+    }
+
+
+class Recognition:
+    """
+    What Plant.id and the GPT-4o analysis answered and how the two were
+    combined. GPT-4o starts before Plant.id has answered, so it names the plant
+    itself too:
+    - Plant.id below min_confidence: the analysis is cancelled and the
+      identification is returned alone
+    - both name the same plant: the analysis is attached to Plant.id's answer
+    - they disagree: the more confident one names the plant, and if that is
+      Plant.id, GPT-4o is asked again about Plant.id's plant
+    - one failed or ran past its timeout: the other's answer is returned
+    """
+
+    def __init__(self, min_confidence):
+        self.min_confidence = min_confidence
+        self.identification = None
+        self.analysis = None
+        self.plant_id_status = 'not_configured'
+        self.ai_analysis_status = 'not_requested'
+        self.reconciliation = None
+        self.timings = {}
+        self.openai_calls = {}  # by stage; an analysis served from the cache made none
+        self.started = time.perf_counter()
+
+    @property
+    def billable(self):
+        """Whether an upstream call was made, so the analysis credit is kept"""
+        return self.plant_id_status != 'not_configured' or sum(self.openai_calls.values()) > 0
+
+    def low_confidence(self):
+        return self.identification is not None and self.identification['confidence'] < self.min_confidence
+
+    def reconcile(self):
+        """Decide how to combine the answers; True when GPT-4o has to be re-asked about Plant.id's plant"""
+        if self.identification is None and self.analysis is None:
+            self.record()
+            raise RecognitionFailed(f"Plant identification failed (Plant.id: {self.plant_id_status}, "
+                                    f"GPT-4o: {self.ai_analysis_status})")
+        if self.analysis is None:
+            self.reconciliation = 'plant_id_only'
+        elif self.identification is None:
+            self.reconciliation = 'ai_only'
+        elif names_agree(self.identification, self.analysis):
+            self.reconciliation = 'agreed'
+        elif (answer_confidence(self.analysis) or 0.0) > self.identification['confidence']:
+            self.reconciliation = 'ai_preferred'
+        else:
+            self.analysis = None
+            self.reconciliation = 'reanalyzed'
+            return True
+        return False
+
+    def reanalyzed(self, analysis, status):
+        if analysis is not None:
+            self.analysis = analysis
+        else:
+            print(f"⚠️ GPT-4o re-analysis {status}, dropping its answer about a different plant")
+            self.ai_analysis_status = 'discarded_conflict'
+            self.reconciliation = 'plant_id_only'
+
+    def record(self):
+        get_metrics().recognitions.inc(plant_id=self.plant_id_status, ai_analysis=self.ai_analysis_status,
+                                       reconciliation=self.reconciliation or 'failed')
+
+    def to_dict(self):
+        identification, source = self.identification, 'plant_id'
+        if self.reconciliation in ('ai_only', 'ai_preferred'):
+            identification, source = identification_from_analysis(self.analysis), 'openai'
+            if self.identification is not None:
+                # Plant.id's differing answer stays visible as the first alternative
+                identification['alternatives'] = [{
+                    'plant_name': self.identification['plant_name'],
+                    'scientific_name': self.identification['scientific_name'],
+                    'confidence': self.identification['confidence'],
+                }] + self.identification['alternatives']
+        return dict(
+            identification,
+            source=source,
+            ai_analysis={field: self.analysis.get(field) for field in ANALYSIS_FIELDS} if self.analysis else None,
+            ai_analysis_status=self.ai_analysis_status,
+            plant_id_status=self.plant_id_status,
+            reconciliation=self.reconciliation,
+            timings_ms=dict(self.timings, total=int((time.perf_counter() - self.started) * 1000)),
+        )
+
+
+def settle_status(error, upstream):
+    """'timeout' or 'failed' for an upstream error (logged and counted)"""
+    if isinstance(error, TIMEOUT_ERRORS):
+        print(f"⏱️ {upstream} timed out, answering without it")
+        return 'timeout'
+    record_error(error)
+    print(f"⚠️ {upstream} failed, answering without it: {str(error)}")
+    return 'failed'
+
+
+def prepare_recognition_image(image):
+    """Prepare the image once for both upstreams (GPT-4o reuses it); returns the base64 for Plant.id"""
+    with timed_stage('image_prepare'):
+        prepared = prepare_once(image, get_image_options())
+    record_image_stats(prepared)
+    with timed_stage('base64_encode'):
+        return base64.b64encode(prepared.data).decode('ascii')
+
+
+def stream_analysis(client, image, user_prompt, cancelled):
+    """
+    The GPT-4o analysis over the model tiers, streamed so that setting
+    `cancelled` closes the upstream stream at the next field instead of paying
+    for the rest of the answer. Returns (result, model_tier).
+    """
+    events = route_stream_vision_json(client, image, AI_RECOGNITION_SYSTEM_PROMPT, user_prompt,
+                                      AI_RECOGNITION_REQUIRED_FIELDS, temperature=0.3, max_tokens=1500,
+                                      usage_type='plant_analysis')
+    try:
+        for event in events:
+            if cancelled.is_set():
+                raise RecognitionCancelled("GPT-4o analysis cancelled")
+            if event[0] == 'result':
+                return event[1], g.get('model_tier')
+    finally:
+        events.close()
+
+
+def recognize(image, plant_id, client=None):
+    """
+    Identify `image` (an ImageSource) with Plant.id while GPT-4o analyzes it
+    (client=None skips the analysis), each on a worker thread with its own
+    deadline, so this takes about as long as the slower call rather than both.
+    Returns a Recognition; raises RecognitionFailed if neither answered.
+    """
+    config = current_app.config
+    app = current_app._get_current_object()
+    endpoint, user_id = current_endpoint(), current_usage_user_id()
+    recognition = Recognition(config['AI_RECOGNITION_MIN_CONFIDENCE'])
+    image_b64 = prepare_recognition_image(image)
+    plant_id_deadline = time.monotonic() + config['PLANT_ID_TIMEOUT']
+    openai_deadline = time.monotonic() + config['AI_RECOGNITION_OPENAI_TIMEOUT']
+    cancelled = threading.Event()
+
+    def in_worker(stage, fn, *args):
+        def run():
+            # Worker threads only have an app context, so carry the request's labels over
+            with app.app_context():
+                g.metrics_endpoint = endpoint
+                g.usage_user_id = user_id
+                timer = StageTimer()
+                try:
+                    return fn(*args)
+                finally:
+                    observe_stage(stage, timer.stop())
+                    recognition.timings[stage] = timer.milliseconds
+                    recognition.openai_calls[stage] = g.get('openai_calls', 0)
+        return run
+
+    def settle(future, deadline, upstream):
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic())), 'ok'
+        except Exception as e:
+            return None, settle_status(e, upstream)
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-recognition')
+    try:
+        identify = analyze = None
+        if plant_id.configured:
+            identify = executor.submit(in_worker('plant_id', plant_id.identify, image_b64))
+        if client is not None:
+            analyze = executor.submit(in_worker('ai_analysis', stream_analysis, client, image,
+                                                build_recognition_prompt(), cancelled))
+
+        if identify is not None:
+            recognition.identification, recognition.plant_id_status = settle(identify, plant_id_deadline, 'Plant.id')
+        if analyze is not None and recognition.low_confidence():
+            cancelled.set()
+            recognition.ai_analysis_status = 'skipped_low_confidence'
+        elif analyze is not None:
+            answer, recognition.ai_analysis_status = settle(analyze, openai_deadline, 'GPT-4o analysis')
+            if answer is not None:
+                recognition.analysis, g.model_tier = answer
+
+        if recognition.reconcile():
+            reanalyze = executor.submit(in_worker('ai_reanalysis', stream_analysis, client, image,
+                                                  build_recognition_prompt(recognition.identification), cancelled))
+            answer, status = settle(reanalyze, openai_deadline, 'GPT-4o re-analysis')
+            if answer is not None:
+                answer, g.model_tier = answer
+            recognition.reanalyzed(answer, status)
+        recognition.record()
+        return recognition
+    finally:
+        # Whatever is still running past its deadline is abandoned (and GPT-4o's stream closed)
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def arecognize(image, plant_id, client=None):
+    """asyncio version of recognize (client is an AsyncOpenAI); a cancelled analysis is a cancelled task"""
+    config = current_app.config
+    recognition = Recognition(config['AI_RECOGNITION_MIN_CONFIDENCE'])
+    with timed_stage('image_prepare'):
+        prepared = await asyncio.to_thread(prepare_once, image, get_image_options())
+    record_image_stats(prepared)
+    with timed_stage('base64_encode'):
+        image_b64 = await asyncio.to_thread(lambda: base64.b64encode(prepared.data).decode('ascii'))
+    openai_deadline = time.monotonic() + config['AI_RECOGNITION_OPENAI_TIMEOUT']
+    tasks = []
+
+    async def timed(stage, awaitable):
+        timer = StageTimer()
+        try:
+            return await awaitable
+        finally:
+            observe_stage(stage, timer.stop())
+            recognition.timings[stage] = timer.milliseconds
+
+    def start(stage, awaitable, timeout):
+        task = asyncio.create_task(timed(stage, asyncio.wait_for(awaitable, max(0.0, timeout))))
+        tasks.append(task)
+        return task
+
+    def analysis(identification=None):
+        return aroute_vision_json(client, image, AI_RECOGNITION_SYSTEM_PROMPT,
+                                  build_recognition_prompt(identification), AI_RECOGNITION_REQUIRED_FIELDS,
+                                  temperature=0.3, max_tokens=1500, usage_type='plant_analysis')
+
+    async def settle(task, upstream):
+        try:
+            return await task, 'ok'
+        except Exception as e:
+            return None, settle_status(e, upstream)
+
+    try:
+        identify = analyze = None
+        if plant_id.configured:
+            identify = start('plant_id', plant_id.aidentify(image_b64), config['PLANT_ID_TIMEOUT'])
+        if client is not None:
+            analyze = start('ai_analysis', analysis(), config['AI_RECOGNITION_OPENAI_TIMEOUT'])
+
+        if identify is not None:
+            recognition.identification, recognition.plant_id_status = await settle(identify, 'Plant.id')
+        if analyze is not None and recognition.low_confidence():
+            analyze.cancel()
+            recognition.ai_analysis_status = 'skipped_low_confidence'
+        elif analyze is not None:
+            recognition.analysis, recognition.ai_analysis_status = await settle(analyze, 'GPT-4o analysis')
+
+        if recognition.reconcile():
+            reanalyze = start('ai_reanalysis', analysis(recognition.identification),
+                              openai_deadline - time.monotonic())
+            recognition.reanalyzed(*await settle(reanalyze, 'GPT-4o re-analysis'))
+        recognition.openai_calls['request'] = g.get('openai_calls', 0)  # tasks share the request's g
+        recognition.record()
+        return recognition
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,183 @@
+from flask import Blueprint, jsonify, request
+from sqlalchemy import func, select
+from website import db
+from website.metrics import record_error, timed_stage
+from website.models import UsageRollupMixin
+from website.review import BadRequest, parse_datetime, parse_int, require_review_token
+from website.rollups import GRANULARITIES, get_usage_rollups, truncate
+from datetime import datetime, timedelta
+
+reports = Blueprint('reports', __name__)
+# Usage reports show every user's spend, so they need the review API's token and are closed without one
+reports.before_request(require_review_token)
+
+DEFAULT_RANGE = {'hour': timedelta(hours=48), 'day': timedelta(days=30)}
+MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=3660)}
+MAX_REBUILD_RANGE = timedelta(days=366)
+GROUP_BY = ('usage_type', 'user_id')
+DEFAULT_TOP_USERS = 20
+MAX_TOP_USERS = 500
+
+
+def parse_range(granularity):
+    """(start, end) bucket-aligned from ?from= / ?to= (ISO), defaulting to the most recent DEFAULT_RANGE"""
+    end = parse_datetime('to') or datetime.utcnow()
+    start = parse_datetime('from') or end - DEFAULT_RANGE[granularity]
+    start = truncate(start, granularity)
+    if end <= start:
+        raise BadRequest("'to' must be after 'from'")
+    if end - start > MAX_RANGE[granularity]:
+        raise BadRequest(f"Range too long for {granularity}ly buckets (max {MAX_RANGE[granularity].days} days)")
+    return start, end
+
+
+def parse_granularity():
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise BadRequest(f"Invalid granularity, expected one of: {', '.join(GRANULARITIES)}")
+    return granularity
+
+
+def summed_columns(model):
+    return [func.coalesce(func.sum(getattr(model, column)), 0).label(column)
+            for column in UsageRollupMixin.TOTAL_COLUMNS]
+
+
+def totals_dict(row):
+    # Postgres sums integers as numeric, so cast back
+    totals = {column: int(getattr(row, column) or 0) for column in UsageRollupMixin.TOTAL_COLUMNS if column != 'cost'}
+    totals['cost'] = float(row.cost or 0)
+    return totals
+
+
+def filtered(statement, model):
+    """Apply the ?user_id= and ?usage_type= filters"""
+    user_id = parse_int('user_id')
+    if user_id is not None:
+        statement = statement.where(model.user_id == user_id)
+    if request.args.get('usage_type'):
+        statement = statement.where(model.usage_type == request.args['usage_type'])
+    return statement
+
+
+@reports.route('/api/reports/usage', methods=['GET'])
+def usage_report():
+    """
+    AI usage per hour or day (?granularity=hour|day) from the rollup tables:
+    requests, free/paid split, cost and tokens per bucket plus the range total.
+    Filters: from / to (ISO), user_id, usage_type; ?group_by=usage_type|user_id
+    splits each bucket.
+    """
+    try:
+        granularity = parse_granularity()
+        start, end = parse_range(granularity)
+        group_by = request.args.get('group_by')
+        if group_by and group_by not in GROUP_BY:
+            raise BadRequest(f"Invalid group_by, expected one of: {', '.join(GROUP_BY)}")
+
+        rollups = get_usage_rollups()
+        with timed_stage('rollup_refresh'):
+            rollups.refresh_if_stale()
+
+        model = GRANULARITIES[granularity]
+        keys = [model.bucket_start] + ([getattr(model, group_by)] if group_by else [])
+        statement = filtered(
+            select(*keys, *summed_columns(model)).where(model.bucket_start >= start, model.bucket_start < end),
+            model
+        ).group_by(*keys).order_by(*keys)
+        with timed_stage('db_query'):
+            rows = db.session.execute(statement).all()
+
+        buckets = []
+        totals = dict.fromkeys(UsageRollupMixin.TOTAL_COLUMNS, 0)
+        for row in rows:
+            bucket = dict(bucket_start=row.bucket_start.isoformat(), **totals_dict(row))
+            if group_by:
+                bucket[group_by] = getattr(row, group_by)
+            for column in UsageRollupMixin.TOTAL_COLUMNS:
+                totals[column] += bucket[column]
+            buckets.append(bucket)
+        totals['cost'] = round(totals['cost'], 2)
+
+        return jsonify({
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "group_by": group_by,
+            "buckets": buckets,
+            "totals": totals,
+            "rollup_state": rollups.state()
+        }), 200
+
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        record_error(e)
+        print(f"Error in usage_report: {str(e)}")
+        return jsonify({"error": f"Failed to build usage report: {str(e)}"}), 500
+
+
+@reports.route('/api/reports/usage/users', methods=['GET'])
+def top_users_report():
+    """
+    Users with the most AI usage in a range, by cost then requests. Takes the
+    same granularity / from / to / usage_type as /api/reports/usage, and ?limit=.
+    """
+    try:
+        granularity = parse_granularity()
+        start, end = parse_range(granularity)
+        limit = max(1, min(parse_int('limit', DEFAULT_TOP_USERS), MAX_TOP_USERS))
+
+        rollups = get_usage_rollups()
+        with timed_stage('rollup_refresh'):
+            rollups.refresh_if_stale()
+
+        model = GRANULARITIES[granularity]
+        statement = filtered(
+            select(model.user_id, *summed_columns(model)).where(model.bucket_start >= start, model.bucket_start < end),
+            model
+        ).group_by(model.user_id).order_by(
+            func.sum(model.cost).desc(), func.sum(model.requests).desc(), model.user_id
+        ).limit(limit)
+        with timed_stage('db_query'):
+            rows = db.session.execute(statement).all()
+
+        return jsonify({
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "users": [dict(user_id=row.user_id, **totals_dict(row)) for row in rows],
+            "rollup_state": rollups.state()
+        }), 200
+
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        record_error(e)
+        print(f"Error in top_users_report: {str(e)}")
+        return jsonify({"error": f"Failed to build usage report: {str(e)}"}), 500
+
+
+@reports.route('/api/reports/usage/rebuild', methods=['POST'])
+def rebuild_usage_rollups():
+    """Recompute the rollups for the days touching {"from": ISO, "to": ISO} (safe to repeat)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        start = datetime.fromisoformat(data['from'])
+        end = datetime.fromisoformat(data['to'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "from and to are required ISO dates or datetimes"}), 400
+    if end <= start:
+        return jsonify({"error": "'to' must be after 'from'"}), 400
+    if end - start > MAX_REBUILD_RANGE:
+        return jsonify({"error": f"Range too long (max {MAX_REBUILD_RANGE.days} days per call)"}), 400
+
+    try:
+        rollups = get_usage_rollups()
+        result = rollups.rebuild(start, end)
+        print(f"✅ Rebuilt usage rollups for {result['days']} day(s) from {result['usage_rows']} usage rows")
+        return jsonify(dict(result, rollup_state=rollups.state())), 200
+    except Exception as e:
+        record_error(e)
+        print(f"Error rebuilding usage rollups: {str(e)}")
+        return jsonify({"error": f"Failed to rebuild usage rollups: {str(e)}"}), 500
@@ -0,0 +1,208 @@
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import tuple_, update
+from sqlalchemy.orm import load_only
+from website import db
+from website.metrics import record_error, timed_stage
+from website.models import PlantTrainingSubmission
+from datetime import datetime
+import base64
+import hmac
+import json
+
+review = Blueprint('review', __name__)
+
+STATUSES = ('pending', 'reviewed', 'approved', 'rejected')
+# Decisions only apply to submissions that haven't been decided yet
+TRANSITIONS = {
+    'approved': ('pending', 'reviewed'),
+    'rejected': ('pending', 'reviewed'),
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class BadRequest(ValueError):
+    pass
+
+
+@review.before_request
+def check_review_token():
+    """Require `Authorization: Bearer <REVIEW_API_TOKEN>` when a token is configured"""
+    token = current_app.config['REVIEW_API_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"error": "Review API token required"}), 401
+
+
+def require_review_token():
+    """Like check_review_token, but refused (403) while no REVIEW_API_TOKEN is configured"""
+    if not current_app.config['REVIEW_API_TOKEN']:
+        return jsonify({"error": "Disabled until REVIEW_API_TOKEN is configured"}), 403
+    return check_review_token()
+
+
+def encode_cursor(submission):
+    """Opaque keyset cursor: the (status, created_at, submission_id) of the last row on a page"""
+    key = [submission.status, submission.created_at.isoformat(), submission.submission_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        status, created_at, submission_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return status, datetime.fromisoformat(created_at), int(submission_id)
+    except (ValueError, TypeError) as e:
+        raise BadRequest(f"Invalid cursor: {str(e)}")
+
+
+def parse_datetime(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"Invalid {name}, expected an ISO date or datetime")
+
+
+def parse_int(name, default=None):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"Invalid {name}, expected an integer")
+
+
+@review.route('/api/review/submissions', methods=['GET'])
+def list_submissions():
+    """
+    Review queue, oldest first (or ?order=newest), keyset-paginated on
+    (status, created_at, submission_id) so every page is an index range scan.
+    Filters: status (default pending, comma-separated or 'all'), plant_type,
+    user_id, created_from / created_to (ISO). Pass next_cursor back as ?cursor=.
+    """
+    try:
+        Submission = PlantTrainingSubmission
+        statuses = [s.strip() for s in request.args.get('status', 'pending').split(',') if s.strip()]
+        if 'all' not in statuses and any(s not in STATUSES for s in statuses):
+            raise BadRequest(f"Invalid status, expected one of: {', '.join(STATUSES)} or all")
+        newest_first = request.args.get('order', 'oldest') == 'newest'
+        limit = max(1, min(parse_int('limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+        query = db.session.query(Submission, Submission.image_data.isnot(None).label('has_legacy_image')).options(
+            load_only(*(getattr(Submission, column) for column in Submission.SUMMARY_COLUMNS))
+        )
+        if 'all' not in statuses:
+            query = query.filter(Submission.status.in_(statuses))
+        if request.args.get('plant_type'):
+            query = query.filter(Submission.plant_type == request.args['plant_type'])
+        user_id = parse_int('user_id')
+        if user_id is not None:
+            query = query.filter(Submission.user_id == user_id)
+        created_from = parse_datetime('created_from')
+        if created_from:
+            query = query.filter(Submission.created_at >= created_from)
+        created_to = parse_datetime('created_to')
+        if created_to:
+            query = query.filter(Submission.created_at <= created_to)
+
+        key = tuple_(Submission.status, Submission.created_at, Submission.submission_id)
+        if request.args.get('cursor'):
+            last = tuple_(*decode_cursor(request.args['cursor']))
+            query = query.filter(key < last if newest_first else key > last)
+        order = (Submission.status, Submission.created_at, Submission.submission_id)
+        query = query.order_by(*(column.desc() for column in order) if newest_first else order)
+
+        with timed_stage('db_query'):
+            rows = query.limit(limit + 1).all()
+        page = rows[:limit]
+        return jsonify({
+            "submissions": [
+                submission.to_summary_dict(has_image=bool(submission.image_digest or has_legacy_image))
+                for submission, has_legacy_image in page
+            ],
+            "next_cursor": encode_cursor(page[-1][0]) if len(rows) > limit else None,
+            "limit": limit
+        }), 200
+
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        record_error(e)
+        print(f"Error in list_submissions: {str(e)}")
+        return jsonify({"error": f"Failed to list submissions: {str(e)}"}), 500
+
+
+@review.route('/api/review/submissions/<int:submission_id>', methods=['GET'])
+def get_submission(submission_id):
+    """One submission with its full text fields (the image is served from image_url)"""
+    Submission = PlantTrainingSubmission
+    row = db.session.query(Submission, Submission.image_data.isnot(None).label('has_legacy_image')).filter(
+        Submission.submission_id == submission_id
+    ).first()
+    if row is None:
+        return jsonify({"error": "Submission not found"}), 404
+    submission, has_legacy_image = row
+    return jsonify(submission.to_dict(has_image=bool(submission.image_digest or has_legacy_image))), 200
+
+
+def transition_submissions(status):
+    """
+    Move many submissions to `status` in a single UPDATE that also sets reviewed_at.
+    Submissions that are missing or already decided are skipped and reported.
+    Decisions change submission state, so they need a configured token.
+    """
+    denied = require_review_token()
+    if denied is not None:
+        return denied
+    data = request.get_json(silent=True) or {}
+    submission_ids = data.get('submission_ids')
+    if not isinstance(submission_ids, list) or not submission_ids:
+        return jsonify({"error": "submission_ids must be a non-empty list"}), 400
+    try:
+        submission_ids = sorted({int(submission_id) for submission_id in submission_ids})
+    except (TypeError, ValueError):
+        return jsonify({"error": "submission_ids must be integers"}), 400
+    max_items = current_app.config['REVIEW_BULK_MAX']
+    if len(submission_ids) > max_items:
+        return jsonify({"error": f"Too many submissions in one request (max {max_items})"}), 400
+
+    try:
+        statement = update(PlantTrainingSubmission).where(
+            PlantTrainingSubmission.submission_id.in_(submission_ids),
+            PlantTrainingSubmission.status.in_(TRANSITIONS[status])
+        ).values(status=status, reviewed_at=datetime.utcnow()).execution_options(synchronize_session=False)
+
+        with timed_stage('db_commit'):
+            if db.engine.dialect.update_returning:
+                updated = sorted(db.session.execute(statement.returning(PlantTrainingSubmission.submission_id)).scalars())
+                count = len(updated)
+            else:
+                count, updated = db.session.execute(statement).rowcount, None
+            db.session.commit()
+
+        print(f"✅ {count} submission(s) {status}")
+        response = {"status": status, "updated": count}
+        if updated is not None:
+            response["submission_ids"] = updated
+            response["skipped"] = sorted(set(submission_ids) - set(updated))
+        return jsonify(response), 200
+
+    except Exception as e:
+        record_error(e)
+        db.session.rollback()
+        print(f"Error marking submissions {status}: {str(e)}")
+        return jsonify({"error": f"Failed to update submissions: {str(e)}"}), 500
+
+
+@review.route('/api/review/submissions/approve', methods=['POST'])
+def approve_submissions():
+    """Approve pending/reviewed submissions: {"submission_ids": [...]}"""
+    return transition_submissions('approved')
+
+
+@review.route('/api/review/submissions/reject', methods=['POST'])
+def reject_submissions():
+    """Reject pending/reviewed submissions: {"submission_ids": [...]}"""
+    return transition_submissions('rejected')
@@ -0,0 +1,222 @@
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from website import db
+from website.models import AIUsageTracking, UsageRollupDaily, UsageRollupHourly, UsageRollupMixin, UsageRollupState
+from datetime import datetime, timedelta
+import threading
+import time
+
+STATE_NAME = 'ai_usage'
+GRANULARITIES = {
+    'hour': UsageRollupHourly,
+    'day': UsageRollupDaily,
+}
+USAGE_COLUMNS = (
+    AIUsageTracking.usage_tracking_id, AIUsageTracking.user_id, AIUsageTracking.usage_type,
+    AIUsageTracking.created_at, AIUsageTracking.cost, AIUsageTracking.is_free_usage, AIUsageTracking.billable,
+    AIUsageTracking.prompt_tokens, AIUsageTracking.completion_tokens, AIUsageTracking.total_tokens,
+)
+
+
+def truncate(moment, granularity):
+    """Start of the hour or day `moment` falls in"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows):
+    """
+    Totals per (granularity, bucket_start, user_id, usage_type) for
+    AIUsageTracking rows: requests counts OpenAI calls, free/paid_requests and
+    cost count the billable row each charged analysis records
+    """
+    totals = {}
+    for row in rows:
+        if row.created_at is None:
+            continue
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(row.created_at, granularity), row.user_id, row.usage_type)
+            bucket = totals.get(key)
+            if bucket is None:
+                bucket = totals[key] = dict.fromkeys(UsageRollupMixin.TOTAL_COLUMNS, 0)
+            if row.billable:
+                bucket['paid_requests' if row.is_free_usage is False else 'free_requests'] += 1
+                bucket['cost'] += row.cost or 0
+            else:
+                bucket['requests'] += 1
+            bucket['prompt_tokens'] += row.prompt_tokens or 0
+            bucket['completion_tokens'] += row.completion_tokens or 0
+            bucket['total_tokens'] += row.total_tokens or 0
+    return totals
+
+
+def apply_totals(rollup_session, totals):
+    """Add aggregate() totals onto the rollup rows: one INSERT for new buckets, one UPDATE for existing ones"""
+    for granularity, model in GRANULARITIES.items():
+        keys = {key[1:]: bucket for key, bucket in totals.items() if key[0] == granularity}
+        if not keys:
+            continue
+        existing = set(rollup_session.execute(
+            select(model.bucket_start, model.user_id, model.usage_type).where(
+                model.bucket_start.in_({key[0] for key in keys}),
+                model.user_id.in_({key[1] for key in keys})
+            )
+        ).tuples())
+        new_rows, increments = [], []
+        for (bucket_start, user_id, usage_type), bucket in keys.items():
+            if (bucket_start, user_id, usage_type) in existing:
+                increments.append(dict(
+                    {f'delta_{column}': value for column, value in bucket.items()},
+                    key_bucket_start=bucket_start, key_user_id=user_id, key_usage_type=usage_type
+                ))
+            else:
+                new_rows.append(dict(bucket, bucket_start=bucket_start, user_id=user_id, usage_type=usage_type))
+        # Core statements on the table: executemany, without ORM bulk-by-primary-key handling
+        table = model.__table__
+        if new_rows:
+            rollup_session.execute(insert(table), new_rows)
+        if increments:
+            rollup_session.execute(
+                update(table).where(
+                    table.c.bucket_start == bindparam('key_bucket_start'),
+                    table.c.user_id == bindparam('key_user_id'),
+                    table.c.usage_type == bindparam('key_usage_type')
+                ).values({
+                    column: table.c[column] + bindparam(f'delta_{column}')
+                    for column in UsageRollupMixin.TOTAL_COLUMNS
+                }),
+                increments
+            )
+
+
+def claim_state(rollup_session):
+    """
+    Lock the high-water mark row for this transaction (creating it on first
+    use) and return it. Every refresh and rebuild starts here, so they run one
+    at a time across workers and never count a usage row twice.
+    """
+    for _ in range(2):
+        claimed = rollup_session.execute(
+            update(UsageRollupState).where(UsageRollupState.name == STATE_NAME)
+            .values(refreshed_at=datetime.utcnow())
+        ).rowcount
+        if claimed:
+            return rollup_session.get(UsageRollupState, STATE_NAME, populate_existing=True)
+        rollup_session.rollback()
+        try:
+            rollup_session.add(UsageRollupState(name=STATE_NAME, last_usage_id=0))
+            rollup_session.commit()
+        except IntegrityError:
+            rollup_session.rollback()
+    raise RuntimeError("Could not lock the usage rollup state row")
+
+
+class UsageRollups:
+    """
+    Hourly and daily AIUsageTracking rollups (ai_usage_rollup_hourly/_daily),
+    maintained incrementally: refresh() adds the usage rows past a high-water
+    mark onto their buckets. Rows younger than settle_seconds are left for the
+    next refresh, so a lower id still being committed by another worker isn't
+    skipped. rebuild() recomputes whole days from scratch and can be re-run.
+    """
+
+    def __init__(self, refresh_interval=60, settle_seconds=30, batch_size=5000):
+        self.refresh_interval = refresh_interval
+        self.settle_seconds = settle_seconds
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._last_refresh = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        return cls(
+            refresh_interval=config['ROLLUP_REFRESH_INTERVAL'],
+            settle_seconds=config['ROLLUP_SETTLE_SECONDS'],
+            batch_size=config['ROLLUP_BATCH'],
+        )
+
+    def refresh(self):
+        """Roll up the usage rows past the high-water mark, returns how many were counted"""
+        settled = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+        counted = 0
+        with Session(db.engine) as rollup_session:
+            cutoff_id = None
+            while True:
+                state = claim_state(rollup_session)
+                if cutoff_id is None:
+                    cutoff_id = rollup_session.execute(
+                        select(func.max(AIUsageTracking.usage_tracking_id)).where(
+                            AIUsageTracking.usage_tracking_id > state.last_usage_id,
+                            AIUsageTracking.created_at <= settled
+                        )
+                    ).scalar() or state.last_usage_id
+                rows = rollup_session.execute(
+                    select(*USAGE_COLUMNS).where(
+                        AIUsageTracking.usage_tracking_id > state.last_usage_id,
+                        AIUsageTracking.usage_tracking_id <= cutoff_id
+                    ).order_by(AIUsageTracking.usage_tracking_id).limit(self.batch_size)
+                ).all()
+                if not rows:
+                    rollup_session.commit()
+                    break
+                apply_totals(rollup_session, aggregate(rows))
+                state.last_usage_id = rows[-1].usage_tracking_id
+                rollup_session.commit()
+                counted += len(rows)
+        self._last_refresh = time.monotonic()
+        return counted
+
+    def refresh_if_stale(self):
+        """refresh() at most every refresh_interval seconds per worker; skipped while another thread refreshes"""
+        if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return 0
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            return self.refresh()
+        finally:
+            self._lock.release()
+
+    def rebuild(self, start, end):
+        """
+        Recompute the rollups of every day touching [start, end) from
+        AIUsageTracking, one day per transaction. Only rows up to the high-water
+        mark are counted (later ones are refresh()'s), so running it again, or
+        alongside a refresh, gives the same totals.
+        """
+        day = truncate(start, 'day')
+        days = counted = 0
+        while day < end:
+            next_day = day + timedelta(days=1)
+            with Session(db.engine) as rollup_session:
+                state = claim_state(rollup_session)
+                for model in GRANULARITIES.values():
+                    rollup_session.execute(
+                        delete(model).where(model.bucket_start >= day, model.bucket_start < next_day)
+                    )
+                rows = rollup_session.execute(
+                    select(*USAGE_COLUMNS).where(
+                        AIUsageTracking.created_at >= day,
+                        AIUsageTracking.created_at < next_day,
+                        AIUsageTracking.usage_tracking_id <= state.last_usage_id
+                    )
+                ).all()
+                apply_totals(rollup_session, aggregate(rows))
+                rollup_session.commit()
+            days += 1
+            counted += len(rows)
+            day = next_day
+        return {'days': days, 'usage_rows': counted}
+
+    def state(self):
+        with Session(db.engine) as rollup_session:
+            state = rollup_session.get(UsageRollupState, STATE_NAME)
+            return state.to_dict() if state else {'name': STATE_NAME, 'last_usage_id': 0, 'refreshed_at': None}
+
+
+def get_usage_rollups():
+    return current_app.extensions['usage_rollups']
@@ -0,0 +1,159 @@
+from sqlalchemy import inspect, text
+from website import db
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows - workers migrate without a lock
+    fcntl = None
+
+
+def migrate_database(lock_dir=None):
+    """
+    Create missing tables, columns and indexes; run by create_app() so
+    gunicorn/uvicorn workers never serve a database that lacks them. Every
+    step is idempotent, and workers starting together take turns on a file lock.
+    """
+    from website import models  # noqa: F401 - registers the tables on db.metadata
+    
+    fd = None
+    if fcntl is not None:
+        lock_dir = lock_dir or tempfile.gettempdir()
+        os.makedirs(lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(lock_dir, 'egrowtify-migrate.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        db.create_all()
+        return add_missing_columns()
+    finally:
+        if fd is not None:
+            os.close(fd)  # releases the flock
+
+
+def missing_columns():
+    """Model tables and columns the database doesn't have yet, as 'table' / 'table.column'"""
+    from website import models  # noqa: F401
+    
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing.append(table.name)
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing_columns)
+    return missing
+
+
+def add_missing_columns():
+    """
+    Add columns and indexes that exist on the models but not yet in the database.
+    db.create_all() only creates missing tables, so this lets existing
+    databases pick up new nullable columns and indexes without a migration framework.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                if column.index:
+                    conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column.name} ON {table.name} ({column.name})'))
+            added.append(f'{table.name}.{column.name}')
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes or len(index.columns) < 2:
+                continue  # single-column indexes are created with their column above
+            index.create(db.engine, checkfirst=True)
+            added.append(index.name)
+    
+    if added:
+        print(f"✅ Added database columns and indexes: {', '.join(added)}")
+    ensure_search_index()
+    return added
+
+
+SEARCH_TABLE = 'plant_training_search'
+# Postgres search document; the expression indexes below only apply to queries that repeat it verbatim
+SEARCH_DOCUMENT = ("lower(coalesce(plant_name, '') || ' ' || coalesce(scientific_name, '') || ' ' || "
+                   "coalesce(common_names, ''))")
+
+SQLITE_SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        plant_name, scientific_name, common_names,
+        content='plant_training_submissions', content_rowid='submission_id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON plant_training_submissions BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, plant_name, scientific_name, common_names)
+        VALUES (new.submission_id, new.plant_name, new.scientific_name, new.common_names);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON plant_training_submissions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, plant_name, scientific_name, common_names)
+        VALUES ('delete', old.submission_id, old.plant_name, old.scientific_name, old.common_names);
+    END""",
+    # Status changes from the review queue don't touch the index
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF plant_name, scientific_name, common_names ON plant_training_submissions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, plant_name, scientific_name, common_names)
+        VALUES ('delete', old.submission_id, old.plant_name, old.scientific_name, old.common_names);
+        INSERT INTO {SEARCH_TABLE}(rowid, plant_name, scientific_name, common_names)
+        VALUES (new.submission_id, new.plant_name, new.scientific_name, new.common_names);
+    END""",
+]
+
+POSTGRES_SEARCH_DDL = [
+    f"""CREATE INDEX IF NOT EXISTS ix_plant_training_submissions_search_tsv
+    ON plant_training_submissions USING gin (to_tsvector('simple', {SEARCH_DOCUMENT}))""",
+    f"""CREATE INDEX IF NOT EXISTS ix_plant_training_submissions_search_trgm
+    ON plant_training_submissions USING gin (({SEARCH_DOCUMENT}) gin_trgm_ops)""",
+]
+
+
+def ensure_search_index():
+    """
+    Create the plant search index if it's missing, returns the backend in use:
+    'fts5' (SQLite FTS5 trigram table kept in sync by triggers), 'postgres'
+    (tsvector + pg_trgm expression indexes, which Postgres maintains itself),
+    'postgres-fts' (pg_trgm not available) or 'like' (no index, LIKE scans).
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        try:
+            with db.engine.begin() as conn:
+                existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                       {'name': SEARCH_TABLE}).first() is not None
+                for statement in SQLITE_SEARCH_DDL:
+                    conn.execute(text(statement))
+                if not existed:
+                    conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+                    print(f"✅ Built search index {SEARCH_TABLE}")
+            return 'fts5'
+        except Exception as e:
+            print(f"⚠️ SQLite FTS5 trigram search unavailable, search will scan with LIKE: {str(e)}")
+            return 'like'
+    
+    if dialect == 'postgresql':
+        backend = 'postgres'
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            print(f"⚠️ Could not enable pg_trgm, search will match whole words only: {str(e)}")
+            backend = 'postgres-fts'
+        with db.engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))  # index builds outlast DB_STATEMENT_TIMEOUT
+            for statement in POSTGRES_SEARCH_DDL[:1 if backend == 'postgres-fts' else None]:
+                conn.execute(text(statement))
+        return backend
+    
+    return 'like'
@@ -0,0 +1,220 @@
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import bindparam, or_, text
+from sqlalchemy.orm import load_only
+from website import db
+from website.metrics import record_error, timed_stage
+from website.models import PlantTrainingSubmission
+from website.review import STATUSES
+from website.schema import SEARCH_DOCUMENT, SEARCH_TABLE, ensure_search_index
+import json
+import math
+import re
+
+search = Blueprint('search', __name__)
+
+MIN_QUERY_LENGTH = 3  # the trigram index can't match anything shorter
+MAX_QUERY_LENGTH = 100
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# FTS5 candidates re-ranked by trigram similarity for every result returned
+CANDIDATES_PER_RESULT = 5
+MIN_CANDIDATES = 100
+# Fuzzy FTS5 queries are capped at about this many OR-ed terms, however long the query
+MAX_FUZZY_TERMS = 8
+MIN_FUZZY_PIECE = 4
+# Re-ranked candidates less similar than this are noise (a few shared trigrams)
+MIN_SCORE = 0.3
+
+
+def get_search_backend():
+    """The search backend for this database, set up on first use (see schema.ensure_search_index)"""
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+        backend = ensure_search_index()
+        current_app.extensions['search_backend'] = backend
+    return backend
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())[:MAX_QUERY_LENGTH]
+
+
+def trigrams(value):
+    """pg_trgm-style trigrams: each word lowercased and padded with two spaces in front, one behind"""
+    grams = set()
+    for word in re.findall(r'\w+', value.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(query, value):
+    """
+    Best trigram similarity between the query and any run of as many words in
+    `value` (like pg_trgm's word_similarity), so a one-word typo still scores
+    well against a long name.
+    """
+    query_grams = trigrams(query)
+    words = re.findall(r'\w+', value.lower())
+    if not query_grams or not words:
+        return 0.0
+    size = min(len(query.split()), len(words))
+    best = 0.0
+    for start in range(len(words) - size + 1):
+        window_grams = trigrams(' '.join(words[start:start + size]))
+        best = max(best, len(query_grams & window_grams) / len(query_grams | window_grams))
+    return best
+
+
+def searchable_names(submission):
+    names = [submission.plant_name, submission.scientific_name]
+    if submission.common_names:
+        try:
+            common_names = json.loads(submission.common_names)
+            names.extend(common_names if isinstance(common_names, list) else [str(common_names)])
+        except ValueError:
+            names.append(submission.common_names)
+    return [str(name) for name in names if name]
+
+
+def score_submission(query, submission):
+    """Similarity of the best matching name; exact substrings rank above fuzzy matches"""
+    best = 0.0
+    for name in searchable_names(submission):
+        if query in name.lower():
+            best = max(best, 0.5 + 0.5 * len(query) / len(name))
+        best = max(best, similarity(query, name))
+    return best
+
+
+def fts5_phrase(value):
+    """A trigram FTS5 phrase matches `value` anywhere in a column, like LIKE '%value%'"""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def fts5_fuzzy_match(query):
+    """
+    FTS5 query matching names within one typo of the query: the query is cut into
+    MAX_FUZZY_TERMS windows and for each one the text either side of it must appear,
+    which holds for any insertion, deletion or substitution inside it. Sides shorter
+    than a trigram can't be matched and are left out; a side left on its own must
+    be at least MIN_FUZZY_PIECE characters, as shorter fragments match too many
+    names to rank quickly. None if nothing qualifies.
+    """
+    window = math.ceil((len(query) + 1) / MAX_FUZZY_TERMS)
+    terms = set()
+    for start in range(0, len(query) + 1, window):
+        sides = [side for side in (query[:start], query[start + window:]) if len(side) >= 3]
+        if sides and sum(len(side) for side in sides) >= MIN_FUZZY_PIECE:
+            terms.add(' AND '.join(fts5_phrase(side) for side in sides))
+    return ' OR '.join(f'({term})' for term in sorted(terms)) or None
+
+
+def status_clause(statuses, column='status'):
+    return f' AND {column} IN :statuses' if statuses else ''
+
+
+def bind_statuses(statement, statuses):
+    if statuses:
+        statement = statement.bindparams(bindparam('statuses', expanding=True))
+    return statement
+
+
+def candidate_ids(backend, query, statuses, limit):
+    """(submission_id, score) candidates from the index; score is None when re-ranked in Python"""
+    params = {'q': query, 'limit': limit, 'statuses': statuses}
+
+    if backend == 'fts5':
+        # Exact substrings first; the fuzzy query matches (and has to rank) far more rows, so it only
+        # runs when there aren't enough exact matches
+        statement = bind_statuses(text(
+            f"SELECT s.submission_id FROM {SEARCH_TABLE} "
+            f"JOIN plant_training_submissions s ON s.submission_id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH :match{status_clause(statuses, 's.status')} "
+            f"ORDER BY {SEARCH_TABLE}.rank LIMIT :limit"
+        ), statuses)
+        params['limit'] = max(limit * CANDIDATES_PER_RESULT, MIN_CANDIDATES)
+        ids = [row[0] for row in db.session.execute(statement, dict(params, match=fts5_phrase(query)))]
+        fuzzy_match = fts5_fuzzy_match(query)
+        if len(ids) < limit and fuzzy_match:
+            seen = set(ids)
+            ids.extend(row[0] for row in db.session.execute(statement, dict(params, match=fuzzy_match))
+                       if row[0] not in seen)
+        return [(submission_id, None) for submission_id in ids]
+
+    if backend in ('postgres', 'postgres-fts'):
+        tsvector = f"to_tsvector('simple', {SEARCH_DOCUMENT})"
+        rank = f"ts_rank({tsvector}, plainto_tsquery('simple', :q))"
+        condition = f"{tsvector} @@ plainto_tsquery('simple', :q)"
+        if backend == 'postgres':
+            rank = f"greatest(word_similarity(:q, {SEARCH_DOCUMENT}), {rank})"
+            condition = f"(:q <% {SEARCH_DOCUMENT} OR {condition})"
+        statement = text(
+            f"SELECT submission_id, {rank} AS score FROM plant_training_submissions "
+            f"WHERE {condition}{status_clause(statuses)} ORDER BY score DESC LIMIT :limit"
+        )
+        return [(row[0], float(row[1])) for row in db.session.execute(bind_statuses(statement, statuses), params)]
+
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    Submission = PlantTrainingSubmission
+    rows = db.session.query(Submission.submission_id).filter(or_(
+        Submission.plant_name.ilike(pattern, escape='\\'),
+        Submission.scientific_name.ilike(pattern, escape='\\'),
+        Submission.common_names.ilike(pattern, escape='\\')
+    ))
+    if statuses:
+        rows = rows.filter(Submission.status.in_(statuses))
+    return [(row[0], None) for row in rows.limit(max(limit * CANDIDATES_PER_RESULT, MIN_CANDIDATES))]
+
+
+@search.route('/api/train-plant/search', methods=['GET'])
+def search_submissions():
+    """
+    Find training submissions by plant name, scientific name or common name.
+    ?q= (at least 3 characters), optional ?status= (comma-separated) and ?limit=.
+    Matches are typo-tolerant and ranked by similarity, best first.
+    """
+    query = normalize_query(request.args.get('q', ''))
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify({"error": f"Search query must be at least {MIN_QUERY_LENGTH} characters"}), 400
+    statuses = [s.strip() for s in request.args.get('status', '').split(',') if s.strip()]
+    if any(s not in STATUSES for s in statuses):
+        return jsonify({"error": f"Invalid status, expected one of: {', '.join(STATUSES)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid limit, expected an integer"}), 400
+
+    try:
+        backend = get_search_backend()
+        with timed_stage('db_query'):
+            candidates = candidate_ids(backend, query, statuses, limit)
+            Submission = PlantTrainingSubmission
+            rows = db.session.query(Submission, Submission.image_data.isnot(None).label('has_legacy_image')).options(
+                load_only(*(getattr(Submission, column) for column in Submission.SUMMARY_COLUMNS + ('common_names',)))
+            ).filter(Submission.submission_id.in_([submission_id for submission_id, _ in candidates])).all() if candidates else []
+
+        scores = dict(candidates)
+        results = []
+        for submission, has_legacy_image in rows:
+            score = scores[submission.submission_id]
+            if score is None:
+                score = score_submission(query, submission)
+                if score < MIN_SCORE:
+                    continue
+            result = submission.to_summary_dict(has_image=bool(submission.image_digest or has_legacy_image))
+            result['common_names'] = submission.common_names
+            result['score'] = round(score, 3)
+            results.append(result)
+        results.sort(key=lambda result: (-result['score'], result['submission_id']))
+
+        return jsonify({
+            "query": query,
+            "backend": backend,
+            "results": results[:limit]
+        }), 200
+
+    except Exception as e:
+        record_error(e)
+        print(f"Error in search_submissions: {str(e)}")
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
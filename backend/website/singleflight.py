@@ -0,0 +1,241 @@
+from flask import current_app
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows - only coalesce within a process
+    fcntl = None
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when waiting on another caller's in-flight request takes too long"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key so only one runs upstream.
+    Threads in the same worker wait on an Event; workers on the same host
+    serialise on a per-key file lock and pick up the leader's result file.
+    """
+
+    def __init__(self, lock_dir=None, wait_timeout=120.0, result_ttl=10.0, cross_process=True):
+        self.lock_dir = lock_dir or os.path.join(tempfile.gettempdir(), 'egrowtify-singleflight')
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.cross_process = cross_process and fcntl is not None
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._last_sweep = 0.0
+        self._stats = {
+            'leaders': 0,
+            'followers': 0,
+            'cross_process_shared': 0,
+            'timeouts': 0,
+        }
+
+        if self.cross_process:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from Flask app config"""
+        return cls(
+            lock_dir=config['SINGLEFLIGHT_LOCK_DIR'],
+            wait_timeout=config['SINGLEFLIGHT_TIMEOUT'],
+            result_ttl=config['SINGLEFLIGHT_RESULT_TTL'],
+            cross_process=config['SINGLEFLIGHT_CROSS_PROCESS'],
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['leaders'] += 1
+            else:
+                self._stats['followers'] += 1
+
+        if not leader:
+            if not call.event.wait(self.wait_timeout):
+                self._count('timeouts')
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key[:12]}")
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            if self.cross_process:
+                call.result = self._do_cross_process(key, fn)
+            else:
+                call.result = fn()
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _do_cross_process(self, key, fn):
+        lock_path = os.path.join(self.lock_dir, f'{key}.lock')
+        result_path = os.path.join(self.lock_dir, f'{key}.json')
+
+        with open(lock_path, 'a+') as lock_file:
+            deadline = time.monotonic() + self.wait_timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        self._count('timeouts')
+                        raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key[:12]}")
+                    time.sleep(0.05)
+
+            try:
+                # Another worker may have just finished the same request
+                shared = self._read_result(result_path)
+                if shared is not None:
+                    self._count('cross_process_shared')
+                    return shared
+
+                result = fn()
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                self._sweep()
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"⚠️ Could not share in-flight result with other workers: {str(e)}")
+
+    def _sweep(self):
+        """Remove stale result files and unused lock files at most once per TTL window"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < max(self.result_ttl, 1.0):
+                return
+            self._last_sweep = now
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.lock_dir, name)
+            try:
+                age = now - os.path.getmtime(path)
+                if name.endswith('.lock'):
+                    if age > self.wait_timeout * 2:
+                        self._remove_idle_lock(path)
+                elif age > max(self.result_ttl * 6, 60):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_idle_lock(self, path):
+        """Only delete a lock file nobody currently holds"""
+        with open(path, 'a+') as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.remove(path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        stats['cross_process'] = self.cross_process
+        return stats
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for the ASGI app: concurrent tasks with
+    the same key await one shared upstream call. Coalescing is per event loop
+    (i.e. per worker process).
+    """
+
+    def __init__(self, wait_timeout=120.0):
+        self.wait_timeout = wait_timeout
+        self._futures = {}
+        self._stats = {
+            'leaders': 0,
+            'followers': 0,
+            'timeouts': 0,
+        }
+
+    async def do(self, key, fn):
+        """Await fn() once for all concurrent callers with the same key"""
+        task = self._futures.get(key)
+        if task is not None:
+            self._stats['followers'] += 1
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._stats['timeouts'] += 1
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key[:12]}")
+            return copy.deepcopy(result)
+
+        self._stats['leaders'] += 1
+        # The call runs in its own task, so a cancelled leader (client gone) doesn't cancel it for the followers
+        task = asyncio.ensure_future(fn())
+        self._futures[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _finished(self, key, task):
+        if self._futures.get(key) is task:
+            del self._futures[key]
+        if not task.cancelled():
+            task.exception()  # nobody may be waiting - don't warn about an unretrieved exception
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._futures)
+        return stats
+
+
+def get_single_flight():
+    return current_app.extensions['openai_singleflight']
+
+
+def get_async_single_flight():
+    return current_app.extensions['openai_async_singleflight']
@@ -0,0 +1,105 @@
+from flask import current_app
+from website.imaging import CHUNK_SIZE, ImageSource, detect_mime
+import base64
+import hashlib
+import tempfile
+
+# Bytes detect_mime needs to recognise every format we accept
+SNIFF_BYTES = 16
+# 4 base64 characters decode to 3 bytes, so decode the text in multiples of 4
+BASE64_TEXT_CHUNK = 4 * 16 * 1024
+
+
+class UploadRejected(Exception):
+    """An upload that is empty, too large or not an image we accept"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_image_head(head):
+    """Reject an upload from its first bytes, before the rest is read; returns the MIME type"""
+    if not head:
+        raise UploadRejected("Empty image file", 400)
+    mime_type = detect_mime(head)
+    if mime_type is None:
+        raise UploadRejected("Unsupported image type (expected JPEG, PNG, WebP, GIF or BMP)", 415)
+    return mime_type
+
+
+def spool_upload(stream, max_bytes=None, detach=False):
+    """
+    Validate and hash an uploaded file a chunk at a time, returns an ImageSource.
+    Werkzeug and Starlette already spool multipart files to a temporary file, so
+    seekable streams are used in place; anything else (or detach=True, for
+    streamed responses that outlive the request's files) is copied into our own
+    spooled temporary file. The magic bytes are checked before the rest is read.
+    """
+    max_bytes = max_bytes or current_app.config['UPLOAD_MAX_BYTES']
+    seekable = not detach and hasattr(stream, 'seekable') and stream.seekable()
+    if seekable:
+        stream.seek(0)
+        spool = None
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_MEMORY'])
+
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+    head = b''
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if mime_type is None:
+                head += chunk[:SNIFF_BYTES - len(head)]
+                if len(head) >= SNIFF_BYTES:
+                    mime_type = check_image_head(head)
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(f"Image too large (max {max_bytes // (1024 * 1024)}MB)", 413)
+            hasher.update(chunk)
+            if spool is not None:
+                spool.write(chunk)
+        if mime_type is None:
+            mime_type = check_image_head(head)  # uploads shorter than SNIFF_BYTES
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    return ImageSource(fileobj=stream if seekable else spool, size=size, digest=hasher.hexdigest(),
+                       mime_type=mime_type, owns_file=not seekable)
+
+
+def spool_base64(text, max_bytes=None):
+    """
+    Decode base64 image text (from a JSON body) into a spooled temporary file
+    a chunk at a time, returns an ImageSource. Raises ValueError on bad base64.
+    """
+    max_bytes = max_bytes or current_app.config['UPLOAD_MAX_BYTES']
+    if '\n' in text:
+        text = ''.join(text.split())  # line-wrapped base64 would break the 4-character alignment
+    spool = tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_MEMORY'])
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+    try:
+        for start in range(0, len(text), BASE64_TEXT_CHUNK):
+            chunk = base64.b64decode(text[start:start + BASE64_TEXT_CHUNK])  # binascii.Error is a ValueError
+            if mime_type is None:
+                mime_type = check_image_head(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(f"Image too large (max {max_bytes // (1024 * 1024)}MB)", 413)
+            hasher.update(chunk)
+            spool.write(chunk)
+        if mime_type is None:
+            check_image_head(b'')
+    except BaseException:
+        spool.close()
+        raise
+
+    return ImageSource(fileobj=spool, size=size, digest=hasher.hexdigest(), mime_type=mime_type, owns_file=True)
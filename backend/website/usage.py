@@ -0,0 +1,178 @@
+from flask import current_app, g, has_request_context, session
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from website import db
+from website.metrics import get_metrics
+from website.models import AIUsageTracking
+from datetime import datetime
+import os
+import queue
+import threading
+
+
+class UsageWriter:
+    """
+    Write-behind queue for AIUsageTracking rows. Calls only enqueue their row;
+    a background thread bulk-inserts whatever is waiting every flush_interval
+    seconds (sooner once flush_batch rows are queued), so requests don't each
+    pay for a commit. A full queue, or flush_interval=0, writes inline.
+    Rows still queued at exit are flushed by shutdown().
+    """
+
+    def __init__(self, app, flush_interval=1.0, flush_batch=500, max_queue=10000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'written': 0, 'failed': 0, 'flushes': 0, 'inline': 0}
+
+    @classmethod
+    def from_config(cls, app):
+        """Build from Flask app config"""
+        return cls(
+            app,
+            flush_interval=app.config['USAGE_FLUSH_INTERVAL'],
+            flush_batch=app.config['USAGE_FLUSH_BATCH'],
+            max_queue=app.config['USAGE_QUEUE_MAX'],
+        )
+
+    def _ensure_started(self):
+        # Started lazily and per process: a thread started before a fork doesn't exist in the worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='usage-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def record(self, row):
+        """Queue one AIUsageTracking row (a dict of column values)"""
+        if self.flush_interval <= 0:
+            self._write([row], inline=True)
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._write([row], inline=True)  # the writer is behind: don't drop usage, pay for the insert here
+            return
+        if self._queue.qsize() >= self.flush_batch:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every queued row now, returns how many"""
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(rows), self.flush_batch):
+            self._write(rows[start:start + self.flush_batch])
+        return len(rows)
+
+    def _write(self, rows, inline=False):
+        try:
+            with self.app.app_context():
+                # Own session so a caller's transaction is never committed or rolled back here
+                with Session(db.engine) as usage_session:
+                    usage_session.execute(insert(AIUsageTracking), rows)
+                    usage_session.commit()
+            with self._lock:
+                self._stats['written'] += len(rows)
+                self._stats['flushes'] += 1
+                if inline:
+                    self._stats['inline'] += len(rows)
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += len(rows)
+            print(f"⚠️ Could not record {len(rows)} AI usage row(s): {str(e)}")
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+
+def get_usage_writer():
+    return current_app.extensions['usage_writer']
+
+
+def current_usage_user_id():
+    """User to bill an OpenAI call to: set on g by background callers, else the session user"""
+    if g.get('usage_user_id') is not None:
+        return g.usage_user_id
+    if has_request_context():
+        return session.get('user_id', 0)
+    return 0
+
+
+def record_openai_usage(model, usage_type, usage, latency_ms):
+    """
+    Count an OpenAI call's tokens and queue them with its latency as an
+    AIUsageTracking row. `usage` is completion.usage (may be None).
+    Call rows aren't billable: the charge is record_analysis_charge()'s row.
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+    total_tokens = getattr(usage, 'total_tokens', None) or prompt_tokens + completion_tokens
+
+    g.openai_calls = g.get('openai_calls', 0) + 1  # upstream calls made for this request (cache hits make none)
+    metrics = get_metrics()
+    metrics.openai_requests.inc(model=model, usage_type=usage_type)
+    metrics.openai_tokens.inc(prompt_tokens, model=model, kind='prompt')
+    metrics.openai_tokens.inc(completion_tokens, model=model, kind='completion')
+
+    get_usage_writer().record({
+        'user_id': current_usage_user_id(),
+        'usage_type': usage_type,
+        'model': model,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': total_tokens,
+        'latency_ms': latency_ms,
+        'cost': 0,  # the call itself isn't charged to the user
+        'is_free_usage': True,
+        'billable': False,
+        'created_at': datetime.utcnow(),  # when the call happened, not when the row is flushed
+    })
+
+
+def record_analysis_charge(reservation):
+    """
+    Queue the billable AIUsageTracking row for one charged analysis: its cost
+    (PRICE_PER_ANALYSIS when a purchased credit paid for it) and whether it
+    was free. Written once per analysis, however many OpenAI calls it made.
+    """
+    get_usage_writer().record({  # same keys as call rows, so both go in one bulk INSERT
+        'user_id': reservation.user_id,
+        'usage_type': f'{reservation.kind}_analysis',
+        'model': None,
+        'prompt_tokens': None,
+        'completion_tokens': None,
+        'total_tokens': None,
+        'latency_ms': None,
+        'cost': reservation.cost,
+        'is_free_usage': reservation.source == 'free',
+        'billable': True,
+        'created_at': datetime.utcnow(),
+    })
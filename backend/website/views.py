@@ -1,25 +1,93 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, jsonify, request, session, current_app, g, send_file, Response, stream_with_context
 from website import db
-from website.models import AIUsageTracking, AIAnalysisUsage, SoilAnalysisUsage, PlantTrainingSubmission
+from sqlalchemy.orm import load_only
+from website.models import AIUsageTracking, AIAnalysisUsage, SoilAnalysisUsage, PlantTrainingSubmission, EnhancementJob
 import os
 import base64
+import io
 import requests
 import json
+import math
 import time
-import httpx
-from openai import OpenAI
+from website.batch import run_batch
+from website.blobstore import get_blob_store, iter_blob
+from website.clients import get_openai_client, get_openai_key
+from website.credits import CreditsExhausted, get_credit_service
+from website.dedupe import check_near_duplicate, get_duplicate_index, reuse_enhancement
+from website.imaging import ImageSource, detect_mime
+from website.jobs import get_job_runner
+from website.metrics import get_metrics, record_error, timed_stage
+from website.plantid import get_plant_id_client
+from website.ratelimit import UpstreamBusy, get_rate_limiter
+from website.recognition import RecognitionFailed, recognize
+from website.uploads import UploadRejected, spool_base64, spool_upload
+from website.usage import get_usage_writer
+from website.vision import (
+    PLANT_INFO_REQUIRED_FIELDS, PLANT_INFO_SYSTEM_PROMPT, build_plant_info_prompt, route_vision_json,
+    route_stream_vision_json, normalize_plant_info, needs_enhancement, enhance_plant_data, serialize_common_names
+)
 from datetime import datetime
 import uuid
 
 views = Blueprint('views', __name__)
 
-# Configuration
-FREE_ANALYSES_BASIC = int(os.getenv('FREE_ANALYSES_BASIC', '5'))
-FREE_ANALYSES_PREMIUM = int(os.getenv('FREE_ANALYSES_PREMIUM', '10'))
-PRICE_PER_ANALYSIS = float(os.getenv('PRICE_PER_ANALYSIS', '20.00'))
+# Configuration: free analysis limits (FREE_ANALYSES_BASIC/PREMIUM) and PRICE_PER_ANALYSIS are in app.config
 
-# Cache for OpenAI responses (in-memory, simple implementation)
-openai_cache = {}
+@views.before_app_request
+def start_background_workers():
+    """Start this worker's enhancement job pool (resumes jobs left over from a restart)"""
+    get_job_runner().start()
+
+@views.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@views.after_app_request
+def record_request_metrics(response):
+    """Request latency histogram (streamed responses are timed up to the first byte)"""
+    started = g.get('request_started')
+    if started is not None:
+        get_metrics().request_seconds.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+@views.after_request
+def add_image_stats_headers(response):
+    """Expose before/after image payload size for requests that uploaded to OpenAI"""
+    image_stats = g.get('image_stats')
+    if image_stats:
+        response.headers['X-Image-Bytes-Original'] = str(image_stats['original_bytes'])
+        response.headers['X-Image-Bytes-Sent'] = str(image_stats['sent_bytes'])
+        response.headers['X-Image-Detail'] = image_stats['detail']
+    return response
+
+@views.after_request
+def add_model_tier_headers(response):
+    """Which vision model tier answered, and whether a weaker one was tried first"""
+    model_tier = g.get('model_tier')
+    if model_tier:
+        response.headers['X-Model-Tier'] = model_tier['model']
+        response.headers['X-Model-Escalated'] = str(model_tier['escalated']).lower()
+    return response
+
+def upstream_busy_response(error):
+    """503 with Retry-After when OpenAI capacity is exhausted, so clients back off"""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+def credits_exhausted_response(error, user_id):
+    """402 with the user's balance when they have no analyses left"""
+    return jsonify({
+        "error": str(error),
+        "credits": get_credit_service().balance(error.kind, user_id),
+        "price_per_analysis": get_credit_service().price_per_analysis
+    }), 402
 
 def get_user_id():
     """Get or create a session-based user ID"""
@@ -51,81 +119,329 @@ def generate_plant_info():
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
-        # Read and encode image
-        image_bytes = file.read()
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+        # Validate and hash the upload in chunks (it stays in werkzeug's spooled temp file)
+        with timed_stage('upload_read'):
+            image = spool_upload(file.stream)
         
         # Get optional plant name hint
         plant_name_hint = request.form.get('plant_name', '')
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=clean_key, http_client=httpx.Client())
+        # Pooled OpenAI client (reuses keep-alive connections)
+        client = get_openai_client(clean_key)
         
-        system_prompt = """You are an expert botanist and horticulturist specializing in plant identification and care.
-Analyze the provided plant image and generate comprehensive plant information in JSON format.
-
-Return your analysis as strict JSON with these exact keys:
-- plant_name (common name of the plant, e.g., "Kangkong")
-- scientific_name (binomial nomenclature, e.g., "Ipomoea aquatica")
-- common_names (array of alternative common names, e.g., ["Water Spinach", "Ong Choy"])
-- plant_type (one of: "vegetable", "fruit", "herb", "flower", "tree", "shrub", "other")
-- description (detailed description of appearance, characteristics, origin - 2-3 sentences)
-- care_instructions (comprehensive care guide including: watering frequency, sunlight requirements, soil type, fertilizing schedule, pruning needs, temperature range - formatted as a paragraph)
-
-Be accurate and specific. If you cannot identify the plant with confidence, indicate uncertainty in the description.
-For Philippine/tropical plants, provide region-specific care instructions."""
-
-        user_prompt = f"""Analyze this plant image and generate complete plant information.
-{f'User suggests the plant name might be: {plant_name_hint}' if plant_name_hint else ''}
-
-Provide detailed, accurate information about:
-1. Plant identification (common name, scientific name, alternative names)
-2. Plant type/category
-3. Physical description (appearance, size, leaves, flowers if visible)
-4. Comprehensive care instructions (watering, sunlight, soil, fertilizing, pruning, temperature)
-
-Format all information as detailed JSON."""
-
         print(f"🤖 Generating plant info with OpenAI...")
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}
-                        }
-                    ]
-                }
-            ],
+        result = route_vision_json(
+            client,
+            image,
+            PLANT_INFO_SYSTEM_PROMPT,
+            build_plant_info_prompt(plant_name_hint),
+            PLANT_INFO_REQUIRED_FIELDS,
             temperature=0.3,
             max_tokens=1500
         )
-        
-        result = json.loads(completion.choices[0].message.content)
-        print(f"✅ Plant info generated successfully")
+        print(f"✅ Plant info generated successfully ({g.model_tier['model']})")
         
         # Ensure all fields are present with defaults
-        return jsonify({
-            "plant_name": result.get("plant_name", ""),
-            "scientific_name": result.get("scientific_name", ""),
-            "common_names": result.get("common_names", []),
-            "plant_type": result.get("plant_type", ""),
-            "description": result.get("description", ""),
-            "care_instructions": result.get("care_instructions", "")
-        }), 200
+        return jsonify(normalize_plant_info(result)), 200
         
+    except UploadRejected as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), e.status
+    except UpstreamBusy as e:
+        record_error(e)
+        print(f"⏳ OpenAI busy, shedding generate_plant_info: {str(e)}")
+        return upstream_busy_response(e)
     except Exception as e:
+        record_error(e)
         print(f"Error in generate_plant_info: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"Failed to generate plant information: {str(e)}"}), 500
 
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@views.route('/api/train-plant/generate/stream', methods=['POST'])
+def generate_plant_info_stream():
+    """
+    Streaming version of /api/train-plant/generate using Server-Sent Events.
+    Emits a 'field' event as each plant info field is generated, then a 'result'
+    event with the validated object (or an 'error' event). An 'escalate' event
+    means the answer so far was weak and a stronger model's fields follow.
+    """
+    clean_key = get_openai_key()
+    if not clean_key:
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+    
+    if 'image' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
+    
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({"error": "No image file selected"}), 400
+    
+    try:
+        with timed_stage('upload_read'):
+            image = spool_upload(file.stream, detach=True)
+    except UploadRejected as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), e.status
+    plant_name_hint = request.form.get('plant_name', '')
+    client = get_openai_client(clean_key)
+    
+    def generate():
+        try:
+            print(f"🤖 Streaming plant info from OpenAI...")
+            events = route_stream_vision_json(
+                client,
+                image,
+                PLANT_INFO_SYSTEM_PROMPT,
+                build_plant_info_prompt(plant_name_hint),
+                PLANT_INFO_REQUIRED_FIELDS,
+                temperature=0.3,
+                max_tokens=1500
+            )
+            for event in events:
+                if event[0] == 'field':
+                    _, field, value = event
+                    yield sse_event('field', {"field": field, "value": value})
+                elif event[0] == 'escalate':
+                    yield sse_event('escalate', {"from": event[1], "to": event[2]})
+                else:
+                    yield sse_event('result', dict(normalize_plant_info(event[1]), model=g.model_tier['model']))
+            print(f"✅ Plant info streamed successfully")
+        except UpstreamBusy as e:
+            record_error(e)
+            print(f"⏳ OpenAI busy, shedding generate_plant_info_stream: {str(e)}")
+            yield sse_event('error', {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            record_error(e)
+            print(f"Error in generate_plant_info_stream: {str(e)}")
+            yield sse_event('error', {"error": f"Failed to generate plant information: {str(e)}"})
+        finally:
+            image.close()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+@views.route('/api/train-plant/generate/batch', methods=['POST'])
+def generate_plant_info_batch():
+    """
+    Generate plant info for many images in one request (multipart 'images' files).
+    Images are sent to OpenAI concurrently (BATCH_CONCURRENCY at a time) and results
+    are streamed back as newline-delimited JSON in completion order, one line per image,
+    followed by a summary line. A rejected upload, or a failed or timed out image,
+    gets an error line without failing the rest of the batch.
+    Optional 'plant_name' fields: one hint for every image, or one per image in order.
+    """
+    clean_key = get_openai_key()
+    if not clean_key:
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+
+    files = [file for file in request.files.getlist('images') + request.files.getlist('image') if file.filename]
+    if not files:
+        return jsonify({"error": "No image files provided"}), 400
+
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+    if len(files) > max_items:
+        return jsonify({"error": f"Too many images in one batch (max {max_items})"}), 400
+
+    hints = request.form.getlist('plant_name')
+    items, rejected = [], []
+    with timed_stage('upload_read'):
+        for index, file in enumerate(files):
+            item = {
+                'index': index,
+                'filename': file.filename,
+                'plant_name': hints[0] if len(hints) == 1 else (hints[index] if index < len(hints) else ''),
+            }
+            # Each file is validated on its own, so one bad upload is just an error line
+            try:
+                item['image'] = spool_upload(file.stream, detach=True)
+            except UploadRejected as e:
+                record_error(e)
+                rejected.append((item, e))
+                continue
+            items.append(item)
+
+    app = current_app._get_current_object()
+    concurrency = app.config['BATCH_CONCURRENCY']
+    item_timeout = app.config['BATCH_ITEM_TIMEOUT']
+    # Same pooled connections; the per-call timeout bounds each upstream request
+    client = get_openai_client(clean_key).with_options(timeout=item_timeout)
+
+    endpoint = request.endpoint
+    user_id = get_user_id()
+
+    def generate_one(item):
+        # Worker threads only have an app context, so carry the request's labels over
+        g.metrics_endpoint = endpoint
+        g.usage_user_id = user_id
+        result = route_vision_json(
+            client,
+            item['image'],
+            PLANT_INFO_SYSTEM_PROMPT,
+            build_plant_info_prompt(item['plant_name']),
+            PLANT_INFO_REQUIRED_FIELDS,
+            temperature=0.3,
+            max_tokens=1500
+        )
+        return normalize_plant_info(result), g.get('image_stats'), g.model_tier['model']
+
+    def generate():
+        started = time.monotonic()
+        succeeded = failed = 0
+        try:
+            for item, error in rejected:
+                failed += 1
+                print(f"⚠️ Batch item {item['index']} ({item['filename']}) rejected: {str(error)}")
+                yield json.dumps({"index": item['index'], "filename": item['filename'], "status": "error",
+                                  "error": str(error)}) + "\n"
+
+            print(f"🤖 Generating plant info for a batch of {len(items)} images ({concurrency} at a time)...")
+            for position, outcome, error in run_batch(app, items, generate_one, concurrency, item_timeout):
+                index = items[position]['index']
+                line = {"index": index, "filename": items[position]['filename']}
+                if error is None:
+                    succeeded += 1
+                    line["status"] = "ok"
+                    line["result"], image_stats, line["model"] = outcome
+                    if image_stats:
+                        line["image"] = image_stats
+                else:
+                    failed += 1
+                    record_error(error)
+                    print(f"⚠️ Batch item {index} ({items[position]['filename']}) failed: {str(error)}")
+                    line["status"] = "error"
+                    line["error"] = f"Failed to generate plant information: {str(error)}"
+                    if isinstance(error, UpstreamBusy):
+                        line["retry_after"] = error.retry_after
+                yield json.dumps(line) + "\n"
+
+            print(f"✅ Batch finished: {succeeded} succeeded, {failed} failed")
+            yield json.dumps({
+                "done": True,
+                "total": len(items) + len(rejected),
+                "succeeded": succeeded,
+                "failed": failed,
+                "elapsed_ms": int((time.monotonic() - started) * 1000)
+            }) + "\n"
+        finally:
+            for item in items:
+                item['image'].close()  # removes the spooled temp files
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+def wants_ai_analysis():
+    """The GPT-4o analysis is on unless the request opts out (?analyze=0 or an 'analyze' form field)"""
+    flag = request.values.get('analyze')
+    return flag is None or str(flag).strip().lower() not in ('0', 'false', 'no')
+
+@views.route('/api/ai-recognition', methods=['POST'])
+def ai_recognition():
+    """
+    Identify a plant photo (multipart 'image') with Plant.id and have GPT-4o
+    assess its health and care. Both calls start together and are combined in
+    website/recognition.py, so a slow or failed one only costs its own timeout.
+    One plant analysis is charged, and refunded if neither service answers or
+    no upstream call was made (the GPT-4o answer came from the cache).
+    """
+    plant_id = get_plant_id_client()
+    clean_key = get_openai_key()
+    analyze = wants_ai_analysis()
+    if not plant_id.configured and not clean_key:
+        return jsonify({"error": "Neither the Plant.id nor the OpenAI API key is configured"}), 500
+    if not plant_id.configured and not analyze:
+        return jsonify({"error": "Plant.id API key not configured, so the GPT-4o analysis can't be skipped"}), 400
+
+    if 'image' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
+
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({"error": "No image file selected"}), 400
+
+    user_id = get_user_id()
+    try:
+        with timed_stage('upload_read'):
+            image = spool_upload(file.stream)
+
+        # The per-call timeout bounds each OpenAI request; the analysis as a whole has its own deadline
+        client = None
+        if clean_key and analyze:
+            client = get_openai_client(clean_key).with_options(
+                timeout=current_app.config['AI_RECOGNITION_OPENAI_TIMEOUT'])
+
+        print(f"🔎 Recognizing plant with Plant.id and GPT-4o...")
+        with get_credit_service().charge('plant', user_id) as reservation:
+            recognition = recognize(image, plant_id, client)
+        if recognition.billable:
+            reservation.keep()
+        else:
+            reservation.refund()
+        print(f"✅ Plant recognized ({recognition.reconciliation}, "
+              f"Plant.id {recognition.plant_id_status}, GPT-4o {recognition.ai_analysis_status})")
+        return jsonify(recognition.to_dict()), 200
+
+    except UploadRejected as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), e.status
+    except CreditsExhausted as e:
+        record_error(e)
+        return credits_exhausted_response(e, user_id)
+    except RecognitionFailed as e:
+        record_error(e)
+        print(f"Error in ai_recognition: {str(e)}")
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        record_error(e)
+        print(f"Error in ai_recognition: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Failed to recognize plant: {str(e)}"}), 500
+
+def is_async_request(data):
+    """Async enhancement is opt-in per request (?async=1 or an 'async' field) or app-wide"""
+    flag = request.args.get('async', data.get('async'))
+    if flag is None:
+        return current_app.config['TRAIN_PLANT_ASYNC']
+    return str(flag).strip().lower() in ('1', 'true', 'yes')
+
+def build_submission(user_id, data, image=None, image_data=None, image_phash=None, duplicate=None):
+    """
+    Create a pending PlantTrainingSubmission from request data.
+    The image (bytes or an ImageSource) is streamed into the blob store;
+    image_data is only kept for input we couldn't decode. A near-duplicate
+    found at ingest is recorded in duplicate_of.
+    """
+    submission = PlantTrainingSubmission(
+        user_id=user_id,
+        plant_name=data.get('plant_name', ''),
+        scientific_name=data.get('scientific_name', ''),
+        common_names=serialize_common_names(data.get('common_names')),
+        plant_type=data.get('plant_type', ''),
+        description=data.get('description', ''),
+        care_instructions=data.get('care_instructions', ''),
+        image_phash=image_phash,
+        duplicate_of=duplicate.submission_id if duplicate is not None else None,
+        status='pending'
+    )
+    if image:
+        image = ImageSource.coerce(image)
+        with timed_stage('blob_write'):
+            with image.open() as f:
+                submission.image_digest, submission.image_size = get_blob_store().put_file(f)
+        submission.image_mime = image.mime_type or detect_mime(image.read()) or 'application/octet-stream'
+    elif image_data:
+        submission.image_data = image_data
+    return submission
+
 @views.route('/api/train-plant', methods=['POST'])
 def train_new_plant():
     """
@@ -133,6 +449,7 @@ def train_new_plant():
     Accepts both JSON and form data
     Uses OpenAI to enhance the submission if image is provided
     """
+    image = None
     try:
         user_id = get_user_id()
         
@@ -157,8 +474,8 @@ def train_new_plant():
         if 'image' in request.files:
             file = request.files['image']
             if file.filename:
-                image_bytes = file.read()
-                image_data = base64.b64encode(image_bytes).decode('utf-8')
+                with timed_stage('upload_read'):
+                    image = spool_upload(file.stream)
         elif 'image_data' in data and data['image_data']:
             # Remove data URL prefix if present
             img_data = data['image_data']
@@ -166,115 +483,154 @@ def train_new_plant():
                 image_data = img_data.split(',')[1]
             else:
                 image_data = img_data
+            try:
+                with timed_stage('base64_decode'):
+                    image = spool_base64(image_data)
+                image_data = None
+            except ValueError:
+                print(f"⚠️ Could not decode image_data, skipping AI enhancement")
+        
+        # The same photo, recompressed or slightly cropped, doesn't need enhancing twice
+        image_phash = duplicate = None
+        if image:
+            image_phash, duplicate = check_near_duplicate(image, data.get('plant_name'))
+        reused = bool(image and needs_enhancement(data) and reuse_enhancement(data, duplicate))
+        
+        clean_key = get_openai_key()
+        wants_enhancement = bool(image and clean_key and needs_enhancement(data))
+        
+        run_async = wants_enhancement and is_async_request(data)
+        message = "Plant training data submitted successfully. AI enhancement is running in the background."
         
         # Enhance with OpenAI if image is provided and some fields are missing
-        openai_key = os.getenv('OPENAI_API_KEY')
-        if image_data and openai_key:
-            # Check if we need to enhance the data
-            needs_enhancement = (
-                not data.get('scientific_name') or 
-                not data.get('description') or 
-                not data.get('care_instructions')
-            )
-            
-            if needs_enhancement:
-                try:
-                    print(f"🤖 Enhancing training data with OpenAI...")
-                    clean_key = openai_key.strip().strip('"').strip("'")
-                    if clean_key.startswith('sk-'):
-                        client = OpenAI(api_key=clean_key, http_client=httpx.Client())
-                        
-                        system_prompt = """You are an expert botanist. Analyze the plant image and provide missing information in JSON format.
-Return JSON with: scientific_name, description, care_instructions, common_names (array), plant_type."""
-                        
-                        user_prompt = f"""Plant Name: {data.get('plant_name', 'Unknown')}
-{f'Scientific Name: {data.get("scientific_name")}' if data.get('scientific_name') else ''}
-{f'Description: {data.get("description")}' if data.get('description') else ''}
-
-Fill in any missing information based on the image. Provide comprehensive details."""
-                        
-                        completion = client.chat.completions.create(
-                            model="gpt-4o",
-                            response_format={"type": "json_object"},
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {"type": "text", "text": user_prompt},
-                                        {
-                                            "type": "image_url",
-                                            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                                        }
-                                    ]
-                                }
-                            ],
-                            temperature=0.3,
-                            max_tokens=1000
-                        )
-                        
-                        ai_data = json.loads(completion.choices[0].message.content)
-                        
-                        # Fill in missing fields with AI-generated data
-                        if not data.get('scientific_name') and ai_data.get('scientific_name'):
-                            data['scientific_name'] = ai_data['scientific_name']
-                        if not data.get('description') and ai_data.get('description'):
-                            data['description'] = ai_data['description']
-                        if not data.get('care_instructions') and ai_data.get('care_instructions'):
-                            data['care_instructions'] = ai_data['care_instructions']
-                        if not data.get('plant_type') and ai_data.get('plant_type'):
-                            data['plant_type'] = ai_data['plant_type']
-                        if ai_data.get('common_names') and not data.get('common_names'):
-                            if isinstance(ai_data['common_names'], list):
-                                data['common_names'] = ', '.join(ai_data['common_names'])
-                        
-                        print(f"✅ Training data enhanced with AI")
-                except Exception as e:
-                    print(f"⚠️ OpenAI enhancement failed (continuing with user data): {str(e)}")
-                    # Continue with user-provided data even if OpenAI fails
+        if wants_enhancement and not run_async:
+            try:
+                print(f"🤖 Enhancing training data with OpenAI...")
+                enhance_plant_data(get_openai_client(clean_key), data, image)
+                print(f"✅ Training data enhanced with AI")
+            except UpstreamBusy as e:
+                # Don't drop the enhancement: let the background worker retry it once OpenAI has capacity
+                record_error(e)
+                print(f"⏳ OpenAI busy, deferring enhancement to a background job: {str(e)}")
+                run_async = True
+                message = "Plant training data submitted successfully. OpenAI is busy, so AI enhancement will run in the background."
+            except Exception as e:
+                record_error(e)
+                print(f"⚠️ OpenAI enhancement failed (continuing with user data): {str(e)}")
+                # Continue with user-provided data even if OpenAI fails
         
-        # Process common_names
-        common_names_str = ''
-        if 'common_names' in data:
-            if isinstance(data['common_names'], list):
-                common_names_str = json.dumps(data['common_names'])
-            elif isinstance(data['common_names'], str):
-                # If it's a comma-separated string, convert to list then JSON
-                names_list = [n.strip() for n in data['common_names'].split(',') if n.strip()]
-                common_names_str = json.dumps(names_list)
+        # Async mode: store the submission now and enhance it in the background
+        if run_async:
+            submission = build_submission(user_id, data, image, image_data, image_phash, duplicate)
+            db.session.add(submission)
+            db.session.flush()
+            runner = get_job_runner()
+            job = runner.enqueue(submission.submission_id)
+            with timed_stage('db_commit'):
+                db.session.commit()
+            if not runner.submit(job.job_id):
+                print(f"⚠️ Enhancement queue full, job {job.job_id} will be picked up by the sweeper")
+            
+            return jsonify({
+                "success": True,
+                "message": message,
+                "submission_id": submission.submission_id,
+                "duplicate_of": submission.duplicate_of,
+                "job_id": job.job_id,
+                "status": job.status,
+                "status_url": f"/api/train-plant/jobs/{job.job_id}"
+            }), 202
         
         # Create training submission
-        submission = PlantTrainingSubmission(
-            user_id=user_id,
-            plant_name=data.get('plant_name', ''),
-            scientific_name=data.get('scientific_name', ''),
-            common_names=common_names_str,
-            plant_type=data.get('plant_type', ''),
-            description=data.get('description', ''),
-            care_instructions=data.get('care_instructions', ''),
-            image_data=image_data,
-            status='pending'
-        )
+        submission = build_submission(user_id, data, image, image_data, image_phash, duplicate)
         
         db.session.add(submission)
-        db.session.commit()
+        with timed_stage('db_commit'):
+            db.session.commit()
         
         return jsonify({
             "success": True,
             "message": "Plant training data submitted successfully. Thank you for contributing! Our team will review and add it to the system.",
-            "submission_id": submission.submission_id
+            "submission_id": submission.submission_id,
+            "duplicate_of": submission.duplicate_of,
+            "reused_enhancement": reused
         }), 200
         
+    except UploadRejected as e:
+        record_error(e)
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
+        record_error(e)
         print(f"Error in train_new_plant: {str(e)}")
         import traceback
         traceback.print_exc()
         db.session.rollback()
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    finally:
+        if image is not None:
+            image.close()  # removes the spooled temp file
+
+@views.route('/api/train-plant/<int:submission_id>/image', methods=['GET'])
+def get_submission_image(submission_id):
+    """Download a submission's image (supports Range requests and sendfile)"""
+    submission = db.session.query(PlantTrainingSubmission).options(
+        load_only(
+            PlantTrainingSubmission.submission_id,
+            PlantTrainingSubmission.image_digest,
+            PlantTrainingSubmission.image_mime
+        )
+    ).filter_by(submission_id=submission_id).first()
+    if submission is None:
+        return jsonify({"error": "Submission not found"}), 404
+    
+    if submission.image_digest:
+        store = get_blob_store()
+        path = store.local_path(submission.image_digest)
+        if path:
+            if not os.path.exists(path):
+                return jsonify({"error": "Image blob missing"}), 404
+            response = send_file(path, mimetype=submission.image_mime, conditional=True,
+                                 etag=submission.image_digest, max_age=86400)
+        else:
+            response = Response(iter_blob(store, submission.image_digest), mimetype=submission.image_mime)
+            response.headers['ETag'] = f'"{submission.image_digest}"'
+        return response
+    
+    # Legacy rows still holding base64 text (run `flask migrate-image-blobs` to move them)
+    image_data = db.session.query(PlantTrainingSubmission.image_data).filter_by(
+        submission_id=submission_id
+    ).scalar()
+    if not image_data:
+        return jsonify({"error": "Submission has no image"}), 404
+    try:
+        image_bytes = base64.b64decode(image_data)
+    except ValueError:
+        return jsonify({"error": "Stored image could not be decoded"}), 404
+    return send_file(io.BytesIO(image_bytes), mimetype=detect_mime(image_bytes) or 'application/octet-stream',
+                     conditional=True, etag=False)
+
+@views.route('/api/train-plant/jobs/<job_id>', methods=['GET'])
+def get_enhancement_job(job_id):
+    """Poll the status of an async AI enhancement job"""
+    job = db.session.get(EnhancementJob, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    result = job.to_dict()
+    if job.status == 'completed':
+        row = db.session.query(
+            PlantTrainingSubmission, PlantTrainingSubmission.image_data.isnot(None).label('has_legacy_image')
+        ).filter(PlantTrainingSubmission.submission_id == job.submission_id).first()
+        result['submission'] = row[0].to_dict(has_image=bool(row[0].image_digest or row[1])) if row else None
+    return jsonify(result), 200
 
 @views.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    return jsonify(build_health_status()), 200
+
+def build_health_status():
+    """Health payload shared by the Flask and ASGI apps"""
     openai_key = os.getenv('OPENAI_API_KEY')
     plant_id_key = os.getenv('PLANT_ID_API_KEY')
     
@@ -286,14 +642,44 @@ def health_check():
         elif not openai_key.startswith('sk-'):
             openai_status = "invalid format"
     
-    return jsonify({
+    return {
         "status": "healthy",
         "plant_id_api_configured": bool(plant_id_key),
         "openai_api_configured": bool(openai_key),
         "openai_status": openai_status,
-        "openai_key_length": len(openai_key) if openai_key else 0
+        "openai_key_length": len(openai_key) if openai_key else 0,
+        "openai_pool": current_app.extensions['openai_clients'].stats(),
+        "plant_id": get_plant_id_client().stats(),
+        "database_pool": db.engine.pool.status()
+    }
+
+@views.route('/api/credits', methods=['GET'])
+def get_credits():
+    """Free analyses left and purchased credits for this session's user"""
+    user_id = get_user_id()
+    credits = get_credit_service()
+    return jsonify({
+        "user_id": user_id,
+        "plant": credits.balance('plant', user_id),
+        "soil": credits.balance('soil', user_id),
+        "price_per_analysis": credits.price_per_analysis
     }), 200
 
+@views.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters for the OpenAI response cache"""
+    stats = current_app.extensions['openai_cache'].stats()
+    stats['coalescing'] = current_app.extensions['openai_singleflight'].stats()
+    stats['rate_limit'] = get_rate_limiter().stats()
+    stats['near_duplicates'] = get_duplicate_index().stats()
+    stats['usage_writer'] = get_usage_writer().stats()
+    return jsonify(stats), 200
+
+@views.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker (latency per endpoint/stage, OpenAI tokens, errors)"""
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
 @views.route('/api/test-openai', methods=['GET'])
 def test_openai():
     """Test OpenAI API connectivity"""
@@ -317,7 +703,7 @@ def test_openai():
         }), 500
     
     try:
-        client = OpenAI(api_key=clean_key)
+        client = get_openai_client(clean_key)
         
         # Simple test call
         completion = client.chat.completions.create(
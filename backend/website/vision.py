@@ -0,0 +1,476 @@
+from flask import current_app, g
+from website.cache import get_response_cache
+from website.clients import StreamedJSONBody, acreate_chat_completion_streamed, create_chat_completion_streamed
+from website.imaging import ImageSource, prepare_image
+from website.jsonstream import IncrementalObjectParser
+from website.metrics import StageTimer, current_endpoint, get_metrics, observe_stage, timed_stage
+from website.ratelimit import get_rate_limiter
+from website.singleflight import get_async_single_flight, get_single_flight
+from website.usage import record_openai_usage
+import asyncio
+import json
+import uuid
+
+# Prompts shared by every endpoint that sends a plant image to OpenAI
+PLANT_INFO_SYSTEM_PROMPT = """You are an expert botanist and horticulturist specializing in plant identification and care.
+Analyze the provided plant image and generate comprehensive plant information in JSON format.
+
+Return your analysis as strict JSON with these exact keys:
+- plant_name (common name of the plant, e.g., "Kangkong")
+- scientific_name (binomial nomenclature, e.g., "Ipomoea aquatica")
+- common_names (array of alternative common names, e.g., ["Water Spinach", "Ong Choy"])
+- plant_type (one of: "vegetable", "fruit", "herb", "flower", "tree", "shrub", "other")
+- description (detailed description of appearance, characteristics, origin - 2-3 sentences)
+- care_instructions (comprehensive care guide including: watering frequency, sunlight requirements, soil type, fertilizing schedule, pruning needs, temperature range - formatted as a paragraph)
+- confidence (number from 0 to 1: how sure you are of the identification)
+
+Be accurate and specific. If you cannot identify the plant with confidence, indicate uncertainty in the description.
+For Philippine/tropical plants, provide region-specific care instructions."""
+
+ENHANCE_SYSTEM_PROMPT = """You are an expert botanist. Analyze the plant image and provide missing information in JSON format.
+Return JSON with: scientific_name, description, care_instructions, common_names (array), plant_type,
+and confidence (number from 0 to 1: how sure you are of the identification)."""
+
+VISION_MODEL = "gpt-4o"
+
+# Fields an answer must fill in before a cheaper model's answer is accepted
+PLANT_INFO_REQUIRED_FIELDS = ('plant_name', 'scientific_name', 'care_instructions')
+ENHANCE_REQUIRED_FIELDS = ('scientific_name', 'description', 'care_instructions')
+
+# Models sometimes answer confidence in words
+CONFIDENCE_WORDS = {'high': 0.9, 'medium': 0.6, 'moderate': 0.6, 'low': 0.3}
+
+# Images at least this large that are still in a file are streamed into the request body
+STREAM_BODY_MIN_BYTES = 1024 * 1024
+
+
+def build_plant_info_prompt(plant_name_hint=''):
+    """User prompt for /api/train-plant/generate"""
+    return f"""Analyze this plant image and generate complete plant information.
+{f'User suggests the plant name might be: {plant_name_hint}' if plant_name_hint else ''}
+
+Provide detailed, accurate information about:
+1. Plant identification (common name, scientific name, alternative names)
+2. Plant type/category
+3. Physical description (appearance, size, leaves, flowers if visible)
+4. Comprehensive care instructions (watering, sunlight, soil, fertilizing, pruning, temperature)
+
+Format all information as detailed JSON."""
+
+
+def build_enhance_prompt(data):
+    """User prompt for filling in a training submission's missing fields"""
+    return f"""Plant Name: {data.get('plant_name', 'Unknown')}
+{f'Scientific Name: {data.get("scientific_name")}' if data.get('scientific_name') else ''}
+{f'Description: {data.get("description")}' if data.get('description') else ''}
+
+Fill in any missing information based on the image. Provide comprehensive details."""
+
+
+def build_vision_messages(system_prompt, user_prompt, image, image_url=None):
+    """Chat messages carrying the prompts and a prepared image"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": user_prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url or image.data_url(), "detail": image.detail}
+                }
+            ]
+        }
+    ]
+
+
+def build_vision_call(client, image, system_prompt, user_prompt, params, asynchronous=False):
+    """
+    Function that sends one vision request (and is re-run for retries).
+    Large images that are still in a file are base64-encoded in chunks straight
+    into the request body; everything else goes through the SDK as usual.
+    """
+    params = dict(params, response_format={"type": "json_object"})
+    if image.source.in_memory or image.sent_bytes < STREAM_BODY_MIN_BYTES:
+        messages = build_vision_messages(system_prompt, user_prompt, image)
+        return lambda: client.chat.completions.create(messages=messages, **params)
+
+    placeholder = uuid.uuid4().hex  # unguessable, so a prompt can't contain it
+    payload = dict(params, messages=build_vision_messages(system_prompt, user_prompt, image, image_url=placeholder))
+    body = StreamedJSONBody(payload, placeholder, image.data_url_chunks, image.data_url_length())
+    if asynchronous:
+        return lambda: acreate_chat_completion_streamed(client, body)
+    return lambda: create_chat_completion_streamed(client, body)
+
+
+def estimate_tokens(system_prompt, user_prompt, image, max_tokens):
+    """Upper-bound token cost of a vision call, for the tokens-per-minute budget"""
+    return (len(system_prompt) + len(user_prompt)) // 4 + image.input_tokens() + max_tokens
+
+
+def usage_total_tokens(usage):
+    return getattr(usage, 'total_tokens', None) if usage is not None else None
+
+
+def vision_cache_key(image, system_prompt, user_prompt, model, params):
+    return get_response_cache().make_key(None, system_prompt + '\n' + user_prompt, model, params,
+                                         image_digest=image.digest)
+
+
+def request_vision_json(client, image, system_prompt, user_prompt,
+                        model=VISION_MODEL, temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """
+    Send an image (bytes or an ImageSource) + prompts to OpenAI and return the parsed JSON answer.
+    Answers are cached on a hash of the image bytes, prompts, model and parameters,
+    and concurrent identical requests are coalesced into a single upstream call.
+    """
+    image = ImageSource.coerce(image)
+    cache = get_response_cache()
+    image_options = get_image_options()
+    params = {'temperature': temperature, 'max_tokens': max_tokens, 'image': image_options}
+    cache_key = vision_cache_key(image, system_prompt, user_prompt, model, params)
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ OpenAI response served from cache ({cache_key[:12]})")
+        return cached
+
+    def call_openai():
+        with timed_stage('image_prepare'):
+            prepared = prepare_once(image, image_options)
+        record_image_stats(prepared)
+        with timed_stage('base64_encode'):
+            create = build_vision_call(client, prepared, system_prompt, user_prompt,
+                                       {'model': model, 'temperature': temperature, 'max_tokens': max_tokens})
+        limiter = get_rate_limiter()
+        tokens = estimate_tokens(system_prompt, user_prompt, prepared, max_tokens)
+        with timed_stage('openai_request') as timer:
+            completion = limiter.call(create, tokens)
+        limiter.settle(tokens, usage_total_tokens(completion.usage))
+        record_openai_usage(model, usage_type, completion.usage, timer.milliseconds)
+        with timed_stage('json_parse'):
+            result = json.loads(completion.choices[0].message.content)
+        cache.set(cache_key, result, model=model)
+        return result
+
+    # Identical requests already in flight (double clicks, retries) share one upstream call
+    return get_single_flight().do(cache_key, call_openai)
+
+
+async def arequest_vision_json(client, image, system_prompt, user_prompt,
+                              model=VISION_MODEL, temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """
+    asyncio version of request_vision_json for the ASGI app (client is an AsyncOpenAI).
+    Image preprocessing and database cache reads run in worker threads so the
+    event loop stays free for other in-flight calls.
+    """
+    image = ImageSource.coerce(image)
+    cache = get_response_cache()
+    image_options = get_image_options()
+    params = {'temperature': temperature, 'max_tokens': max_tokens, 'image': image_options}
+    cache_key = vision_cache_key(image, system_prompt, user_prompt, model, params)
+
+    cached = await asyncio.to_thread(cache.get, cache_key) if cache.persistent else cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ OpenAI response served from cache ({cache_key[:12]})")
+        return cached
+
+    async def call_openai():
+        with timed_stage('image_prepare'):
+            prepared = await asyncio.to_thread(prepare_once, image, image_options)
+        record_image_stats(prepared)
+        with timed_stage('base64_encode'):
+            create = build_vision_call(client, prepared, system_prompt, user_prompt,
+                                       {'model': model, 'temperature': temperature, 'max_tokens': max_tokens},
+                                       asynchronous=True)
+        limiter = get_rate_limiter()
+        tokens = estimate_tokens(system_prompt, user_prompt, prepared, max_tokens)
+        with timed_stage('openai_request') as timer:
+            completion = await limiter.acall(create, tokens)
+        await limiter.asettle(tokens, usage_total_tokens(completion.usage))
+        await asyncio.to_thread(record_openai_usage, model, usage_type, completion.usage, timer.milliseconds)
+        with timed_stage('json_parse'):
+            result = json.loads(completion.choices[0].message.content)
+        if cache.persistent:
+            await asyncio.to_thread(cache.set, cache_key, result, model)
+        else:
+            cache.set(cache_key, result, model=model)
+        return result
+
+    return await get_async_single_flight().do(cache_key, call_openai)
+
+
+def stream_vision_json(client, image, system_prompt, user_prompt,
+                       model=VISION_MODEL, temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """
+    Streaming variant of request_vision_json.
+    Yields ('field', key, value) as each top-level JSON field completes, then
+    ('result', parsed_json). Cache hits replay the cached fields immediately.
+    The SDK parses the event stream, so the image data URL is built in memory here.
+    """
+    image = ImageSource.coerce(image)
+    cache = get_response_cache()
+    image_options = get_image_options()
+    params = {'temperature': temperature, 'max_tokens': max_tokens, 'image': image_options}
+    cache_key = vision_cache_key(image, system_prompt, user_prompt, model, params)
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print(f"⚡ OpenAI response served from cache ({cache_key[:12]})")
+        for key, value in cached.items():
+            yield 'field', key, value
+        yield 'result', cached
+        return
+
+    with timed_stage('image_prepare'):
+        prepared = prepare_once(image, image_options)
+    record_image_stats(prepared)
+    with timed_stage('base64_encode'):
+        messages = build_vision_messages(system_prompt, user_prompt, prepared)
+    limiter = get_rate_limiter()
+    tokens = estimate_tokens(system_prompt, user_prompt, prepared, max_tokens)
+    timer = StageTimer()  # covers the whole stream, not just the first byte
+    # Only opening the stream is retried - fields may already have been sent after that
+    stream = limiter.call(lambda: client.chat.completions.create(
+        model=model,
+        response_format={"type": "json_object"},
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True}  # token counts arrive in a final chunk
+    ), tokens)
+
+    parser = IncrementalObjectParser()
+    usage = None
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                for key, value in parser.feed(delta):
+                    yield 'field', key, value
+    finally:
+        stream.close()
+    observe_stage('openai_request', timer.stop())
+    limiter.settle(tokens, usage_total_tokens(usage))
+    record_openai_usage(model, usage_type, usage, timer.milliseconds)
+
+    with timed_stage('json_parse'):
+        result = parser.result()
+    cache.set(cache_key, result, model=model)
+    yield 'result', result
+
+
+def get_model_tiers():
+    """Vision models to try in order, cheapest first (VISION_MODEL_TIERS)"""
+    return current_app.config['VISION_MODEL_TIERS'] or [VISION_MODEL]
+
+
+def answer_confidence(result):
+    """The model's self-reported confidence as 0-1, None if it didn't give one"""
+    value = result.get('confidence')
+    if isinstance(value, str):
+        value = CONFIDENCE_WORDS.get(value.strip().lower(), value.strip().rstrip('%'))
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value / 100.0 if value > 1 else value
+
+
+def score_answer(result, required_fields, missing_confidence=1.0):
+    """
+    0-1 quality score: self-reported confidence, 0 if a required field is
+    missing or empty. An answer without a confidence scores missing_confidence
+    (by default complete answers pass on their fields alone).
+    """
+    if any(not str(result.get(field) or '').strip() for field in required_fields):
+        return 0.0
+    confidence = answer_confidence(result)
+    return missing_confidence if confidence is None else max(0.0, min(1.0, confidence))
+
+
+def should_escalate(result, required_fields, tier, tiers):
+    """Whether to re-ask the next (stronger) model tier; returns (escalate, score)"""
+    score = score_answer(result, required_fields, current_app.config['VISION_MISSING_CONFIDENCE_SCORE'])
+    escalate = tier < len(tiers) - 1 and score < current_app.config['VISION_ESCALATE_BELOW']
+    if escalate:
+        print(f"↗️ {tiers[tier]} answered with score {score:.2f}, escalating to {tiers[tier + 1]}")
+    return escalate, score
+
+
+def record_model_tier(model, tier, score):
+    """Remember which tier answered (response header, batch lines) and count it"""
+    g.model_tier = {'model': model, 'tier': tier, 'escalated': tier > 0, 'score': round(score, 2)}
+    get_metrics().vision_answers.inc(endpoint=current_endpoint(), model=model, escalated=str(tier > 0).lower())
+
+
+def route_vision_json(client, image, system_prompt, user_prompt, required_fields,
+                      temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """
+    request_vision_json over the model tiers: the cheapest model answers first,
+    and the next tier is only asked when the answer scores below
+    VISION_ESCALATE_BELOW. Returns the accepted answer.
+    """
+    image = ImageSource.coerce(image)  # one object, so escalations reuse the prepared image
+    tiers = get_model_tiers()
+    for tier, model in enumerate(tiers):
+        result = request_vision_json(client, image, system_prompt, user_prompt, model=model,
+                                     temperature=temperature, max_tokens=max_tokens, usage_type=usage_type)
+        escalate, score = should_escalate(result, required_fields, tier, tiers)
+        if not escalate:
+            break
+    record_model_tier(model, tier, score)
+    return result
+
+
+async def aroute_vision_json(client, image, system_prompt, user_prompt, required_fields,
+                             temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """asyncio version of route_vision_json (client is an AsyncOpenAI)"""
+    image = ImageSource.coerce(image)
+    tiers = get_model_tiers()
+    for tier, model in enumerate(tiers):
+        result = await arequest_vision_json(client, image, system_prompt, user_prompt, model=model,
+                                            temperature=temperature, max_tokens=max_tokens, usage_type=usage_type)
+        escalate, score = should_escalate(result, required_fields, tier, tiers)
+        if not escalate:
+            break
+    record_model_tier(model, tier, score)
+    return result
+
+
+def route_stream_vision_json(client, image, system_prompt, user_prompt, required_fields,
+                             temperature=0.3, max_tokens=1500, usage_type='plant_info'):
+    """
+    stream_vision_json over the model tiers. Yields the same events, plus
+    ('escalate', from_model, to_model) when a weak answer is re-asked; the
+    stronger model's fields then replace the ones already streamed.
+    """
+    image = ImageSource.coerce(image)
+    tiers = get_model_tiers()
+    for tier, model in enumerate(tiers):
+        events = stream_vision_json(client, image, system_prompt, user_prompt, model=model,
+                                    temperature=temperature, max_tokens=max_tokens, usage_type=usage_type)
+        for event in events:
+            if event[0] == 'result':
+                result = event[1]
+            else:
+                yield event
+        escalate, score = should_escalate(result, required_fields, tier, tiers)
+        if not escalate:
+            break
+        yield 'escalate', model, tiers[tier + 1]
+    record_model_tier(model, tier, score)
+    yield 'result', result
+
+
+def needs_enhancement(data):
+    """A submission is worth enhancing when key descriptive fields are missing"""
+    return (
+        not data.get('scientific_name') or 
+        not data.get('description') or 
+        not data.get('care_instructions')
+    )
+
+
+def enhance_plant_data(client, data, image):
+    """Fill in a training submission's missing fields from the image (updates data in place)"""
+    ai_data = route_vision_json(
+        client,
+        image,
+        ENHANCE_SYSTEM_PROMPT,
+        build_enhance_prompt(data),
+        ENHANCE_REQUIRED_FIELDS,
+        temperature=0.3,
+        max_tokens=1000,
+        usage_type='enhancement'
+    )
+    return apply_enhancement(data, ai_data)
+
+
+async def aenhance_plant_data(client, data, image):
+    """asyncio version of enhance_plant_data (client is an AsyncOpenAI)"""
+    ai_data = await aroute_vision_json(
+        client,
+        image,
+        ENHANCE_SYSTEM_PROMPT,
+        build_enhance_prompt(data),
+        ENHANCE_REQUIRED_FIELDS,
+        temperature=0.3,
+        max_tokens=1000,
+        usage_type='enhancement'
+    )
+    return apply_enhancement(data, ai_data)
+
+
+def apply_enhancement(data, ai_data):
+    """Fill in missing fields with AI-generated data"""
+    if not data.get('scientific_name') and ai_data.get('scientific_name'):
+        data['scientific_name'] = ai_data['scientific_name']
+    if not data.get('description') and ai_data.get('description'):
+        data['description'] = ai_data['description']
+    if not data.get('care_instructions') and ai_data.get('care_instructions'):
+        data['care_instructions'] = ai_data['care_instructions']
+    if not data.get('plant_type') and ai_data.get('plant_type'):
+        data['plant_type'] = ai_data['plant_type']
+    if ai_data.get('common_names') and not data.get('common_names'):
+        if isinstance(ai_data['common_names'], list):
+            data['common_names'] = ', '.join(ai_data['common_names'])
+    return data
+
+
+def serialize_common_names(common_names):
+    """Store common names as a JSON array string (accepts a list or comma-separated string)"""
+    if isinstance(common_names, list):
+        return json.dumps(common_names)
+    if isinstance(common_names, str):
+        # If it's a comma-separated string, convert to list then JSON
+        names_list = [n.strip() for n in common_names.split(',') if n.strip()]
+        return json.dumps(names_list)
+    return ''
+
+
+def prepare_once(image, image_options):
+    """prepare_image, remembered on the ImageSource so an escalation doesn't decode it again"""
+    key = tuple(sorted(image_options.items()))
+    prepared = image.prepared.get(key)
+    if prepared is None:
+        prepared = image.prepared[key] = prepare_image(image, **image_options)
+    return prepared
+
+
+def get_image_options():
+    """Image preprocessing settings from app config"""
+    config = current_app.config
+    return {
+        'max_edge': config['VISION_MAX_EDGE'],
+        'output_format': config['VISION_IMAGE_FORMAT'],
+        'quality': config['VISION_IMAGE_QUALITY'],
+        'detail': config['VISION_DETAIL'],
+        'low_detail_max_edge': config['VISION_LOW_DETAIL_MAX_EDGE'],
+    }
+
+
+def record_image_stats(image):
+    """Log before/after payload size and keep it on g for the response headers"""
+    g.image_stats = image.to_dict()
+    saved = image.original_bytes - image.sent_bytes
+    dimensions = f"{image.width}x{image.height}" if image.width else "not decoded"
+    print(f"🖼️ Image {image.original_bytes:,} → {image.sent_bytes:,} bytes "
+          f"({dimensions}, detail={image.detail}, saved {saved:,})")
+
+
+def normalize_plant_info(result):
+    """Ensure all plant info fields are present with defaults"""
+    return {
+        "plant_name": result.get("plant_name", ""),
+        "scientific_name": result.get("scientific_name", ""),
+        "common_names": result.get("common_names", []),
+        "plant_type": result.get("plant_type", ""),
+        "description": result.get("description", ""),
+        "care_instructions": result.get("care_instructions", "")
+    }